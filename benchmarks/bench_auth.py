@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Latency benchmark of authentication and authorization (`server.AuthService`).
+
+Measures cost of `AuthService.authorize` served from the decision cache and from SQLite, and
+latency of requests to an in-process server with and without the auth middleware. Run from
+the repository root:
+
+    python benchmarks/bench_auth.py
+"""
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from server.AuthService import AuthService  # noqa: E402
+from server.FileService import open_root  # noqa: E402
+from server.WebHandler import WebHandler  # noqa: E402
+
+NUMBER = 100000
+REQUESTS = 2000
+USERS = 1000
+
+
+async def request_latency(directory, auth, token):
+    handler = WebHandler(root=open_root(directory), auth=auth)
+    app = web.Application(middlewares=[handler.auth_middleware] if auth else [])
+    app.add_routes([web.get('/{filename}', handler.get_file_data)])
+    headers = {'Authorization': f'Bearer {token}'}
+    async with TestClient(TestServer(app)) as client:
+        for _ in range(100):
+            await (await client.get('/test.txt', headers=headers)).read()
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            await (await client.get('/test.txt', headers=headers)).read()
+        return (time.perf_counter() - start) / REQUESTS
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'test.txt'), 'wb') as f:
+            f.write(b'12345')
+        auth = AuthService(os.path.join(directory, 'auth.db'))
+        for number in range(USERS):
+            auth.add_user(f'user{number}')
+            auth.grant(f'user{number}', directory, f'dir{number}/')
+        token = auth.add_user('user')
+        auth.grant('user', directory, '', 'write')
+
+        auth.authorize(token, directory, 'test.txt', 'read')
+        cached = timeit.timeit(lambda: auth.cached_decision(token, directory, 'test.txt', 'read'),
+                               number=NUMBER) / NUMBER
+        counter = itertools.count()
+        uncached = timeit.timeit(lambda: auth.authorize(token, directory, f'{next(counter)}.txt', 'read'),
+                                 number=NUMBER // 10) / (NUMBER // 10)
+        print(f'cached decision:   {cached * 1e6:8.2f} us')
+        print(f'database decision: {uncached * 1e6:8.2f} us')
+
+        plain = asyncio.run(request_latency(directory, None, token))
+        with_auth = asyncio.run(request_latency(directory, auth, token))
+        print(f'request without auth: {plain * 1e6:8.1f} us')
+        print(f'request with auth:    {with_auth * 1e6:8.1f} us  ({(with_auth - plain) * 1e6:+.1f} us)')
+        auth.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Throughput benchmark of encryption at rest (`server.CryptoService`).
+
+Measures single-thread (per core) throughput in MB/s of writing a file through the encrypting
+writer, reading it back sequentially and reading random ranges, which decrypt only the blocks
+they touch. Plain reads of the same file are given for comparison. Run from the repository root:
+
+    python benchmarks/bench_encryption.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.CryptoService import FileCipher  # noqa: E402
+from utils.file_utils import read_file_chunk  # noqa: E402
+
+FILE_SIZE = 256 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+RANGE_SIZE = 4096
+RANGES = 20000
+
+
+def measure(name, size, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<28} {size / elapsed / 1e6:8.1f} MB/s')
+
+
+def main():
+    cipher = FileCipher(os.urandom(32))
+    chunk = os.urandom(CHUNK_SIZE)
+    offsets = [random.randrange(FILE_SIZE - RANGE_SIZE) for _ in range(RANGES)]
+    with tempfile.TemporaryDirectory() as directory:
+        encrypted = os.path.join(directory, 'encrypted')
+        plain = os.path.join(directory, 'plain')
+
+        def write_plain():
+            with open(plain, 'wb') as f:
+                for _ in range(FILE_SIZE // CHUNK_SIZE):
+                    f.write(chunk)
+
+        def write_encrypted():
+            with cipher.open_writer(open(encrypted, 'wb')) as f:
+                for _ in range(FILE_SIZE // CHUNK_SIZE):
+                    f.write(chunk)
+
+        def read_file(path, ranges):
+            def read():
+                raw = open(path, 'rb')
+                with cipher.open_reader(raw) or raw as f:
+                    if ranges:
+                        for offset in offsets:
+                            read_file_chunk(f, offset, RANGE_SIZE)
+                    else:
+                        for offset in range(0, FILE_SIZE, CHUNK_SIZE):
+                            read_file_chunk(f, offset, CHUNK_SIZE)
+            return read
+
+        measure('write plain', FILE_SIZE, write_plain)
+        measure('write encrypted', FILE_SIZE, write_encrypted)
+        measure('sequential read plain', FILE_SIZE, read_file(plain, False))
+        measure('sequential read encrypted', FILE_SIZE, read_file(encrypted, False))
+        measure('random 4K read plain', RANGES * RANGE_SIZE, read_file(plain, True))
+        measure('random 4K read encrypted', RANGES * RANGE_SIZE, read_file(encrypted, True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Benchmark of listing queries served by `server.MetadataIndex`.
+
+Fills a catalog with a million synthetic entries of one root and measures typical paginated
+queries: largest files, files modified since a time, a page after a cursor, a name prefix.
+Run from the repository root:
+
+    python benchmarks/bench_metadata_index.py [number_of_files]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.MetadataIndex import MetadataIndex  # noqa: E402
+
+ROOT = '/data'
+REPEAT = 100
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as directory:
+        index = MetadataIndex(os.path.join(directory, 'index.db'))
+        start = time.perf_counter()
+        index.reconcile(ROOT, ((f'file{number:08d}.txt', number * 7919 % 1000003, 0.0, number * 10 ** 9, number,
+                                None, 'text/plain') for number in range(files)))
+        print(f'reconcile of {files} files: {time.perf_counter() - start:.1f} s')
+        queries = {
+            'largest 100 files': dict(sort='size', descending=True, limit=100),
+            'modified since T, 100 files': dict(sort='mtime', modified_since=(files - 1000) * 10 ** 9, limit=100),
+            'page after cursor': dict(sort='size', after=(500000, 'file00000000.txt'), limit=100),
+            'prefix, 100 files': dict(sort='name', prefix='file0050', limit=100),
+        }
+        for name, query in queries.items():
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                index.query(ROOT, **query)
+            print(f'{name:<30} {(time.perf_counter() - start) / REPEAT * 1e3:8.3f} ms')
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Microbenchmark of `utils.file_utils.pathname_is_valid`.
+
+Measures per-call cost for repeated names (served from the memo) and for unique names (full
+lexical check). Run from the repository root:
+
+    python benchmarks/bench_pathname_is_valid.py
+"""
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.file_utils import pathname_is_valid  # noqa: E402
+
+NUMBER = 200000
+NAMES = ['test.txt', os.path.join('dir', 'to', 'go', 'file.txt'), 'x' * 200 + '.bin']
+
+
+def main():
+    for name in NAMES:
+        repeated = timeit.timeit(lambda: pathname_is_valid(name), number=NUMBER) / NUMBER
+        counter = itertools.count()
+        unique = timeit.timeit(lambda: pathname_is_valid(f'{name}.{next(counter)}'), number=NUMBER) / NUMBER
+        print(f'{name[:40]:<42} repeated: {repeated * 1e6:6.2f} us/call   unique: {unique * 1e6:6.2f} us/call')
+
+
+if __name__ == '__main__':
+    main()
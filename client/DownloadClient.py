@@ -0,0 +1,260 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Iterable, List, Optional
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.file_utils import preallocate_file, write_file_chunk
+
+DEFAULT_URL = 'http://127.0.0.1:8080'
+SEGMENT_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+TEMP_SUFFIX = '.part'
+
+
+class DownloadClient:
+    """Client downloading files from the file server over several concurrent connections.
+
+    A file is split into segments, which are requested with Range headers by a pool of threads and
+    written at their positions into a preallocated local file, so a single slow TCP connection
+    doesn't limit throughput. Connections are kept alive in a pool shared by all downloads, and the
+    thread pool is shared too, so downloading many files at once uses at most `connections`
+    connections. A segment, which fails, is requested again from the first byte not received yet.
+    Requests carry the entity tag of the file, so a file modified during download is noticed.
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, connections: int = 4, segment_size: int = SEGMENT_SIZE,
+                 retries: int = 3, timeout: float = 30, token: Optional[str] = None,
+                 session_id: Optional[str] = None):
+        """
+        Args:
+            url (str): Base URL of the server.
+            connections (int): Max number of concurrent connections.
+            segment_size (int): Size of a part of file requested by one request in bytes.
+            retries (int): Number of retries of a failed segment.
+            timeout (float): Timeout of connecting and of waiting for data in seconds.
+            token (str): Access token, if the server requires authentication.
+            session_id (str): Id of the server session returned by /change_dir, which root is used.
+
+        Raises:
+            ValueError: if number of connections or segment size is not positive.
+        """
+        if connections < 1 or segment_size < 1:
+            raise ValueError('Number of connections and segment size must be positive!')
+        self.url = url.rstrip('/')
+        self.connections = connections
+        self.segment_size = segment_size
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        if session_id:
+            self.session.headers['X-Session'] = session_id
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=connections, thread_name_prefix='download')
+
+    def close(self) -> None:
+        """Stop threads and close connections."""
+        self._pool.shutdown()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_file_data(self, filename: str) -> dict:
+        """Get info about file on the server.
+
+        Returns:
+            Dict with info about file (name, size, sha256 etc.) and its entity tag under etag key.
+
+        Raises:
+            RuntimeError: if the server responds with an error.
+        """
+        response = self.session.get(f'{self.url}/{quote(filename)}', params={'verbose': 'false'},
+                                    timeout=self.timeout)
+        data = self._check_json(response, filename)
+        data['etag'] = response.headers.get('ETag')
+        return data
+
+    def download(self, filename: str, path: Optional[str] = None, verify: bool = True) -> dict:
+        """Download file.
+
+        Content is written into a temporary file next to the target one, which is renamed to the
+        target name once the content is complete and verified.
+
+        Args:
+            filename (str): Filename on the server.
+            path (str): Local path, the filename in current directory by default.
+            verify (bool): Compare SHA-256 of the content with the hash known by the server.
+
+        Returns:
+            Dict with keys: name, path, size, sha256 (None if it wasn't computed), verified, seconds.
+
+        Raises:
+            RuntimeError: if the server responds with an error, the file was modified during download
+                or a segment couldn't be downloaded.
+            ValueError: if the content has a different hash.
+        """
+        started = time.monotonic()
+        info = self.get_file_data(filename)
+        size = info['size']
+        path = path or os.path.basename(filename)
+        temp_path = path + TEMP_SUFFIX
+        fd = os.open(temp_path, os.O_CREAT | os.O_TRUNC | os.O_RDWR | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            try:
+                preallocate_file(fd, size)
+                # Segments are written by different threads at their positions, so there is no shared file position.
+                lock = None if hasattr(os, 'pwrite') else threading.Lock()
+                futures = [self._pool.submit(self._download_segment, filename, info['etag'], fd, offset,
+                                             min(self.segment_size, size - offset), lock)
+                           for offset in range(0, size, self.segment_size)]
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    concurrent.futures.wait(futures)
+                    raise
+                sha256 = None
+                expected = info.get('sha256')
+                if verify and expected:
+                    sha256 = self._hash(temp_path)
+                    if sha256 != expected:
+                        raise ValueError(f'SHA-256 of downloaded {filename} is {sha256}, expected {expected}!')
+                elif verify:
+                    logging.warning(f'Hash of {filename} is not known by the server, it is not verified.')
+            finally:
+                os.close(fd)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        seconds = time.monotonic() - started
+        logging.info(f'{filename} ({size} bytes) was downloaded in {seconds:.2f}s.')
+        return {'name': filename, 'path': path, 'size': size, 'sha256': sha256, 'verified': sha256 is not None,
+                'seconds': seconds}
+
+    def download_many(self, filenames: Iterable[str], directory: str = os.curdir, verify: bool = True,
+                      max_files: int = 4) -> List[dict]:
+        """Download many files concurrently, sharing connections between them.
+
+        Args:
+            filenames (Iterable): Filenames on the server.
+            directory (str): Local directory.
+            verify (bool): Compare SHA-256 of the content with the hash known by the server.
+            max_files (int): Max number of files downloaded at once.
+
+        Returns:
+            List of results of `download` in order of filenames, failed downloads have
+            keys name and error instead.
+        """
+        def download(filename: str) -> dict:
+            try:
+                return self.download(filename, os.path.join(directory, os.path.basename(filename)), verify)
+            except (RuntimeError, ValueError, OSError, requests.RequestException) as ex:
+                logging.error(f'Cannot download {filename}: {ex}')
+                return {'name': filename, 'error': str(ex)}
+
+        # Files are waited for by their own threads, segments of all files are downloaded by the shared pool.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_files) as files_pool:
+            return list(files_pool.map(download, filenames))
+
+    def _download_segment(self, filename: str, etag: Optional[str], fd: int, offset: int, size: int,
+                          lock: Optional[threading.Lock]) -> None:
+        end = offset + size
+        attempt = 0
+        while offset < end:
+            headers = {'Range': f'bytes={offset}-{end - 1}'}
+            if etag:
+                headers['If-Range'] = etag
+            try:
+                with self.session.get(f'{self.url}/files/{quote(filename)}/content', headers=headers,
+                                      stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        if response.status_code == 200 and not response.headers.get('Content-Type', '').startswith(
+                                'application/json'):
+                            raise RuntimeError(f'File {filename} was modified during download!')
+                        self._check_json(response, filename)
+                        raise RuntimeError(f'Unexpected response {response.status_code} for {filename}!')
+                    for data in response.iter_content(READ_SIZE):
+                        data = data[:end - offset]
+                        if lock is None:
+                            write_file_chunk(fd, offset, data)
+                        else:
+                            with lock:
+                                write_file_chunk(fd, offset, data)
+                        offset += len(data)
+                if offset < end:
+                    raise requests.ConnectionError(f'Connection was closed at {offset} of {end} bytes.')
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as ex:
+                attempt += 1
+                if attempt > self.retries:
+                    raise RuntimeError(f'Cannot download {filename} at {offset}: {ex}')
+                logging.warning(f'Retrying {filename} from {offset} after error: {ex}')
+                time.sleep(min(0.1 * 2 ** attempt, 5))
+
+    @staticmethod
+    def _check_json(response: requests.Response, filename: str) -> dict:
+        """Get JSON body of response, raise RuntimeError if it has error status."""
+        try:
+            data = response.json()
+        except ValueError:
+            raise RuntimeError(f'Unexpected response {response.status_code} for {filename}!')
+        if response.status_code >= 400 or data.get('status') != 'success':
+            raise RuntimeError(data.get('message') or f'Unexpected response {response.status_code} for {filename}!')
+        return data
+
+    @staticmethod
+    def _hash(path: str) -> str:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(READ_SIZE), b''):
+                hasher.update(data)
+        return hasher.hexdigest()
+
+
+def main():
+    """Download files from command line."""
+    parser = argparse.ArgumentParser(description='Download files from file server over several connections')
+    parser.add_argument('filenames', nargs='+', help='Filenames on the server')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Base URL of the server')
+    parser.add_argument('-o', '--output', default=os.curdir, help='Local directory')
+    parser.add_argument('-c', '--connections', type=int, default=4, help='Max number of concurrent connections')
+    parser.add_argument('-f', '--files', type=int, default=4, help='Max number of files downloaded at once')
+    parser.add_argument('--segment-size', type=int, default=SEGMENT_SIZE, help='Size of a segment in bytes')
+    parser.add_argument('--retries', type=int, default=3, help='Number of retries of a failed segment')
+    parser.add_argument('--token', default=os.environ.get('FS_TOKEN'), help='Access token, FS_TOKEN by default')
+    parser.add_argument('--session-id', help='Id of the server session, which root is used')
+    parser.add_argument('--no-verify', action='store_true', help="Don't check SHA-256 of downloaded files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with DownloadClient(args.url, args.connections, args.segment_size, args.retries, token=args.token,
+                        session_id=args.session_id) as client:
+        results = client.download_many(args.filenames, args.output, not args.no_verify, args.files)
+    for result in results:
+        print(json.dumps(result))
+    sys.exit(1 if any('error' in result for result in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
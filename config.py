@@ -13,12 +13,24 @@ def parse_cli_args():
         directory: path to working directory;
         loglevel: logging level;
         logfile: path to file for logging;
+        io_workers: number of threads for filesystem operations;
+        io_queue: number of filesystem operations allowed to wait for a free thread;
+        metadata_cache: enable in-memory cache of file metadata;
+        content_cache: enable in-memory cache of content of small files;
+        port: web-server port;
+        workers: number of worker processes;
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--directory", type=str, help="Working directory")
     parser.add_argument('-l', '--loglevel',  type=str.upper, default='INFO',
                         choices=logging._nameToLevel.keys(), help="Logging level")
     parser.add_argument('-f', '--logfile',  type=str, help="Logging file")
+    parser.add_argument('--io-workers', type=int, help="Number of threads for filesystem operations")
+    parser.add_argument('--io-queue', type=int, help="Number of filesystem operations waiting for a free thread")
+    parser.add_argument('--metadata-cache', action='store_true', help="Cache file metadata in memory")
+    parser.add_argument('--content-cache', action='store_true', help="Cache content of small files in memory")
+    parser.add_argument('-p', '--port', type=int, help="Web-server port")
+    parser.add_argument('-w', '--workers', type=int, help="Number of worker processes")
     return {k: v for k, v in vars(parser.parse_args()).items() if v}
 
 
@@ -1,33 +1,122 @@
 #!/usr/bin/env python3
+import base64
 import logging
+import os
+import socket
+import sys
 
 from aiohttp import web
 
+import server.FileService as FileService
+from server.AuthService import AuthService
+from server.IOExecutor import IOExecutor
+from server.Supervisor import Supervisor
 from server.WebHandler import WebHandler
 
 from config import config
-from utils.log_utils import create_logs
+from utils.log_utils import create_logs, stop_logs
 
 
-def main():
-    logging.debug('Start working...')
-    logging.debug(f'Ready to listen to port {config.port}.')
-    handler = WebHandler()
-    app = web.Application()
+def create_app(allow_change_dir: bool = True) -> web.Application:
+    """Create aiohttp application with all routes.
+
+    Args:
+        allow_change_dir (bool): Allow clients to change roots of their sessions.
+
+    Returns:
+        Application: aiohttp application.
+    """
+    executor = IOExecutor(max_workers=int(config.io_workers),
+                          max_queue=int(config.io_queue),
+                          queue_timeout=float(config.io_queue_timeout))
+    if config.metadata_cache:
+        FileService.enable_metadata_cache(max_entries=int(config.metadata_cache_size),
+                                          poll_interval=float(config.metadata_cache_poll_interval))
+    if config.content_cache:
+        FileService.enable_content_cache(max_bytes=int(config.content_cache_size),
+                                         max_file_size=int(config.content_cache_max_file_size))
+    if config.metadata_index:
+        FileService.enable_metadata_index(config.metadata_index)
+    if config.search_index:
+        FileService.enable_search_index(config.search_index, max_file_size=int(config.search_max_file_size))
+    if config.encryption_key:
+        FileService.enable_encryption(base64.b64decode(config.encryption_key))
+    FileService.configure_uploads(max_size=int(config.upload_max_size),
+                                  ttl=float(config.upload_ttl) if config.upload_ttl else None)
+    root = FileService.open_root(os.getcwd())
+    roots = {name: FileService.open_root(path) for name, path in config.roots.items()}
+    for index_root in (root, *roots.values()):
+        if config.metadata_index:
+            FileService.reconcile_metadata_index(index_root)
+        if config.search_index:
+            FileService.sync_search_index(index_root)
+        if config.upload_ttl:
+            FileService.cleanup_uploads(float(config.upload_ttl), index_root)
+    auth = None
+    if config.auth_db:
+        auth = AuthService(config.auth_db, cache_size=int(config.auth_cache_size),
+                           cache_ttl=float(config.auth_cache_ttl))
+    handler = WebHandler(chunk_size=int(config.chunk_size), executor=executor,
+                         root=root, roots=roots, allow_change_dir=allow_change_dir,
+                         mmap_threshold=int(config.mmap_threshold or 0), auth=auth)
+    app = web.Application(middlewares=[handler.auth_middleware] if auth else [])
+
+    async def shutdown_executor(app: web.Application) -> None:
+        handler.shutdown()
+        executor.shutdown(wait=False)
+
+    app.on_cleanup.append(shutdown_executor)
     app.add_routes([
         web.get('/', handler.handle),
         web.post('/change_dir/{path:.+}', handler.change_dir),
+        web.get('/stats', handler.get_stats),
         web.get('/files', handler.get_files),
+        web.get('/archive', handler.get_archive),
+        web.get('/search', handler.search),
+        web.get('/files/{filename}/content', handler.get_file_content),
         web.get('/{filename}', handler.get_file_data),
         web.post('/create/{filename}', handler.create_file),
-        web.delete('/delete/{filename}', handler.delete_file,)
+        web.delete('/delete/{filename}', handler.delete_file),
+        web.post('/batch', handler.batch),
+        web.post('/extract', handler.extract_archive),
+        web.post('/index/reconcile', handler.reconcile_index),
+        web.post('/hashes/backfill', handler.backfill_hashes),
+        web.post('/uploads/{filename}', handler.create_upload),
+        web.get('/uploads/{filename}/{upload_id}', handler.get_upload),
+        web.put('/uploads/{filename}/{upload_id}/{index}', handler.put_upload_chunk),
+        web.post('/uploads/{filename}/{upload_id}/commit', handler.commit_upload),
+        web.delete('/uploads/{filename}/{upload_id}', handler.abort_upload),
         # TODO: add more routes
     ])
-    web.run_app(app, port=config.port)
+    return app
+
+
+def serve(sock: socket.socket) -> None:
+    """Serve requests from the listening socket, runs in every worker process."""
+    try:
+        web.run_app(create_app(allow_change_dir=False), sock=sock, shutdown_timeout=float(config.shutdown_timeout),
+                    print=None)
+    finally:
+        # Worker processes exit without running atexit handlers.
+        stop_logs()
+
+
+def main():
+    logging.debug('Start working...')
+    logging.debug(f'Ready to listen to port {config.port}.')
+    workers = int(config.workers or 1)
+    if workers > 1 and sys.platform == 'win32':
+        logging.warning('Several workers are not supported on Windows, starting a single one.')
+        workers = 1
+    if workers > 1:
+        logging.debug(f'Starting {workers} workers.')
+        Supervisor(serve, workers, int(config.port), shutdown_timeout=float(config.shutdown_timeout)).run()
+    else:
+        web.run_app(create_app(), port=config.port, shutdown_timeout=float(config.shutdown_timeout))
 
 
 if __name__ == '__main__':
-    create_logs(config.logfile, config.loglevel)
+    create_logs(config.logfile, config.loglevel, queue_size=int(config.log_queue_size or 0))
     try:
         main()
     except Exception as ex:
@@ -0,0 +1,151 @@
+import abc
+import tarfile
+import time
+import zipfile
+import zlib
+from typing import List
+
+
+class ArchiveWriter(abc.ABC):
+    """Incremental encoder of an archive, which is sent while it is being created.
+
+    Every method returns the next part of the archive as bytes (possibly empty), nothing is kept
+    in memory between calls except small per-file metadata required by the format. Files are
+    added one by one: `start_file`, any number of `write` calls with exactly `size` bytes of
+    content in total, `end_file`. The archive is completed by `close`.
+    """
+
+    content_type = 'application/octet-stream'
+    extension = ''
+
+    @abc.abstractmethod
+    def start_file(self, name: str, size: int, mtime: float) -> bytes:
+        """Start a new file in the archive.
+
+        Args:
+            name (str): Name of the file in the archive.
+            size (int): Size of the file content in bytes.
+            mtime (float): Modification time of the file.
+        """
+
+    @abc.abstractmethod
+    def write(self, data: bytes) -> bytes:
+        """Add a block of content of the current file."""
+
+    @abc.abstractmethod
+    def end_file(self) -> bytes:
+        """Finish the current file."""
+
+    @abc.abstractmethod
+    def close(self) -> bytes:
+        """Finish the archive."""
+
+
+class TarWriter(ArchiveWriter):
+    """Writer of tar archive in POSIX.1-2001 (pax) format, optionally compressed with gzip."""
+
+    content_type = 'application/x-tar'
+    extension = 'tar'
+
+    def __init__(self, compress: bool = False, compress_level: int = 6):
+        """
+        Args:
+            compress (bool): Compress the archive with gzip.
+            compress_level (int): Compression level from 1 (fastest) to 9 (smallest).
+        """
+        self._compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+        self._size = 0
+        if compress:
+            self.content_type = 'application/gzip'
+            self.extension = 'tar.gz'
+
+    def start_file(self, name: str, size: int, mtime: float) -> bytes:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        self._size = size
+        return self._compress(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+    def write(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def end_file(self) -> bytes:
+        # Content is padded to whole blocks.
+        remainder = self._size % tarfile.BLOCKSIZE
+        return self._compress(tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b'')
+
+    def close(self) -> bytes:
+        # End of archive is marked by two empty blocks.
+        data = self._compress(tarfile.NUL * 2 * tarfile.BLOCKSIZE)
+        if self._compressor is not None:
+            data += self._compressor.flush()
+        return data
+
+    def _compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor is not None else data
+
+
+class _Buffer:
+    """Write-only file object collecting data written by `zipfile` until it is taken."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class ZipWriter(ArchiveWriter):
+    """Writer of zip archive with stored (uncompressed) files.
+
+    Sizes and CRC of every file are written after its content (data descriptor), zip64 records
+    are used for large files and archives. Central directory is kept in memory until `close`, it
+    takes about a hundred bytes per file.
+    """
+
+    content_type = 'application/zip'
+    extension = 'zip'
+
+    def __init__(self):
+        self._buffer = _Buffer()
+        # Output isn't seekable, so zipfile writes sizes after content instead of seeking back.
+        self._zip = zipfile.ZipFile(self._buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._file = None
+
+    def start_file(self, name: str, size: int, mtime: float) -> bytes:
+        # Zip dates can't be earlier than 1980.
+        info = zipfile.ZipInfo(name, date_time=max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+        info.file_size = size
+        info.external_attr = 0o644 << 16
+        self._file = self._zip.open(info, 'w')
+        return self._buffer.take()
+
+    def write(self, data: bytes) -> bytes:
+        self._file.write(data)
+        return self._buffer.take()
+
+    def end_file(self) -> bytes:
+        self._file.close()
+        self._file = None
+        return self._buffer.take()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._buffer.take()
+
+
+ARCHIVE_FORMATS = {
+    'tar': lambda: TarWriter(),
+    'tar.gz': lambda: TarWriter(compress=True),
+    'zip': lambda: ZipWriter(),
+}
@@ -0,0 +1,301 @@
+import argparse
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+ACCESS_LEVELS = ('read', 'write')
+ANY_ROOT = '*'
+
+# Result of `cached_decision` for decisions, which aren't cached.
+NOT_CACHED = object()
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    token_hash TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS policies (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    root TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    access TEXT NOT NULL,
+    PRIMARY KEY (user_id, root, prefix)
+);
+'''
+
+
+class DecisionCache:
+    """In-memory LRU cache of authorization decisions with expiration.
+
+    Entries expire `ttl` seconds after they were stored, so changes made by other processes are
+    noticed within `ttl`. Changes made by `AuthService` of this process clear the cache at once.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0):
+        """
+        Args:
+            max_entries (int): Max number of cached decisions, least recently used ones are evicted first.
+            ttl (float): Lifetime of cached decision in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get cached decision or `default` if there is no fresh one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache decision."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached decisions."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Get cache statistics.
+
+        Returns:
+            Dict with keys: entries, max_entries, ttl, hits, misses.
+        """
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class AuthService:
+    """Users and access policies stored in SQLite database.
+
+    User is authenticated by a random token, only its SHA-256 hash is stored. Policy grants user
+    'read' or 'write' (which includes 'read') access to files of a root, whose names start with
+    the given prefix. Root is identified by its directory, '*' means any root. Empty prefix covers
+    the whole root, including operations on the root itself (listing, archives, batches).
+    """
+
+    def __init__(self, db_path: str, cache_size: int = 10000, cache_ttl: float = 60.0):
+        """
+        Args:
+            db_path (str): Path to SQLite database, created if it doesn't exist.
+            cache_size (int): Max number of cached authorization decisions.
+            cache_ttl (float): Lifetime of cached authorization decision in seconds.
+        """
+        self.db_path = db_path
+        self.cache = DecisionCache(max_entries=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        if db_path != ':memory:':
+            # Workers read while users are changed by another process.
+            self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close database connection."""
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def add_user(self, name: str) -> str:
+        """Add user with a new token.
+
+        Args:
+            name (str): User name.
+
+        Returns:
+            Token of the user. It can't be recovered later, only replaced by `reset_token`.
+
+        Raises:
+            RuntimeError: if user already exists.
+        """
+        token = secrets.token_urlsafe(32)
+        try:
+            self._execute('INSERT INTO users (name, token_hash) VALUES (?, ?)', (name, self.hash_token(token)))
+        except sqlite3.IntegrityError:
+            msg = f'User {name} already exists!'
+            logging.error(msg)
+            raise RuntimeError(msg)
+        logging.info(f'User {name} was added.')
+        return token
+
+    def reset_token(self, name: str) -> str:
+        """Replace token of user, the old token stops working.
+
+        Raises:
+            RuntimeError: if there is no such user.
+        """
+        token = secrets.token_urlsafe(32)
+        self._change('UPDATE users SET token_hash = ? WHERE name = ?', (self.hash_token(token), name), name)
+        return token
+
+    def remove_user(self, name: str) -> None:
+        """Remove user and its policies.
+
+        Raises:
+            RuntimeError: if there is no such user.
+        """
+        self._change('DELETE FROM users WHERE name = ?', (name,), name)
+        logging.info(f'User {name} was removed.')
+
+    def grant(self, name: str, root: str, prefix: str = '', access: str = 'read') -> None:
+        """Grant user access to files of root, replacing its previous access to the same prefix.
+
+        Args:
+            name (str): User name.
+            root (str): Root directory or '*' for any root.
+            prefix (str): Prefix of filenames, empty for the whole root.
+            access (str): 'read' or 'write'.
+
+        Raises:
+            RuntimeError: if there is no such user.
+            ValueError: if access level is unknown.
+        """
+        if access not in ACCESS_LEVELS:
+            raise ValueError(f'Unknown access level {access}!')
+        root = root if root == ANY_ROOT else os.path.abspath(root)
+        self._change('INSERT OR REPLACE INTO policies (user_id, root, prefix, access) '
+                     'SELECT id, ?, ?, ? FROM users WHERE name = ?', (root, prefix, access, name), name)
+
+    def revoke(self, name: str, root: str, prefix: str = '') -> None:
+        """Remove policy of user for the prefix of root, other policies of the user are kept.
+
+        Raises:
+            RuntimeError: if there is no such user.
+        """
+        root = root if root == ANY_ROOT else os.path.abspath(root)
+        with self._lock:
+            user = self._db.execute('SELECT id FROM users WHERE name = ?', (name,)).fetchone()
+            if user is not None:
+                self._db.execute('DELETE FROM policies WHERE root = ? AND prefix = ? AND user_id = ?',
+                                 (root, prefix, user[0]))
+                self.cache.clear()
+        if user is None:
+            msg = f'There is no such user {name}!'
+            logging.error(msg)
+            raise RuntimeError(msg)
+
+    def list_users(self) -> List[dict]:
+        """Get all users with their policies."""
+        with self._lock:
+            users = self._db.execute('SELECT id, name FROM users ORDER BY name').fetchall()
+            policies = self._db.execute('SELECT user_id, root, prefix, access FROM policies '
+                                        'ORDER BY root, prefix').fetchall()
+        return [{'name': name,
+                 'policies': [{'root': root, 'prefix': prefix, 'access': access}
+                              for user_id, root, prefix, access in policies if user_id == id_]}
+                for id_, name in users]
+
+    def cached_decision(self, token: str, root: str, filename: str, access: str) -> Any:
+        """Get cached result of `authorize` without querying database, so it can be called from event loop.
+
+        Returns:
+            Cached result of `authorize` or `NOT_CACHED` if it isn't cached.
+        """
+        return self.cache.get((token, root, filename, access), NOT_CACHED)
+
+    def authorize(self, token: str, root: str, filename: str, access: str) -> Optional[bool]:
+        """Check whether the token gives access to the file, using cache of decisions.
+
+        Args:
+            token (str): Token of user.
+            root (str): Root directory.
+            filename (str): Normalized filename relative to the root, empty for operations on the whole root.
+            access (str): 'read' or 'write'.
+
+        Returns:
+            None if there is no user with the token, otherwise whether access is granted.
+        """
+        key = (token, root, filename, access)
+        decision = self.cache.get(key, NOT_CACHED)
+        if decision is not NOT_CACHED:
+            return decision
+        with self._lock:
+            user = self._db.execute('SELECT id FROM users WHERE token_hash = ?', (self.hash_token(token),)).fetchone()
+            policies = [] if user is None else self._db.execute(
+                'SELECT prefix, access FROM policies WHERE user_id = ? AND root IN (?, ?)',
+                (user[0], root, ANY_ROOT)).fetchall()
+        decision = None if user is None else any(
+            filename.startswith(prefix) and (access == 'read' or granted == 'write') for prefix, granted in policies)
+        self.cache.put(key, decision)
+        return decision
+
+    def _execute(self, query: str, params: tuple) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self._db.execute(query, params)
+            self.cache.clear()
+            return cursor
+
+    def _change(self, query: str, params: tuple, name: str) -> None:
+        """Run query changing the user, raise RuntimeError if the user doesn't exist."""
+        if self._execute(query, params).rowcount == 0:
+            msg = f'There is no such user {name}!'
+            logging.error(msg)
+            raise RuntimeError(msg)
+
+
+def main():
+    """Manage users and policies from command line."""
+    parser = argparse.ArgumentParser(description='Manage users of file server')
+    parser.add_argument('database', help='Path to SQLite database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List users and policies')
+    for command in ('add', 'remove', 'reset-token'):
+        commands.add_parser(command, help=f'{command.capitalize()} user').add_argument('name')
+    for command in ('grant', 'revoke'):
+        subparser = commands.add_parser(command, help=f'{command.capitalize()} access to files')
+        subparser.add_argument('name')
+        subparser.add_argument('root', help="Root directory or '*' for any root")
+        subparser.add_argument('prefix', nargs='?', default='', help='Prefix of filenames')
+        if command == 'grant':
+            subparser.add_argument('--access', choices=ACCESS_LEVELS, default='read')
+    args = parser.parse_args()
+    auth = AuthService(args.database)
+    if args.command == 'list':
+        for user in auth.list_users():
+            print(user['name'])
+            for policy in user['policies']:
+                print(f"    {policy['access']:<6} {policy['root']} {policy['prefix']!r}")
+    elif args.command == 'add':
+        print(auth.add_user(args.name))
+    elif args.command == 'reset-token':
+        print(auth.reset_token(args.name))
+    elif args.command == 'remove':
+        auth.remove_user(args.name)
+    elif args.command == 'grant':
+        auth.grant(args.name, args.root, args.prefix, args.access)
+    else:
+        auth.revoke(args.name, args.root, args.prefix)
+    auth.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class ContentCache:
+    """In-memory LRU cache of content of small files.
+
+    Entries are stored by file path and validated by (mtime, size, inode) of the file, so a file
+    replaced or modified since it was cached is a miss. Total memory used by cached content (as
+    reported by `sys.getsizeof`, e.g. decoded text takes up to 4 bytes per character) is limited by
+    `max_bytes`, least recently used entries are evicted first. Files larger than `max_file_size`
+    are never cached.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_file_size: int = 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Max total size in bytes of cached content in memory.
+            max_file_size (int): Max size in bytes of a single cached file.
+        """
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, Tuple[tuple, Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version(stat: os.stat_result) -> tuple:
+        """Build version of file content from its stat result."""
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[Any]:
+        """Get cached content of file.
+
+        Args:
+            path (str): Absolute path to file.
+            stat (os.stat_result): Current stat result of the file.
+
+        Returns:
+            Cached content or None if there is no entry for this version of the file.
+        """
+        version = self.version(stat)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path: str, stat: os.stat_result, content: Any) -> None:
+        """Cache content of file, if the file isn't too large.
+
+        Args:
+            path (str): Absolute path to file.
+            stat (os.stat_result): Stat result of the file taken before its content was read.
+            content: Content of the file.
+        """
+        if stat.st_size > self.max_file_size:
+            return
+        size = sys.getsizeof(content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(path)
+            self._entries[path] = (self.version(stat), content, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, path: str) -> None:
+        """Remove cached content of file.
+
+        Args:
+            path (str): Absolute path to file.
+        """
+        with self._lock:
+            self._pop(path)
+
+    def clear(self) -> None:
+        """Remove all cached content."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Get cache statistics.
+
+        Returns:
+            Dict with keys: entries, size, max_bytes, max_file_size, hits, misses, evictions.
+        """
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+            'max_file_size': self.max_file_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def _pop(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[2]
@@ -0,0 +1,284 @@
+import os
+import secrets
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+from utils.file_utils import read_file_chunk
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:  # pragma: no cover
+    AESGCM = None
+
+MAGIC = b'FSE\x02'
+BLOCK_SIZE = 64 * 1024
+KEY_SIZE = 32
+SALT_SIZE = 16
+TAG_SIZE = 16
+NONCE_SIZE = 12
+# Random nonce precedes and authentication tag follows encrypted content of every block.
+BLOCK_OVERHEAD = NONCE_SIZE + TAG_SIZE
+
+# Header: magic, block size, random salt of the file key.
+_header = struct.Struct(f'>4sI{SALT_SIZE}s')
+HEADER_SIZE = _header.size
+# Position of block and flag of the last block, authenticated with every block.
+_block_position = struct.Struct('>Q?')
+
+
+class FileCipher:
+    """Encryption of stored files in a chunked format with random access.
+
+    File starts with a header followed by blocks of `BLOCK_SIZE` bytes of content, the last one
+    may be shorter (or empty for an empty file). Every block is sealed separately with AES-256-GCM,
+    so any block can be decrypted and authenticated on its own:
+    - key of the file is derived from the master key and random salt from the header (HKDF-SHA256);
+    - nonce is random and stored before the block, so a block written again (e.g. a re-sent chunk
+      of an upload) never reuses a nonce;
+    - header, block number and a flag of the last block are authenticated as associated data, so
+      blocks can't be reordered and the file can't be truncated at a block boundary unnoticed.
+    """
+
+    def __init__(self, key: bytes):
+        """
+        Args:
+            key (bytes): Master key, 32 bytes.
+
+        Raises:
+            RuntimeError: if cryptography package isn't installed.
+            ValueError: if key has wrong size.
+        """
+        if AESGCM is None:
+            raise RuntimeError('Encryption requires cryptography package!')
+        if len(key) != KEY_SIZE:
+            raise ValueError(f'Encryption key must be {KEY_SIZE} bytes long, got {len(key)}!')
+        self._key = key
+
+    @staticmethod
+    def plaintext_size(stored_size: int) -> int:
+        """Get size of content of encrypted file from its size on disk.
+
+        Raises:
+            ValueError: if no file in the format has such size, e.g. the file is truncated.
+        """
+        data_size = stored_size - HEADER_SIZE
+        last_size = data_size % (BLOCK_SIZE + BLOCK_OVERHEAD)
+        # Only an empty file has an empty block, every other block has content, nonce and tag.
+        if data_size < BLOCK_OVERHEAD or 0 < last_size <= BLOCK_OVERHEAD and data_size != BLOCK_OVERHEAD:
+            raise ValueError(f'Encrypted file of size {stored_size} is truncated!')
+        blocks = -(-data_size // (BLOCK_SIZE + BLOCK_OVERHEAD))
+        return data_size - blocks * BLOCK_OVERHEAD
+
+    @staticmethod
+    def stored_size(size: int) -> int:
+        """Get size on disk of encrypted file from size of its content."""
+        return HEADER_SIZE + size + max(-(-size // BLOCK_SIZE), 1) * BLOCK_OVERHEAD
+
+    @staticmethod
+    def is_encrypted(raw: BinaryIO) -> bool:
+        """Check whether file opened for reading starts with the magic of encrypted files."""
+        return read_file_chunk(raw, 0, len(MAGIC)) == MAGIC
+
+    @staticmethod
+    def new_header() -> bytes:
+        """Build header of a new encrypted file with a random salt."""
+        return _header.pack(MAGIC, BLOCK_SIZE, secrets.token_bytes(SALT_SIZE))
+
+    def open_writer(self, raw: BinaryIO) -> 'EncryptingWriter':
+        """Wrap file opened for writing, content written to the wrapper is stored encrypted."""
+        return EncryptingWriter(raw, self)
+
+    def open_block_writer(self, header: bytes, size: int) -> 'BlockEncryptor':
+        """Get encryptor of blocks at any position of a file with the given header and content size."""
+        return BlockEncryptor(self, header, size)
+
+    def open_reader(self, raw: BinaryIO) -> Optional['DecryptingReader']:
+        """Wrap encrypted file opened for reading.
+
+        Returns:
+            Reader of decrypted content or None if the file isn't encrypted.
+
+        Raises:
+            ValueError: if the file is truncated, corrupted or was encrypted with another key.
+        """
+        header = read_file_chunk(raw, 0, HEADER_SIZE)
+        if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            return None
+        _, block_size, _ = _header.unpack(header)
+        if block_size != BLOCK_SIZE:
+            raise ValueError(f'Unsupported block size {block_size} of encrypted file!')
+        return DecryptingReader(raw, self, header)
+
+    def _aead(self, header: bytes) -> 'AESGCM':
+        salt = _header.unpack(header)[2]
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=salt, info=b'FileService block key')
+        return AESGCM(hkdf.derive(self._key))
+
+    @staticmethod
+    def _seal(aead: 'AESGCM', header: bytes, index: int, last: bool, block: bytes) -> bytes:
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        return nonce + aead.encrypt(nonce, block, header + _block_position.pack(index, last))
+
+    @staticmethod
+    def _open(aead: 'AESGCM', header: bytes, index: int, last: bool, sealed: bytes) -> bytes:
+        return aead.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], header + _block_position.pack(index, last))
+
+
+class EncryptingWriter:
+    """Write-only file object encrypting content block by block, the last block is sealed by `close`."""
+
+    def __init__(self, raw: BinaryIO, cipher: FileCipher):
+        self.raw = raw
+        self._header = FileCipher.new_header()
+        self._aead = cipher._aead(self._header)
+        self._buffer = bytearray()
+        self._index = 0
+        self.raw.write(self._header)
+
+    @property
+    def name(self):
+        return self.raw.name
+
+    @property
+    def closed(self) -> bool:
+        return self.raw.closed
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        # A full block is kept until more data arrives, as it may turn out to be the last one.
+        while len(self._buffer) > BLOCK_SIZE:
+            self._seal(bytes(self._buffer[:BLOCK_SIZE]), last=False)
+            del self._buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def close(self) -> None:
+        if self.raw.closed:
+            return
+        try:
+            self._seal(bytes(self._buffer), last=True)
+            self._buffer = bytearray()
+        finally:
+            self.raw.close()
+
+    def fileno(self) -> int:
+        return self.raw.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _seal(self, block: bytes, last: bool) -> None:
+        self.raw.write(FileCipher._seal(self._aead, self._header, self._index, last, block))
+        self._index += 1
+
+
+class BlockEncryptor:
+    """Encryption of content at any position of a file, which size is known in advance.
+
+    Blocks may be encrypted in any order (e.g. by parallel writers) and encrypted again, the result
+    has the same layout as written by `EncryptingWriter`. Content must start at a block boundary
+    and consist of whole blocks, only the last block of the file may be shorter.
+    """
+
+    def __init__(self, cipher: FileCipher, header: bytes, size: int):
+        self.size = size
+        self._header = header
+        self._aead = cipher._aead(header)
+        self._blocks = max(-(-size // BLOCK_SIZE), 1)
+
+    def encrypt_at(self, offset: int, data: bytes) -> Tuple[int, bytes]:
+        """Encrypt content at the given position.
+
+        Returns:
+            Tuple of position in the stored file and encrypted blocks.
+
+        Raises:
+            ValueError: if content isn't aligned to blocks or exceeds the file size.
+        """
+        end = offset + len(data)
+        if offset % BLOCK_SIZE or end > self.size or len(data) % BLOCK_SIZE and end != self.size:
+            raise ValueError(f'Content at {offset} of size {len(data)} is not aligned to encrypted blocks!')
+        first = offset // BLOCK_SIZE
+        sealed = [FileCipher._seal(self._aead, self._header, index, index == self._blocks - 1,
+                                   data[(index - first) * BLOCK_SIZE:(index - first + 1) * BLOCK_SIZE])
+                  for index in range(first, -(-end // BLOCK_SIZE) if self.size else 1)]
+        return HEADER_SIZE + first * (BLOCK_SIZE + BLOCK_OVERHEAD), b''.join(sealed)
+
+
+class DecryptingReader:
+    """Read-only file object decrypting only the blocks, which are read.
+
+    The last block is authenticated on opening, so a truncated file is rejected even if the
+    content is read partially or not at all. `read_at` doesn't change file position, so
+    concurrent readers of one object don't interfere.
+    """
+
+    def __init__(self, raw: BinaryIO, cipher: FileCipher, header: bytes):
+        """
+        Raises:
+            ValueError: if the file is truncated, corrupted or was encrypted with another key.
+        """
+        self.raw = raw
+        self._header = header
+        self._aead = cipher._aead(header)
+        stored_size = os.fstat(raw.fileno()).st_size
+        self.size = cipher.plaintext_size(stored_size)
+        self._blocks = max(-(-self.size // BLOCK_SIZE), 1)
+        self._position = 0
+        self._open_block(self._blocks - 1)
+
+    @property
+    def name(self):
+        return self.raw.name
+
+    @property
+    def closed(self) -> bool:
+        return self.raw.closed
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read a block of content at the given position.
+
+        Raises:
+            ValueError: if the file is corrupted or was encrypted with another key.
+        """
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b''
+        parts = []
+        for index in range(offset // BLOCK_SIZE, (end - 1) // BLOCK_SIZE + 1):
+            block = self._open_block(index)
+            block_start = index * BLOCK_SIZE
+            parts.append(block[max(offset - block_start, 0):end - block_start])
+        return b''.join(parts)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._position
+        data = self.read_at(self._position, size)
+        self._position += len(data)
+        return data
+
+    def close(self) -> None:
+        self.raw.close()
+
+    def fileno(self) -> int:
+        return self.raw.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open_block(self, index: int) -> bytes:
+        stride = BLOCK_SIZE + BLOCK_OVERHEAD
+        sealed = read_file_chunk(self.raw, HEADER_SIZE + index * stride, stride)
+        try:
+            return FileCipher._open(self._aead, self._header, index, index == self._blocks - 1, sealed)
+        except InvalidTag:
+            raise ValueError(f'Encrypted file {self.name} is corrupted or was encrypted with another key!')
@@ -1,9 +1,68 @@
+import base64
+import bisect
+import fnmatch
+import functools
+import heapq
+import json
 import os
+import secrets
+import shutil
+import stat as stat_module
+import tarfile
+import tempfile
+import threading
 import time
 import logging
-from typing import Union
+import weakref
+import zipfile
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple, Union
 
-from utils.file_utils import get_file_content, get_file_creation_time, pathname_is_valid
+from server.ContentCache import ContentCache
+from server.CryptoService import FileCipher
+from server.HashService import HashingWriter, backfill, load_hashes, store_hashes
+from server.MetadataCache import RACY_WINDOW_NS, MetadataCache
+from server.MetadataIndex import IndexEntry, MetadataIndex
+from server.Root import Root
+from server.SearchIndex import SearchIndex
+from server.UploadService import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_SIZE, ChunkWriter, UploadSession
+from utils.file_utils import decode_content, get_stat_creation_time, pathname_is_valid
+
+CHUNK_SIZE = 64 * 1024
+TEMP_SUFFIX = '.part'
+
+SORT_KEYS = {
+    'name': lambda name, stat, root: (name,),
+    'size': lambda name, stat, root: (_content_size(name, stat, root), name),
+    'mtime': lambda name, stat, root: (stat.st_mtime_ns, name),
+}
+_SORT_KEY_TYPES = {'name': (str,), 'size': (int, str), 'mtime': (int, str)}
+
+# Root bound to current directory of the process, used when no root is given.
+CWD = Root()
+
+_roots = weakref.WeakValueDictionary()
+_roots_lock = threading.Lock()
+_metadata_cache_options: Optional[dict] = None
+_content_cache: Optional[ContentCache] = None
+_metadata_index: Optional[MetadataIndex] = None
+_index_lock = threading.Lock()
+_search_index: Optional[SearchIndex] = None
+_search_max_file_size = 10 * 1024 * 1024
+_cipher: Optional[FileCipher] = None
+# LRU caches by versions of files: whether files are encrypted by (device, inode, mtime, size) and
+# their stored hashes by (device, inode, mtime, ctime, size), as storing hashes changes ctime. So headers
+# and extended attributes are read once per version of file.
+_encrypted_files: 'OrderedDict[tuple, bool]' = OrderedDict()
+_stored_hashes: 'OrderedDict[tuple, dict]' = OrderedDict()
+_file_versions_lock = threading.Lock()
+_file_versions_max = 100000
+_upload_max_size = DEFAULT_MAX_SIZE
+_upload_ttl: Optional[float] = None
+# Time of the last removal of expired uploads by root directory.
+_uploads_cleaned: Dict[str, float] = {}
+_uploads_lock = threading.Lock()
+UPLOAD_CLEANUP_INTERVAL = 60.0
 
 
 def change_dir(path: str, autocreate: bool = True) -> None:
@@ -34,11 +93,597 @@ def change_dir(path: str, autocreate: bool = True) -> None:
             msg = f'There is no such directory "{path}" and autocreate parameter is False.'
             logging.error(msg)
             raise RuntimeError(msg)
+    if CWD.metadata_cache is not None:
+        # Cache of the previous directory, a new one is created on first use.
+        CWD.metadata_cache.stop()
+        CWD.metadata_cache = None
+    if _metadata_index is not None:
+        # Files could be changed by other programs while the directory wasn't current.
+        _metadata_index.forget(CWD.directory)
+    if _search_index is not None:
+        _search_index.forget(CWD)
+
+
+def open_root(path: str, autocreate: bool = True) -> Root:
+    """Get root for working directory without changing current directory of app.
+
+    Roots are shared: while a root is in use, the same object (and the same open directory
+    descriptor and metadata cache) is returned for its path.
+
+    Args:
+        path (str): Path to working directory with files.
+        autocreate (bool): Create folder if it doesn't exist.
+
+    Returns:
+        Root, which can be passed to other functions of the module.
+
+    Raises:
+        RuntimeError: if directory does not exist and autocreate is False or path isn't a directory.
+        ValueError: if path is invalid.
+    """
+    if not pathname_is_valid(path):
+        msg = f'Invalid directory name: {path}!'
+        logging.error(msg)
+        raise ValueError(msg)
+    path = os.path.abspath(path)
+    with _roots_lock:
+        root = _roots.get(path)
+        if root is not None:
+            return root
+        try:
+            root = Root(path)
+        except FileNotFoundError:
+            if not autocreate:
+                msg = f'There is no such directory "{path}" and autocreate parameter is False.'
+                logging.error(msg)
+                raise RuntimeError(msg)
+            logging.debug(f'Creating dir: {path}.')
+            os.makedirs(path, exist_ok=True)
+            root = Root(path)
+        except NotADirectoryError:
+            msg = f'The given path "{path}" is not a directory!'
+            logging.error(msg)
+            raise RuntimeError(msg)
+        logging.debug(f'Opened root {path}.')
+        _roots[path] = root
+        return root
+
+
+def enable_metadata_cache(max_entries: int = 100000, poll_interval: float = 1.0, use_inotify: bool = True) -> None:
+    """Enable in-memory cache of file metadata.
+
+    Every root gets its own cache on first use. The cache of current directory of app is recreated
+    by `change_dir`, so current directory must not be changed by other means while the cache is
+    enabled.
+
+    Args:
+        max_entries (int): Max number of files kept in the cache of a single root.
+        poll_interval (float): Interval in seconds between directory checks when inotify isn't available.
+        use_inotify (bool): Use inotify if it is available, otherwise always poll.
+    """
+    global _metadata_cache_options
+    _metadata_cache_options = {'max_entries': max_entries, 'poll_interval': poll_interval, 'use_inotify': use_inotify}
+
+
+def disable_metadata_cache() -> None:
+    """Disable in-memory cache of file metadata."""
+    global _metadata_cache_options
+    _metadata_cache_options = None
+    with _roots_lock:
+        for root in [CWD, *_roots.values()]:
+            if root.metadata_cache is not None:
+                root.metadata_cache.stop()
+                root.metadata_cache = None
+
+
+def get_metadata_cache_stats(root: Optional[Root] = None) -> Optional[dict]:
+    """Get statistics of metadata cache.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with cache statistics (see `MetadataCache.stats`) or None if there is no cache.
+    """
+    cache = (root or CWD).metadata_cache
+    return cache.stats() if cache is not None else None
+
+
+def enable_metadata_index(db_path: str) -> None:
+    """Enable catalog of file metadata in SQLite database, which serves listings of files.
+
+    Every root is reconciled with the disk on first use, then the catalog is updated by the app.
+    Changes made by other programs are noticed by `reconcile_metadata_index` only.
+
+    Args:
+        db_path (str): Path to SQLite database, created if it doesn't exist.
+    """
+    global _metadata_index
+    _metadata_index = MetadataIndex(db_path)
+
+
+def disable_metadata_index() -> None:
+    """Disable catalog of file metadata."""
+    global _metadata_index
+    index, _metadata_index = _metadata_index, None
+    if index is not None:
+        index.close()
+
+
+def reconcile_metadata_index(root: Optional[Root] = None) -> dict:
+    """Bring entries of working directory in the catalog of file metadata in line with the disk.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with numbers of files: added, updated, removed, total.
+
+    Raises:
+        RuntimeError: if metadata index is disabled.
+    """
+    index = _metadata_index
+    if index is None:
+        msg = 'Metadata index is disabled!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    root = root or CWD
+    with _index_lock:
+        return index.reconcile(root.directory, _index_entries(root))
+
+
+def get_metadata_index_stats(root: Optional[Root] = None) -> Optional[dict]:
+    """Get statistics of metadata index.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with index statistics (see `MetadataIndex.stats`) or None if there is no index.
+    """
+    index = _metadata_index
+    return index.stats((root or CWD).directory) if index is not None else None
+
+
+def _get_index(root: Root) -> Optional[MetadataIndex]:
+    """Get metadata index if it is enabled, reconciling the root on its first use."""
+    index = _metadata_index
+    if index is None:
+        return None
+    if not index.is_reconciled(root.directory):
+        with _index_lock:
+            if not index.is_reconciled(root.directory):
+                index.reconcile(root.directory, _index_entries(root))
+    return index
+
+
+def _index_for(filename: str, root: Root) -> Optional[MetadataIndex]:
+    """Get metadata index if it is enabled and covers the given filename."""
+    if _metadata_index is not None and os.path.basename(filename) == filename:
+        return _metadata_index
+    return None
+
+
+def _index_entry(name: str, stat: os.stat_result, root: Root, hashes: Optional[dict] = None) -> tuple:
+    """Build entry of metadata index from stat result of file and its content hashes, if they are known."""
+    hashes = hashes or {}
+    return (name, _content_size(name, stat, root), get_stat_creation_time(stat), stat.st_mtime_ns, stat.st_ino,
+            hashes.get('sha256'), hashes.get('xxh3_64'), MetadataIndex.guess_mime_type(name))
+
+
+def _index_entries(root: Root) -> Iterator[tuple]:
+    """Iterate over entries of metadata index of all files in working directory."""
+    for name, stat in _scan_dir(root):
+        yield _index_entry(name, stat, root, load_hashes(os.path.join(root.directory, name), stat))
+
+
+def _index_info(entry: IndexEntry) -> dict:
+    """Build dict with info about file from its entry of metadata index, same as `_file_info`."""
+    return {
+        'name': entry.name,
+        'create_date': time.ctime(entry[2]),
+        'edit_date': time.ctime(entry.mtime_ns / 10 ** 9),
+        'size': entry.size,
+        'sha256': entry[5],
+        'xxh3_64': entry[6],
+    }
+
+
+def backfill_hashes(root: Optional[Root] = None, workers: Optional[int] = None) -> dict:
+    """Compute content hashes of files in working directory, which don't have them yet.
+
+    Files are read by a pool of worker processes, so hashing isn't limited by a single CPU. Hashes
+    are stored with files (and in metadata index, if it is enabled) only if the file wasn't modified
+    while it was read; files created by the app already have their hashes computed during upload.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+        workers (int): Number of worker processes, number of CPUs by default and at most.
+
+    Returns:
+        Dict with numbers of files: hashed, failed (couldn't be read or hashes couldn't be stored),
+        skipped (modified while they were read), total (files without hashes).
+
+    Raises:
+        ValueError: if number of workers is invalid.
+    """
+    if workers is not None and workers < 1:
+        raise ValueError(f'Invalid number of workers {workers}, it must be positive!')
+    root = root or CWD
+    stats = {'hashed': 0, 'failed': 0, 'skipped': 0, 'total': 0}
+
+    def unhashed() -> Iterator[str]:
+        for name, stat in _scan_dir(root):
+            path = os.path.join(root.directory, name)
+            if stat_module.S_ISREG(stat.st_mode) and load_hashes(path, stat) is None:
+                stats['total'] += 1
+                yield path
+
+    for path, hashes, stat in backfill(unhashed(), workers, _cipher):
+        if hashes is None:
+            # Stat result is known only if the file was read, but modified meanwhile.
+            stats['failed' if stat is None else 'skipped'] += 1
+            continue
+        name = os.path.basename(path)
+        try:
+            current = root.stat(name)
+        except FileNotFoundError:
+            current = None
+        if current is None or (current.st_ino, current.st_size, current.st_mtime_ns) != \
+                (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+            stats['skipped'] += 1
+            continue
+        if not store_hashes(path, hashes, stat):
+            stats['failed'] += 1
+            continue
+        stats['hashed'] += 1
+        cache = _cache_for(name, root)
+        if cache:
+            # Polling doesn't notice changes of extended attributes, but ctime of the file is changed.
+            cache.refresh(name)
+        index = _metadata_index
+        if index is not None and index.is_reconciled(root.directory):
+            index.put(root.directory, _index_entry(name, stat, root, hashes))
+    logging.info(f'Hashes of files in {root.directory} were computed: {stats}.')
+    return stats
+
+
+def enable_search_index(db_path: str, max_file_size: int = 10 * 1024 * 1024) -> None:
+    """Enable full-text index of text files, which is used by `search_files`.
+
+    The index is updated by a background thread: after files are created or deleted by the app,
+    after changes noticed by metadata cache (if it is enabled) and for the whole root on its first
+    search in this process.
+
+    Args:
+        db_path (str): Path to SQLite database, created if it doesn't exist.
+        max_file_size (int): Max size in bytes of indexed file, larger files aren't searched.
+    """
+    global _search_index, _search_max_file_size
+    disable_search_index()
+    _search_max_file_size = max_file_size
+    _search_index = SearchIndex(db_path, _search_document, _search_versions, lambda root: root.directory)
+
+
+def disable_search_index() -> None:
+    """Disable full-text index, stopping its background thread."""
+    global _search_index
+    index, _search_index = _search_index, None
+    if index is not None:
+        index.stop()
+
+
+def get_search_index_stats() -> Optional[dict]:
+    """Get statistics of full-text index.
+
+    Returns:
+        Dict with index statistics (see `SearchIndex.stats`) or None if there is no index.
+    """
+    index = _search_index
+    return index.stats() if index is not None else None
+
+
+def search_files(query: str, limit: int = 20, root: Optional[Root] = None) -> dict:
+    """Find text files in working directory containing all words of the query.
+
+    Args:
+        query (str): Words to search for.
+        limit (int): Max number of results.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with keys:
+        - results (list): dicts with name, snippet and score (lower is better), the most relevant first.
+        - pending (int): number of changes not indexed yet, results may be incomplete if it isn't 0.
+
+    Raises:
+        RuntimeError: if full-text index is disabled.
+        ValueError: if query is empty or limit isn't positive.
+    """
+    index = _search_index
+    if index is None:
+        msg = 'Full-text search is disabled!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    if limit < 1:
+        raise ValueError(f'Invalid limit {limit}, it must be positive!')
+    root = root or CWD
+    # Watcher of metadata cache reports changes made by other programs.
+    _get_cache(root)
+    root = _search_root(root)
+    index.ensure_synced(root)
+    return {'results': index.search(root, query, limit), 'pending': index.pending()}
 
 
-def get_files() -> list:
+def sync_search_index(root: Optional[Root] = None) -> None:
+    """Queue comparison of working directory with full-text index, e.g. after it was changed by other programs.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
+    Raises:
+        RuntimeError: if full-text index is disabled.
+    """
+    index = _search_index
+    if index is None:
+        msg = 'Full-text search is disabled!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    root = _search_root(root or CWD)
+    index.forget(root)
+    index.ensure_synced(root)
+
+
+def _search_root(root: Root) -> Root:
+    """Get root bound to the directory, so queued changes of current directory don't follow `change_dir`."""
+    return open_root(root.directory, autocreate=False) if root is CWD else root
+
+
+def _schedule_search(filename: str, root: Root) -> None:
+    """Queue update of full-text index for the file, if the index is enabled and covers the filename."""
+    index = _search_index
+    if index is not None and os.path.basename(filename) == filename:
+        index.schedule(_search_root(root), filename)
+
+
+def _search_version(stat: os.stat_result) -> str:
+    return f'{stat.st_mtime_ns}:{stat.st_size}:{stat.st_ino}'
+
+
+def _search_versions(root: Root) -> Iterator[Tuple[str, str]]:
+    """List names and versions of files for full-text index."""
+    for name, stat in _scan_dir(root):
+        if stat_module.S_ISREG(stat.st_mode):
+            yield name, _search_version(stat)
+
+
+def _search_document(root: Root, name: str, indexed_version: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+    """Read version and text of file for full-text index, see `SearchIndex` for the result."""
+    try:
+        f = _open_for_reading(name, root)
+    except OSError:
+        return None
+    except ValueError as ex:
+        logging.warning(f'File {name} is not indexed: {ex}')
+        return None
+    with f:
+        stat = os.fstat(f.fileno())
+        if not stat_module.S_ISREG(stat.st_mode):
+            return None
+        if _search_version(stat) == indexed_version:
+            return indexed_version, None
+        if getattr(f, 'size', stat.st_size) > _search_max_file_size:
+            return _search_version(stat), ''
+        try:
+            data = f.read()
+        except ValueError as ex:
+            # Corrupted encrypted file, it is read again only after it is changed.
+            logging.warning(f'File {name} is not indexed: {ex}')
+            return _search_version(stat), ''
+    # Files with NUL bytes at the start are considered binary, same as by grep.
+    if b'\0' in data[:8192]:
+        return _search_version(stat), ''
+    return _search_version(stat), data.decode(errors='replace')
+
+
+def enable_content_cache(max_bytes: int = 64 * 1024 * 1024, max_file_size: int = 1024 * 1024) -> None:
+    """Enable in-memory LRU cache of content of small files returned by `get_file_data`.
+
+    Args:
+        max_bytes (int): Max total size in bytes of cached content in memory.
+        max_file_size (int): Max size in bytes of a single cached file, larger files are always read from disk.
+    """
+    global _content_cache
+    _content_cache = ContentCache(max_bytes=max_bytes, max_file_size=max_file_size)
+
+
+def disable_content_cache() -> None:
+    """Disable in-memory cache of file content."""
+    global _content_cache
+    _content_cache = None
+
+
+def get_content_cache_stats() -> Optional[dict]:
+    """Get statistics of content cache.
+
+    Returns:
+        Dict with cache statistics (see `ContentCache.stats`) or None if there is no cache.
+    """
+    cache = _content_cache
+    return cache.stats() if cache is not None else None
+
+
+def enable_encryption(key: bytes) -> None:
+    """Enable encryption of content of created files, see `FileCipher` for the format.
+
+    Files are decrypted transparently on reading, files without encryption header are read as is.
+    Listings detect the header of every file to report size of its content, the result is cached
+    per version of the file.
+
+    Args:
+        key (bytes): Master key, 32 bytes.
+
+    Raises:
+        RuntimeError: if cryptography package isn't installed.
+        ValueError: if key has wrong size.
+    """
+    global _cipher
+    _cipher = FileCipher(key)
+    if _content_cache is not None:
+        _content_cache.clear()
+
+
+def disable_encryption() -> None:
+    """Disable encryption, files are created and read as is."""
+    global _cipher
+    _cipher = None
+    if _content_cache is not None:
+        _content_cache.clear()
+
+
+def _content_size(filename: str, stat: os.stat_result, root: Root) -> int:
+    """Get size of file content from its stat result, encrypted file is checked by its header."""
+    cipher = _cipher
+    if cipher is None or not _is_encrypted(filename, stat, root):
+        return stat.st_size
+    try:
+        return cipher.plaintext_size(stat.st_size)
+    except ValueError:
+        # Truncated file can't be read anyway, its size on disk is listed.
+        return stat.st_size
+
+
+def _is_encrypted(filename: str, stat: os.stat_result, root: Root) -> bool:
+    """Check whether file starts with encryption header, the result is cached per version of the file."""
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    encrypted = _get_by_version(_encrypted_files, key)
+    if encrypted is not None:
+        return encrypted
+    try:
+        with open(filename, 'rb', opener=root.opener) as f:
+            encrypted = FileCipher.is_encrypted(f)
+            opened = os.fstat(f.fileno())
+    except OSError:
+        return False
+    # Recently modified file can be changed again without changing its mtime.
+    if ((opened.st_dev, opened.st_ino, opened.st_mtime_ns, opened.st_size) == key
+            and time.time_ns() - stat.st_mtime_ns >= RACY_WINDOW_NS):
+        _put_by_version(_encrypted_files, key, encrypted)
+    return encrypted
+
+
+def _get_by_version(cache: OrderedDict, key: tuple):
+    """Get value cached for version of file, None if it isn't cached."""
+    with _file_versions_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _put_by_version(cache: OrderedDict, key: tuple, value) -> None:
+    """Cache value for version of file, evicting the least recently used ones."""
+    with _file_versions_lock:
+        cache[key] = value
+        while len(cache) > _file_versions_max:
+            cache.popitem(last=False)
+
+
+def _open_for_reading(filename: str, root: Root) -> BinaryIO:
+    """Open file for reading in binary mode, encrypted file is wrapped into decrypting reader."""
+    f = open(filename, 'rb', opener=root.opener)
+    cipher = _cipher
+    if cipher is None:
+        return f
+    try:
+        reader = cipher.open_reader(f)
+    except BaseException:
+        f.close()
+        raise
+    return reader if reader is not None else f
+
+
+def _invalidate_content(filename: str, root: Root) -> None:
+    """Drop cached content of file, if content cache is enabled."""
+    cache = _content_cache
+    if cache is not None:
+        cache.invalidate(os.path.join(root.directory, filename))
+
+
+def _read_content(filename: str, stat: os.stat_result, root: Root) -> str:
+    """Read decoded content of file, using content cache if it is enabled.
+
+    Args:
+        filename (str): Filename.
+        stat (os.stat_result): Stat result of the file, used to validate cached content.
+        root (Root): Working directory.
+    """
+    cache = _content_cache
+    if cache is None:
+        with _open_for_reading(filename, root) as f:
+            return decode_content(f.read())
+    path = os.path.join(root.directory, filename)
+    content = cache.get(path, stat)
+    if content is None:
+        with _open_for_reading(filename, root) as f:
+            # Version of the content actually read, the file could be replaced since `stat`.
+            stat = os.fstat(f.fileno())
+            content = decode_content(f.read())
+        cache.put(path, stat, content)
+    return content
+
+
+def _get_cache(root: Root) -> Optional[MetadataCache]:
+    """Get metadata cache of the root, creating it if the cache is enabled."""
+    if _metadata_cache_options is None:
+        return None
+    if root.metadata_cache is None:
+        with _roots_lock:
+            if root.metadata_cache is None:
+                cache = MetadataCache(root.directory, name_filter=lambda name: not _is_temp_file(name),
+                                      listener=lambda name: _on_external_change(name, root), **_metadata_cache_options)
+                cache.start()
+                root.metadata_cache = cache
+    return root.metadata_cache
+
+
+def _on_external_change(filename: Optional[str], root: Root) -> None:
+    """Apply change noticed by metadata cache to full-text index, None means the whole directory."""
+    index = _search_index
+    if index is not None:
+        if filename is None:
+            index.schedule(_search_root(root))
+        else:
+            _schedule_search(filename, root)
+
+
+def _cache_for(filename: str, root: Root) -> Optional[MetadataCache]:
+    """Get metadata cache if it is enabled and covers the given filename."""
+    if os.path.basename(filename) == filename:
+        return _get_cache(root)
+    return None
+
+
+def _validate_filename(filename: str, root: Root) -> None:
+    """Check filename is valid and, for a root with path, that it is a plain name inside the root.
+
+    Raises:
+        ValueError: if filename is invalid.
+    """
+    if not pathname_is_valid(filename) or root.path is not None and (
+            filename in (os.curdir, os.pardir) or os.path.basename(filename) != filename
+            or os.altsep is not None and os.altsep in filename):
+        msg = f'Invalid file name {filename}!'
+        logging.error(msg)
+        raise ValueError(msg)
+
+
+def get_files(root: Optional[Root] = None) -> list:
     """Get info about all files in working directory.
 
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
     Returns:
         List of dicts, which contains info about each file. Keys:
         - name (str): filename
@@ -46,17 +691,302 @@ def get_files() -> list:
         - edit_date (datetime): date of last file modification.
         - size (int): size of file in bytes.
     """
+    return list(iter_files(root))
+
+
+def iter_files(root: Optional[Root] = None, prefix: Optional[str] = None, pattern: Optional[str] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               modified_since: Optional[float] = None) -> Iterator[dict]:
+    """Iterate over info about files in working directory in a single pass.
+
+    Uses `os.scandir`, so names returned by OS aren't validated again and every entry costs at most
+    one `stat` call (none on Windows, where it is cached in directory entry) and, for a version of the
+    file listed for the first time, reading of its stored hashes. Entries removed while
+    the directory is being scanned are skipped. When metadata index is enabled, files are read from
+    it in order of names; otherwise when metadata cache is enabled, its snapshot is used. Info dicts
+    are built lazily, so memory usage doesn't depend on number of files.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+        prefix (str): Return only files with names starting with the prefix.
+        pattern (str): Return only files with names matching the glob pattern.
+        min_size (int): Return only files not smaller than the size in bytes.
+        max_size (int): Return only files not larger than the size in bytes.
+        modified_since (float): Return only files modified at the time (seconds since epoch) or later.
+
+    Yields:
+        Dict with info about file, same as `get_files` items.
+    """
+    root = root or CWD
+    index = _get_index(root)
+    if index is not None:
+        for entry in index.iter_entries(root.directory, prefix=prefix, min_size=min_size, max_size=max_size,
+                                        modified_since=_time_ns(modified_since)):
+            if pattern is None or fnmatch.fnmatchcase(entry.name, pattern):
+                yield _index_info(entry)
+        return
+    matches = _file_filter(root, prefix, pattern, min_size, max_size, modified_since)
+    cache = _get_cache(root)
+    entries = cache.entries() if cache is not None else None
+    for name, stat in entries if entries is not None else _scan_dir(root):
+        if matches(name, stat):
+            yield _file_info(name, stat, root)
+
+
+def _scan_dir(root: Root) -> Iterator[Tuple[str, os.stat_result]]:
+    """Iterate over names and stat results of files in working directory."""
     logging.debug('Checking files in work directory')
-    files = os.listdir()
-    return [get_file_data(file) for file in files]
+    with root.scandir() as entries:
+        for entry in entries:
+            if _is_temp_file(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield entry.name, stat
+
+
+def get_files_page(limit: int = 100, cursor: Optional[str] = None, sort: str = 'name', prefix: Optional[str] = None,
+                   pattern: Optional[str] = None, min_size: Optional[int] = None,
+                   max_size: Optional[int] = None, modified_since: Optional[float] = None,
+                   root: Optional[Root] = None) -> dict:
+    """Get info about a page of files in working directory.
+
+    Continuation cursor holds sort key of the last file on the page, so the next page starts right
+    after it even if other files were added or removed in the meantime. When metadata index is
+    enabled, the page is found by a range scan of its database index; when metadata cache is
+    enabled, by binary search in its sorted index; otherwise the directory is scanned keeping only
+    `limit` best entries in memory.
+
+    Args:
+        limit (int): Max number of files on the page.
+        cursor (str): Cursor returned with the previous page.
+        sort (str): Sort order: 'name', 'size' or 'mtime'; prefix '-' means descending order.
+        prefix (str): Return only files with names starting with the prefix.
+        pattern (str): Return only files with names matching the glob pattern.
+        min_size (int): Return only files not smaller than the size in bytes.
+        max_size (int): Return only files not larger than the size in bytes.
+        modified_since (float): Return only files modified at the time (seconds since epoch) or later.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with keys:
+        - files (list): info about files, same as `get_files` items.
+        - cursor (str): cursor of the next page or None if this page is the last one.
+
+    Raises:
+        ValueError: if sort order, limit or cursor is invalid.
+    """
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name not in SORT_KEYS:
+        raise ValueError(f'Invalid sort order {sort}, expected one of: {", ".join(SORT_KEYS)}!')
+    if limit < 1:
+        raise ValueError(f'Invalid limit {limit}, it must be positive!')
+    sort_key = functools.partial(SORT_KEYS[sort_name], root=root or CWD)
+    after = _decode_cursor(cursor, sort) if cursor else None
+
+    root = root or CWD
+    index = _get_index(root)
+    if index is not None:
+        return _get_index_page(index, root, limit, after, sort, prefix, pattern, min_size, max_size, modified_since)
+    matches = _file_filter(root, prefix, pattern, min_size, max_size, modified_since)
+    cache = _get_cache(root)
+    index = cache.sorted_index(sort_name, sort_key) if cache is not None else None
+    if index is not None:
+        if descending:
+            position = bisect.bisect_left(index, (after,)) if after is not None else len(index)
+            candidates = (index[i] for i in range(position - 1, -1, -1))
+        else:
+            position = bisect.bisect_right(index, (after, chr(0x10ffff))) if after is not None else 0
+            if sort_name == 'name' and prefix is not None:
+                position = max(position, bisect.bisect_left(index, ((prefix,),)))
+            candidates = (index[i] for i in range(position, len(index)))
+        page = []
+        for key, name, stat in candidates:
+            if sort_name == 'name' and prefix is not None and not descending and not name.startswith(prefix):
+                # Names with the prefix are contiguous in the index and all of them are passed.
+                break
+            if matches(name, stat):
+                page.append((key, name, stat))
+                if len(page) > limit:
+                    break
+    else:
+        candidates = ((sort_key(name, stat), name, stat) for name, stat in _scan_dir(root) if matches(name, stat))
+        if after is not None:
+            candidates = (item for item in candidates if (item[0] < after if descending else item[0] > after))
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        page = pick(limit + 1, candidates, key=lambda item: item[0])
+    next_cursor = _encode_cursor(page[limit - 1][0], sort) if len(page) > limit else None
+    return {
+        'files': [_file_info(name, stat, root) for _, name, stat in page[:limit]],
+        'cursor': next_cursor,
+    }
+
+
+def _get_index_page(index: MetadataIndex, root: Root, limit: int, after: Optional[tuple], sort: str,
+                    prefix: Optional[str], pattern: Optional[str], min_size: Optional[int], max_size: Optional[int],
+                    modified_since: Optional[float]) -> dict:
+    """Get page of files from metadata index, arguments are the same as of `get_files_page`."""
+    sort_name = sort.lstrip('-')
+    page = []
+    while len(page) <= limit:
+        # Glob pattern can't be checked by the database, so entries are read until the page is full.
+        batch_size = limit + 1 if pattern is None else max(limit + 1, 1000)
+        batch = index.query(root.directory, sort_name, sort.startswith('-'), after, batch_size, prefix, min_size,
+                            max_size, _time_ns(modified_since))
+        page.extend(entry for entry in batch if pattern is None or fnmatch.fnmatchcase(entry.name, pattern))
+        if len(batch) < batch_size:
+            break
+        after = batch[-1].sort_key(sort_name)
+    next_cursor = _encode_cursor(page[limit - 1].sort_key(sort_name), sort) if len(page) > limit else None
+    return {
+        'files': [_index_info(entry) for entry in page[:limit]],
+        'cursor': next_cursor,
+    }
+
+
+def _time_ns(timestamp: Optional[float]) -> Optional[int]:
+    """Convert time in seconds since epoch to nanoseconds, keeping None."""
+    return round(timestamp * 10 ** 9) if timestamp is not None else None
+
+
+def _file_filter(root: Root, prefix: Optional[str] = None, pattern: Optional[str] = None,
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 modified_since: Optional[float] = None) -> Callable[[str, os.stat_result], bool]:
+    """Build function checking whether file with the given name and stat result passes the filters."""
+    modified_since_ns = _time_ns(modified_since)
+
+    def matches(name: str, stat: os.stat_result) -> bool:
+        return ((prefix is None or name.startswith(prefix))
+                and (pattern is None or fnmatch.fnmatchcase(name, pattern))
+                and (min_size is None or _content_size(name, stat, root) >= min_size)
+                and (max_size is None or _content_size(name, stat, root) <= max_size)
+                and (modified_since_ns is None or stat.st_mtime_ns >= modified_since_ns))
+
+    return matches
 
 
-def get_file_data(filename: str, verbose: bool = False) -> dict:
+def _encode_cursor(key: tuple, sort: str) -> str:
+    """Build opaque continuation cursor from sort key of the last file on the page."""
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort: str) -> tuple:
+    """Get sort key from continuation cursor built by `_encode_cursor`."""
+    try:
+        cursor_sort, *key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid cursor {cursor}!')
+    key_types = _SORT_KEY_TYPES[sort.lstrip('-')]
+    if (cursor_sort != sort or len(key) != len(key_types)
+            or not all(isinstance(value, value_type) for value, value_type in zip(key, key_types))):
+        raise ValueError(f'Cursor {cursor} does not match sort order {sort}!')
+    return tuple(key)
+
+
+def _is_temp_file(name: str) -> bool:
+    """Check whether the name belongs to a temporary file created by `open_new_file`."""
+    return name.startswith('.') and name.endswith(TEMP_SUFFIX)
+
+
+def _file_info(filename: str, stat: os.stat_result, root: Optional[Root] = None) -> dict:
+    """Build dict with info about file from its stat result, with content hashes if root is given.
+
+    Args:
+        filename (str): Filename relative to the root, only its base name is listed.
+        stat (os.stat_result): Stat result of the file.
+        root (Root): Working directory, hashes aren't read if it isn't given.
+    """
+    info = {
+        'name': os.path.basename(filename),
+        'create_date': time.ctime(get_stat_creation_time(stat)),
+        'edit_date': time.ctime(stat.st_mtime),
+        'size': _content_size(filename, stat, root or CWD),
+    }
+    if root is not None:
+        info.update(_file_hashes(filename, stat, root))
+    return info
+
+
+def _file_hashes(filename: str, stat: os.stat_result, root: Root) -> dict:
+    """Get content hashes of file stored by `publish_file` or `backfill_hashes`, None if they aren't known.
+
+    Hashes are cached per version of the file including its ctime, which is changed by storing them.
+    """
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+    hashes = _get_by_version(_stored_hashes, key)
+    if hashes is None:
+        stored = load_hashes(os.path.join(root.directory, filename), stat) or {}
+        hashes = {name: stored.get(name) for name in ('sha256', 'xxh3_64')}
+        # Recently changed file can be changed again without changing its ctime.
+        if time.time_ns() - stat.st_ctime_ns >= RACY_WINDOW_NS:
+            _put_by_version(_stored_hashes, key, hashes)
+    return dict(hashes)
+
+
+def get_dir_version(root: Optional[Root] = None) -> Optional[tuple]:
+    """Get version of the list of files in working directory.
+
+    Version is built from the directory stat result, number of changes made by the app and version
+    of the metadata cache. Files created or removed by other programs change directory mtime, but
+    files modified in place by them are noticed only by metadata cache with inotify.
+
+    Args:
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Tuple of ints, which changes whenever the list may change, or None if the directory was
+        modified too recently: its mtime has coarse granularity and can't tell later changes apart.
+    """
+    root = root or CWD
+    stat = root.stat(os.curdir)
+    if time.time_ns() - stat.st_mtime_ns < RACY_WINDOW_NS:
+        return None
+    cache = _get_cache(root)
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, root.changes, cache.version if cache else 0
+
+
+def stat_file(filename: str, root: Optional[Root] = None) -> os.stat_result:
+    """Get stat result of file, from metadata cache if it is enabled.
+
+    Args:
+        filename (str): Filename.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Stat result of the file.
+
+    Raises:
+        RuntimeError: if file does not exist or given path isn't a file.
+        ValueError: if filename is invalid.
+    """
+    root = root or CWD
+    _validate_filename(filename, root)
+    cache = _cache_for(filename, root)
+    try:
+        stat = cache.stat(filename) if cache else None
+        if stat is None:
+            stat = root.stat(filename)
+    except FileNotFoundError:
+        msg = f'There is no such file "{filename}"!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    if not stat_module.S_ISREG(stat.st_mode):
+        msg = f'The given path "{filename}" is not a file!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    return stat
+
+
+def get_file_data(filename: str, verbose: bool = False, root: Optional[Root] = None) -> dict:
     """Get full info about file.
 
     Args:
         filename (str): Filename.
         verbose (bool): Get file content in addition to other info.
+        root (Root): Working directory, current directory of app by default.
 
     Returns:
         Dict, which contains full info about file. Keys:
@@ -65,24 +995,24 @@ def get_file_data(filename: str, verbose: bool = False) -> dict:
         - create_date (datetime): date of file creation
         - edit_date (datetime): date of last file modification
         - size (int): size of file in bytes
+        - sha256 (str): hex digest of SHA-256 of file content or None if it isn't known
+        - xxh3_64 (str): hex digest of XXH3 64-bit hash of file content or None if it isn't known
 
     Raises:
         RuntimeError: if file does not exist.
         ValueError: if filename is invalid.
     """
     logging.debug(f'Collecting info about file {filename}.')
-    if not pathname_is_valid(filename):
-        msg = f'Invalid file name {filename}!'
-        logging.error(msg)
-        raise ValueError(msg)
-    file_info = dict()
+    root = root or CWD
+    _validate_filename(filename, root)
+    cache = _cache_for(filename, root)
     try:
-        file_info['name'] = os.path.basename(filename)
-        file_info['create_date'] = time.ctime(get_file_creation_time(filename))
-        file_info['edit_date'] = time.ctime(os.path.getmtime(filename))
-        file_info['size'] = os.path.getsize(filename)
+        stat = cache.stat(filename) if cache else None
+        if stat is None:
+            stat = root.stat(filename)
+        file_info = _file_info(filename, stat, root)
         if verbose:
-            file_info['content'] = get_file_content(filename)
+            file_info['content'] = _read_content(filename, stat, root)
         return file_info
     except FileNotFoundError:
         msg = f'There is no such file "{filename}"!'
@@ -90,17 +1020,19 @@ def get_file_data(filename: str, verbose: bool = False) -> dict:
         raise RuntimeError(msg)
 
 
-def create_file(filename: str, content: Union[str, bytes]) -> dict:
+def create_file(filename: str, content: Union[str, bytes], root: Optional[Root] = None, verbose: bool = True) -> dict:
     """Create a new file.
 
     Args:
         filename (str): Filename.
         content (str): String with file content.
+        root (Root): Working directory, current directory of app by default.
+        verbose (bool): Read content of created file back and return it with other info.
 
     Returns:
         Dict, which contains name of created file. Keys:
         - name (str): filename
-        - content (str): file content
+        - content (str): file content, only if verbose
         - create_date (datetime): date of file creation
         - size (int): size of file in bytes
 
@@ -109,46 +1041,484 @@ def create_file(filename: str, content: Union[str, bytes]) -> dict:
         RuntimeError: if file already exists
     """
     logging.debug(f'Starting file creation {filename}')
-    if not pathname_is_valid(filename):
-        msg = f'Invalid file name {filename}!'
+    content = content if isinstance(content, bytes) else str.encode(content)
+    f = open_new_file(filename, root)
+    try:
+        f.write(content)
+        publish_file(f, filename, root)
+    except BaseException:
+        discard_file(f, root)
+        raise
+    file_metadata = get_file_data(filename, verbose=verbose, root=root)
+    del file_metadata['edit_date']
+    return file_metadata
+
+
+def open_new_file(filename: str, root: Optional[Root] = None) -> BinaryIO:
+    """Open a temporary file for writing content of a new file.
+
+    The temporary file is created in the same directory as the target file, so it can be published
+    by `publish_file` with an atomic link/rename or removed by `discard_file`.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Temporary file object opened in 'wb' mode, `name` attribute contains its path relative to the root.
+        The file object computes hashes of content written to it; if encryption is enabled, it also
+        encrypts the content.
+
+    Raises:
+        ValueError: if filename is invalid.
+        RuntimeError: if file already exists.
+    """
+    root = root or CWD
+    _validate_filename(filename, root)
+    _reject_existing(filename, root)
+    directory, name = os.path.split(filename)
+    while True:
+        temp_name = os.path.join(directory, f'.{name}.{secrets.token_hex(4)}{TEMP_SUFFIX}')
+        try:
+            f = open(temp_name, 'xb', opener=root.opener)
+            break
+        except FileExistsError:
+            continue
+        except FileNotFoundError:
+            msg = f'There is no such directory "{directory}"!'
+            logging.error(msg)
+            raise RuntimeError(msg)
+    logging.debug(f'Writing content of {filename} to {f.name}.')
+    cipher = _cipher
+    if cipher is not None:
+        try:
+            f = cipher.open_writer(f)
+        except BaseException:
+            discard_file(f, root)
+            raise
+    return HashingWriter(f)
+
+
+def _reject_existing(filename: str, root: Root) -> None:
+    """Check that file doesn't exist before its content is received.
+
+    Early rejection only, so a large upload isn't received in vain. The actual check is done
+    atomically when the file is published.
+
+    Raises:
+        RuntimeError: if file already exists.
+    """
+    try:
+        root.stat(filename)
+    except FileNotFoundError:
+        pass
+    else:
+        msg = f'File {filename} already exists!'
         logging.error(msg)
-        raise ValueError(msg)
-    if os.path.exists(filename):
+        raise RuntimeError(msg)
+
+
+def publish_file(f: BinaryIO, filename: str, root: Optional[Root] = None) -> None:
+    """Close temporary file opened by `open_new_file` and atomically move it to its final name.
+
+    Existing file is never overwritten: the temporary file is hard linked to the target name,
+    which fails if the name is already taken (same as O_EXCL). If the filesystem doesn't support
+    hard links, the name is reserved with O_CREAT | O_EXCL and then replaced by the temporary file.
+    Content hashes computed while the file was written are stored with it before it is published.
+
+    Args:
+        f (BinaryIO): temporary file object.
+        filename (str): Filename of the file to be created.
+        root (Root): Working directory, current directory of app by default.
+
+    Raises:
+        RuntimeError: if file already exists.
+    """
+    root = root or CWD
+    f.close()
+    _publish_temp_file(f.name, filename, root, f.digests() if isinstance(f, HashingWriter) else None)
+
+
+def _publish_temp_file(temp_name: str, filename: str, root: Root, hashes: Optional[dict] = None) -> None:
+    """Move closed temporary file to its final name and store its content hashes, see `publish_file`.
+
+    Raises:
+        RuntimeError: if file already exists.
+    """
+    if hashes:
+        fd = root.opener(temp_name, os.O_RDONLY)
+        try:
+            store_hashes(fd, hashes, os.fstat(fd))
+        finally:
+            os.close(fd)
+    try:
+        try:
+            root.link(temp_name, filename)
+        except FileExistsError:
+            raise
+        except OSError:
+            os.close(root.opener(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            root.replace(temp_name, filename)
+    except FileExistsError:
+        _remove_temp_file(temp_name, root)
         msg = f'File {filename} already exists!'
         logging.error(msg)
         raise RuntimeError(msg)
-    content = content if isinstance(content, bytes) else str.encode(content)
-    with open(filename, 'wb') as f:
-        f.write(content)
+    _remove_temp_file(temp_name, root)
+    cache = _cache_for(filename, root)
+    if cache:
+        cache.refresh(filename)
+    index = _index_for(filename, root)
+    if index:
+        try:
+            index.put(root.directory, _index_entry(filename, root.stat(filename), root, hashes))
+        except FileNotFoundError:
+            # Already removed by another request.
+            pass
+    _invalidate_content(filename, root)
+    _schedule_search(filename, root)
+    root.changes += 1
     logging.info(f'File {filename} was created.')
-    file_metadata = get_file_data(filename, verbose=True)
-    del file_metadata['edit_date']
-    return file_metadata
 
 
-def delete_file(filename: str) -> None:
+def discard_file(f: BinaryIO, root: Optional[Root] = None) -> None:
+    """Close and remove temporary file opened by `open_new_file`.
+
+    Args:
+        f (BinaryIO): temporary file object.
+        root (Root): Working directory, current directory of app by default.
+    """
+    f.close()
+    _remove_temp_file(f.name, root or CWD)
+
+
+def _remove_temp_file(temp_name: str, root: Root) -> None:
+    try:
+        root.remove(temp_name)
+    except FileNotFoundError:
+        pass
+
+
+def create_upload(filename: str, size: int, chunk_size: Optional[int] = None, sha256: Optional[str] = None,
+                  root: Optional[Root] = None) -> dict:
+    """Start upload of a new file in chunks, which may be sent in parallel and in any order.
+
+    Space for the whole file is allocated at once. Chunks are sent by `open_upload_chunk`, the
+    upload can be resumed after a failure by sending chunks missing according to `get_upload`,
+    and the file is created by `commit_upload` once all chunks are received.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        size (int): Size of the file in bytes, not larger than the limit set by `configure_uploads`.
+        chunk_size (int): Size of every chunk except the last one, a multiple of 64 KiB, 8 MiB by default.
+        sha256 (str): Expected hex digest of SHA-256 of the content, checked on commit. If it isn't known
+            yet, it must be given to `commit_upload`.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with upload description, see `get_upload`.
+
+    Raises:
+        ValueError: if filename, size, chunk size or hash is invalid.
+        RuntimeError: if file already exists, its directory doesn't exist or there is not enough space.
+    """
+    root = root or CWD
+    _validate_filename(filename, root)
+    _reject_existing(filename, root)
+    directory = os.path.dirname(filename)
+    try:
+        if directory and not stat_module.S_ISDIR(root.stat(directory).st_mode):
+            raise FileNotFoundError(directory)
+    except FileNotFoundError:
+        msg = f'There is no such directory "{directory}"!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    _cleanup_expired_uploads(root)
+    return UploadSession.create(root, filename, size, chunk_size or DEFAULT_CHUNK_SIZE, sha256, _cipher,
+                                _upload_max_size).status()
+
+
+def get_upload(filename: str, upload_id: str, root: Optional[Root] = None) -> dict:
+    """Get description of upload started by `create_upload`.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        upload_id (str): Id of the upload.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with keys:
+        - upload_id (str): id of the upload
+        - filename (str): filename
+        - size (int): size of the file in bytes
+        - chunk_size (int): size of every chunk except the last one
+        - chunks (int): number of chunks
+        - received (list): indexes of received chunks
+        - missing (list): indexes of chunks to be sent
+
+    Raises:
+        ValueError: if filename or upload id is invalid.
+        RuntimeError: if there is no such upload.
+    """
+    return _open_upload(filename, upload_id, root or CWD).status()
+
+
+def open_upload_chunk(filename: str, upload_id: str, index: int, root: Optional[Root] = None) -> ChunkWriter:
+    """Open chunk of upload for writing.
+
+    Content written to the returned object is stored at its position in the file right away. The
+    chunk is marked as received by its `close` method, if it has the right size; `discard` method
+    drops it. Chunks may be written concurrently by different requests and worker processes.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        upload_id (str): Id of the upload.
+        index (int): Index of the chunk, from 0.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Write-only file object of the chunk.
+
+    Raises:
+        ValueError: if filename, upload id or chunk index is invalid.
+        RuntimeError: if there is no such upload or it is being committed.
+    """
+    return _open_upload(filename, upload_id, root or CWD).open_chunk(index, _cipher)
+
+
+def commit_upload(filename: str, upload_id: str, sha256: Optional[str] = None, root: Optional[Root] = None) -> dict:
+    """Create file from received chunks of upload.
+
+    Content is hashed and compared to the expected hash, then the file is published atomically,
+    same as by `publish_file`. If the hash doesn't match, the upload isn't closed, so wrong chunks
+    can be sent again.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        upload_id (str): Id of the upload.
+        sha256 (str): Expected hex digest of SHA-256 of the content, the one given on start by default.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Dict with info about created file, same as `get_file_data`.
+
+    Raises:
+        ValueError: if filename or upload id is invalid, the expected hash isn't known or content has
+            a different hash.
+        RuntimeError: if there is no such upload, chunks are missing or file already exists.
+    """
+    root = root or CWD
+    temp_name, hashes = _open_upload(filename, upload_id, root).commit(_cipher, sha256)
+    _publish_temp_file(temp_name, filename, root, hashes)
+    return get_file_data(filename, root=root)
+
+
+def abort_upload(filename: str, upload_id: str, root: Optional[Root] = None) -> None:
+    """Cancel upload and remove received chunks.
+
+    Args:
+        filename (str): Filename of the file to be created.
+        upload_id (str): Id of the upload.
+        root (Root): Working directory, current directory of app by default.
+
+    Raises:
+        ValueError: if filename or upload id is invalid.
+        RuntimeError: if there is no such upload or its chunks are being written.
+    """
+    _open_upload(filename, upload_id, root or CWD).abort()
+
+
+def cleanup_uploads(max_age: float, root: Optional[Root] = None) -> int:
+    """Remove uploads of working directory, which got no chunks for the given time.
+
+    Args:
+        max_age (float): Time in seconds.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        Number of removed uploads.
+    """
+    return UploadSession.cleanup(root or CWD, max_age)
+
+
+def configure_uploads(max_size: int = DEFAULT_MAX_SIZE, ttl: Optional[float] = None) -> None:
+    """Set limits of chunked uploads.
+
+    Args:
+        max_size (int): Max size of uploaded file in bytes, 10 GiB by default.
+        ttl (float): Time in seconds, after which uploads without new chunks are removed. Expired
+            uploads of a root are looked for by `create_upload` at most once per minute. They are
+            kept by default.
+    """
+    global _upload_max_size, _upload_ttl
+    _upload_max_size = max_size
+    _upload_ttl = ttl
+    with _uploads_lock:
+        _uploads_cleaned.clear()
+
+
+def _cleanup_expired_uploads(root: Root) -> None:
+    """Remove expired uploads of root, if it wasn't done recently."""
+    ttl = _upload_ttl
+    if ttl is None:
+        return
+    now = time.monotonic()
+    with _uploads_lock:
+        last = _uploads_cleaned.get(root.directory)
+        if last is not None and now - last < UPLOAD_CLEANUP_INTERVAL:
+            return
+        _uploads_cleaned[root.directory] = now
+    UploadSession.cleanup(root, ttl)
+
+
+def _open_upload(filename: str, upload_id: str, root: Root) -> UploadSession:
+    """Open upload session of the file.
+
+    Raises:
+        ValueError: if filename or upload id is invalid.
+        RuntimeError: if there is no such upload of the file.
+    """
+    _validate_filename(filename, root)
+    session = UploadSession.open(root, upload_id)
+    if session.filename != filename:
+        msg = f'There is no upload session {upload_id} of {filename}!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    return session
+
+
+def delete_file(filename: str, root: Optional[Root] = None) -> None:
     """Delete file.
 
     Args:
         filename (str): filename
+        root (Root): Working directory, current directory of app by default.
 
     Raises:
         RuntimeError: if file does not exist or given path isn't a file.
         ValueError: if filename is invalid.
     """
-
-    if not pathname_is_valid(filename):
-        msg = f'Invalid file name {filename}!'
-        logging.error(msg)
-        raise ValueError(msg)
-    if not os.path.exists(filename):
+    root = root or CWD
+    _validate_filename(filename, root)
+    try:
+        is_file = stat_module.S_ISREG(root.stat(filename).st_mode)
+    except FileNotFoundError:
         msg = f'There is no such file "{filename}"!'
         logging.error(msg)
         raise RuntimeError(msg)
-    if os.path.isfile(filename):
-        os.remove(filename)
+    if is_file:
+        root.remove(filename)
+        cache = _cache_for(filename, root)
+        if cache:
+            cache.discard(filename)
+        index = _index_for(filename, root)
+        if index:
+            index.remove(root.directory, filename)
+        _invalidate_content(filename, root)
+        _schedule_search(filename, root)
+        root.changes += 1
         logging.info(f'File "{filename}" was removed.')
     else:
         msg = f'The given path "{filename}" is not a file!'
         logging.error(msg)
         raise RuntimeError(msg)
+
+
+def open_file(filename: str, root: Optional[Root] = None) -> BinaryIO:
+    """Open file for reading its content in binary mode.
+
+    Args:
+        filename (str): Filename.
+        root (Root): Working directory, current directory of app by default.
+
+    Returns:
+        File object opened in 'rb' mode, decrypting reader for encrypted file (it has `size` attribute
+        with size of content and `read_at` method). Caller is responsible for closing it.
+
+    Raises:
+        RuntimeError: if file does not exist or given path isn't a file.
+        ValueError: if filename is invalid.
+    """
+    logging.debug(f'Opening file {filename} for reading.')
+    root = root or CWD
+    _validate_filename(filename, root)
+    try:
+        f = _open_for_reading(filename, root)
+    except FileNotFoundError:
+        msg = f'There is no such file "{filename}"!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    except OSError:
+        msg = f'The given path "{filename}" is not a readable file!'
+        logging.error(msg)
+        raise RuntimeError(msg)
+    return f
+
+
+def archive_member_name(name: str) -> str:
+    """Convert name of archive member to filename relative to working directory.
+
+    Args:
+        name (str): Member name with '/' separators, as stored in tar and zip archives.
+
+    Returns:
+        Filename, which is still checked by functions creating the file.
+
+    Raises:
+        ValueError: if name is absolute, refers to a parent directory or is empty.
+    """
+    parts = [part for part in name.split('/') if part not in ('', os.curdir)]
+    if name.startswith('/') or os.pardir in parts or not parts or os.path.splitdrive(parts[0])[0]:
+        msg = f'Unsafe archive member name {name}!'
+        logging.error(msg)
+        raise ValueError(msg)
+    return os.path.join(*parts)
+
+
+def iter_archive(fileobj: BinaryIO, archive_format: str = 'tar',
+                 spool_size: int = 16 * 1024 * 1024) -> Iterator[Tuple[str, int, Optional[BinaryIO]]]:
+    """Iterate over members of archive read from a stream.
+
+    Tar archives (plain or compressed with gzip, bzip2 or xz) are read strictly sequentially, so
+    members are available as soon as they arrive. Zip archives keep their directory at the end,
+    so the stream is spooled to a temporary file first (in memory up to `spool_size` bytes).
+
+    Args:
+        fileobj (BinaryIO): Readable stream with archive.
+        archive_format (str): 'tar' or 'zip'.
+        spool_size (int): Max size in bytes of zip archive kept in memory.
+
+    Yields:
+        Tuples (name, size, content): member name as stored in the archive, size of content and
+        readable file object with content, valid until the next member is requested, or None for
+        members other than regular files. Directories are skipped.
+
+    Raises:
+        ValueError: if archive format is unknown or archive is corrupted.
+    """
+    if archive_format == 'tar':
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+                for member in tar:
+                    if member.isdir():
+                        continue
+                    yield member.name, member.size, tar.extractfile(member) if member.isreg() else None
+        except tarfile.TarError as ex:
+            raise ValueError(f'Invalid tar archive: {ex}')
+    elif archive_format == 'zip':
+        with tempfile.SpooledTemporaryFile(max_size=spool_size) as spool:
+            shutil.copyfileobj(fileobj, spool, CHUNK_SIZE)
+            try:
+                with zipfile.ZipFile(spool) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        if stat_module.S_ISLNK(info.external_attr >> 16):
+                            yield info.filename, info.file_size, None
+                            continue
+                        with archive.open(info) as content:
+                            yield info.filename, info.file_size, content
+            except (zipfile.BadZipFile, zipfile.LargeZipFile) as ex:
+                raise ValueError(f'Invalid zip archive: {ex}')
+    else:
+        raise ValueError(f'Unknown archive format {archive_format}, expected tar or zip!')
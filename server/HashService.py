@@ -0,0 +1,182 @@
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+XATTR_NAME = 'user.fileservice.hashes'
+CHUNK_SIZE = 1024 * 1024
+
+# Names of computed hashes, the fast non-cryptographic one requires xxhash package.
+HASH_NAMES = ('sha256', 'xxh3_64') if xxhash is not None else ('sha256',)
+
+
+def new_hashers() -> dict:
+    """Create hash objects of all `HASH_NAMES`."""
+    hashers = {'sha256': hashlib.sha256()}
+    if xxhash is not None:
+        hashers['xxh3_64'] = xxhash.xxh3_64()
+    return hashers
+
+
+class HashingWriter:
+    """Write-only file object computing hashes of content written through it to another file object."""
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self._hashers = new_hashers()
+
+    @property
+    def name(self):
+        return self.raw.name
+
+    @property
+    def closed(self) -> bool:
+        return self.raw.closed
+
+    def write(self, data: bytes) -> int:
+        for hasher in self._hashers.values():
+            hasher.update(data)
+        return self.raw.write(data)
+
+    def close(self) -> None:
+        self.raw.close()
+
+    def fileno(self) -> int:
+        return self.raw.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def digests(self) -> Dict[str, str]:
+        """Get hex digests of content written so far."""
+        return {name: hasher.hexdigest() for name, hasher in self._hashers.items()}
+
+
+def _version(stat: os.stat_result) -> list:
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def store_hashes(file, digests: Dict[str, str], stat: os.stat_result) -> bool:
+    """Store hashes of file content in extended attribute of the file.
+
+    Hashes are stored with mtime and size of the file, so they are ignored after the file is modified.
+
+    Args:
+        file: Path or file descriptor.
+        digests (dict): Hex digests by hash names.
+        stat (os.stat_result): Stat result of the file, which content was hashed.
+
+    Returns:
+        False if extended attributes aren't supported by OS or filesystem.
+    """
+    if not hasattr(os, 'setxattr'):
+        return False
+    value = json.dumps({**digests, 'version': _version(stat)}).encode()
+    try:
+        if isinstance(file, int):
+            os.setxattr(file, XATTR_NAME, value)
+        else:
+            os.setxattr(file, XATTR_NAME, value, follow_symlinks=False)
+    except OSError as ex:
+        logging.debug(f'Cannot store hashes of file: {ex}.')
+        return False
+    return True
+
+
+def load_hashes(path: str, stat: os.stat_result) -> Optional[Dict[str, str]]:
+    """Get hashes of file content stored by `store_hashes`.
+
+    Args:
+        path (str): Path to file.
+        stat (os.stat_result): Current stat result of the file.
+
+    Returns:
+        Hex digests by hash names or None if they aren't stored or the file was modified since.
+    """
+    if not hasattr(os, 'getxattr'):
+        return None
+    try:
+        value = json.loads(os.getxattr(path, XATTR_NAME, follow_symlinks=False))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(value, dict) or value.pop('version', None) != _version(stat):
+        return None
+    return value
+
+
+def hash_file(path: str, cipher=None) -> Tuple[Optional[Dict[str, str]], os.stat_result]:
+    """Compute hashes of file content, runs in a worker process of `backfill`.
+
+    Args:
+        path (str): Path to file.
+        cipher (FileCipher): Cipher to decrypt encrypted files, so hashes are of their content.
+
+    Returns:
+        Tuple of digests (None if the file was modified while it was read) and stat result of the file.
+    """
+    with open(path, 'rb') as raw:
+        return hash_open_file(raw, cipher)
+
+
+def hash_open_file(raw: BinaryIO, cipher=None) -> Tuple[Optional[Dict[str, str]], os.stat_result]:
+    """Compute hashes of content of file opened for reading, same as `hash_file`."""
+    stat = os.fstat(raw.fileno())
+    f = (cipher.open_reader(raw) if cipher is not None else None) or raw
+    hashers = new_hashers()
+    for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+        for hasher in hashers.values():
+            hasher.update(data)
+    if _version(os.fstat(raw.fileno())) != _version(stat):
+        return None, stat
+    return {name: hasher.hexdigest() for name, hasher in hashers.items()}, stat
+
+
+def backfill(paths: Iterable[str], workers: Optional[int] = None,
+             cipher=None) -> Iterator[Tuple[str, Optional[Dict[str, str]], Optional[os.stat_result]]]:
+    """Compute hashes of files in parallel by a pool of worker processes.
+
+    Args:
+        paths (Iterable): Paths to files.
+        workers (int): Number of worker processes, number of CPUs by default and at most.
+        cipher (FileCipher): Cipher to decrypt encrypted files.
+
+    Yields:
+        Tuples of path, digests and stat result in order of completion. Digests are None if the file
+        couldn't be read or was modified while it was read, stat result is None if it couldn't be read.
+    """
+    cpus = os.cpu_count() or 1
+    workers = min(workers or cpus, cpus)
+    # Workers aren't forked from the app, which has running threads and event loop.
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    paths = iter(paths)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context(method)) as pool:
+        futures = {}
+        while True:
+            # A few files per worker are submitted at once, so memory usage doesn't depend on number of files.
+            for path in itertools.islice(paths, 4 * workers - len(futures)):
+                futures[pool.submit(hash_file, path, cipher)] = path
+            if not futures:
+                return
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                path = futures.pop(future)
+                try:
+                    digests, stat = future.result()
+                except (OSError, ValueError) as ex:
+                    logging.error(f'Cannot hash file {path}: {ex}.')
+                    yield path, None, None
+                    continue
+                yield path, digests, stat
@@ -0,0 +1,63 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class IOExecutor:
+    """Dedicated thread pool for blocking filesystem operations.
+
+    Number of operations that are running or waiting for a free thread is limited by
+    `max_workers + max_queue`. When the limit is reached, new operations wait for a free slot
+    up to `queue_timeout` seconds and then fail, so an overloaded disk doesn't make the number
+    of pending operations grow without bounds.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 0, queue_timeout: float = 30):
+        """
+        Args:
+            max_workers (int): Number of threads, default is chosen by ThreadPoolExecutor.
+            max_queue (int): Number of operations allowed to wait for a free thread.
+            queue_timeout (float): Max time in seconds to wait for a place in the queue.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='io')
+        self.max_workers = self._pool._max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = None
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run blocking function in the pool and wait for its result.
+
+        Args:
+            func (Callable): function to run.
+            *args, **kwargs: arguments passed to the function.
+
+        Returns:
+            Result of the function call.
+
+        Raises:
+            RuntimeError: if there is no place in the queue during `queue_timeout` seconds.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            msg = 'Server is too busy, I/O queue is full.'
+            logging.error(msg)
+            raise RuntimeError(msg)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop all threads of the pool.
+
+        Args:
+            wait (bool): Wait for running operations to complete.
+        """
+        self._pool.shutdown(wait=wait)
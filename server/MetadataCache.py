@@ -0,0 +1,331 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_event_header = struct.Struct('iIII')
+
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+def _load_inotify():
+    """Load inotify functions from libc, returns None if inotify isn't available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class MetadataCache:
+    """In-memory cache of metadata of files in a single directory.
+
+    The cache is populated by one directory scan and then kept current by a background thread,
+    which reads inotify events on Linux or polls directory modification time elsewhere. Polling
+    notices only added, removed and renamed files, so changes made through FileService are also
+    applied to the cache directly via `refresh` and `discard`.
+
+    If the directory contains more than `max_entries` files, the cache is incomplete: listing
+    isn't served from it and lookups of unknown names are misses.
+
+    Stat results of the entries themselves are kept, symlinks aren't followed, same as by listings.
+    Changes noticed by the background thread are reported to `listener` with the filename, or with
+    None when the whole directory was rescanned.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, poll_interval: float = 1.0,
+                 name_filter: Callable[[str], bool] = lambda name: True, use_inotify: bool = True,
+                 listener: Optional[Callable[[Optional[str]], None]] = None):
+        """
+        Args:
+            path (str): Path to the directory.
+            max_entries (int): Max number of files kept in the cache.
+            poll_interval (float): Interval in seconds between checks when inotify isn't available.
+            name_filter (Callable): Function deciding whether file with the given name is cached.
+            use_inotify (bool): Use inotify if it is available, otherwise always poll.
+            listener (Callable): Function called from the background thread on changes of files.
+        """
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.hits = 0
+        self.misses = 0
+        self.complete = False
+        # Incremented on every change of cached entries.
+        self.version = 0
+        self._name_filter = name_filter
+        self._listener = listener
+        self._entries: Dict[str, os.stat_result] = {}
+        self._indexes: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify_fd = None
+        self._stop_pipe = None
+
+    def start(self) -> None:
+        """Scan the directory and start watching it for changes."""
+        libc = _load_inotify() if self.use_inotify else None
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(self.path), WATCH_MASK) >= 0:
+                self._inotify_fd = fd
+                self._stop_pipe = os.pipe()
+            elif fd >= 0:
+                os.close(fd)
+        # Watch is set before scanning, so changes made during the scan are not lost.
+        self.reload()
+        if self._inotify_fd is not None:
+            target, name = self._watch_inotify, 'metadata-inotify'
+        else:
+            target, name = self._watch_polling, 'metadata-polling'
+        logging.debug(f'Watching directory {self.path} for changes ({name}).')
+        self._thread = threading.Thread(target=target, name=name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching the directory and drop cached entries."""
+        self._stop.set()
+        if self._stop_pipe is not None:
+            os.write(self._stop_pipe[1], b'\0')
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._inotify_fd, *(self._stop_pipe or ())):
+            if fd is not None:
+                os.close(fd)
+        self._inotify_fd = self._stop_pipe = None
+        with self._lock:
+            self._entries = {}
+            self._indexes = {}
+            self.version += 1
+            self.complete = False
+
+    def reload(self) -> None:
+        """Scan the whole directory again."""
+        entries = {}
+        complete = True
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if not self._name_filter(entry.name):
+                        continue
+                    if len(entries) >= self.max_entries:
+                        complete = False
+                        break
+                    try:
+                        entries[entry.name] = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+        except OSError as ex:
+            logging.error(f'Cannot scan directory {self.path}: {ex}.')
+            complete = False
+        with self._lock:
+            self._entries = entries
+            self._indexes = {}
+            self.version += 1
+            self.complete = complete
+
+    def refresh(self, name: str) -> None:
+        """Update cached info about a single file from disk.
+
+        Args:
+            name (str): filename in the cached directory.
+        """
+        if not self._name_filter(name):
+            return
+        try:
+            stat = os.stat(os.path.join(self.path, name), follow_symlinks=False)
+        except (FileNotFoundError, NotADirectoryError):
+            self.discard(name)
+            return
+        except OSError:
+            return
+        with self._lock:
+            if name in self._entries or len(self._entries) < self.max_entries:
+                self._entries[name] = stat
+                self._indexes = {}
+                self.version += 1
+            else:
+                self.complete = False
+
+    def discard(self, name: str) -> None:
+        """Remove a single file from the cache.
+
+        Args:
+            name (str): filename in the cached directory.
+        """
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._indexes = {}
+                self.version += 1
+
+    def stat(self, name: str) -> Optional[os.stat_result]:
+        """Get cached stat result of file.
+
+        Args:
+            name (str): filename in the cached directory.
+
+        Returns:
+            Stat result or None if the result isn't known and disk must be checked.
+
+        Raises:
+            FileNotFoundError: if the cache is complete and there is no such file.
+        """
+        with self._lock:
+            stat = self._entries.get(name)
+            if stat is None and not self.complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+        if stat is None:
+            # Complete cache knows that there is no such file.
+            raise FileNotFoundError(name)
+        return stat
+
+    def entries(self) -> Optional[List[Tuple[str, os.stat_result]]]:
+        """Get snapshot of all cached files.
+
+        Returns:
+            List of (name, stat) tuples or None if the cache is incomplete and disk must be scanned.
+        """
+        with self._lock:
+            if not self.complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(self._entries.items())
+
+    def sorted_index(self, sort: str, key: Callable[[str, os.stat_result], tuple]) -> Optional[List[tuple]]:
+        """Get all cached files sorted by the given key.
+
+        The index is built on first use and kept until the cache changes, so subsequent pages of
+        a listing are found by binary search instead of a full scan.
+
+        Args:
+            sort (str): Name of the sort order, identifies the index.
+            key (Callable): Function building sort key from filename and its stat result.
+
+        Returns:
+            Sorted list of (key, name, stat) tuples, which must not be modified, or None if the cache
+            is incomplete and disk must be scanned.
+        """
+        with self._lock:
+            if not self.complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            index = self._indexes.get(sort)
+            if index is None:
+                index = sorted((key(name, stat), name, stat) for name, stat in self._entries.items())
+                self._indexes[sort] = index
+            return index
+
+    def stats(self) -> dict:
+        """Get cache statistics.
+
+        Returns:
+            Dict with keys: path, entries, max_entries, complete, version, hits, misses, watcher.
+        """
+        return {
+            'path': self.path,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'complete': self.complete,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'watcher': 'inotify' if self._inotify_fd is not None else 'polling',
+        }
+
+    def _watch_inotify(self) -> None:
+        """Read inotify events and apply them to the cache until stopped."""
+        while not self._stop.is_set():
+            select.select([self._inotify_fd, self._stop_pipe[0]], [], [])
+            if self._stop.is_set():
+                break
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except OSError as ex:
+                logging.error(f'Cannot read inotify events for {self.path}: {ex}.')
+                break
+            names = set()
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _event_header.unpack_from(data, offset)
+                offset += _event_header.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    logging.debug(f'Inotify queue overflow for {self.path}, rescanning.')
+                    self.reload()
+                    self._notify(None)
+                    names.clear()
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    logging.debug(f'Watched directory {self.path} was removed or moved.')
+                    with self._lock:
+                        self._entries = {}
+                        self._indexes = {}
+                        self.version += 1
+                        self.complete = False
+                    return
+                elif name:
+                    names.add(name)
+            for name in names:
+                self.refresh(name)
+                if self._name_filter(name):
+                    self._notify(name)
+        with self._lock:
+            self.complete = False
+
+    def _watch_polling(self) -> None:
+        """Rescan directory when its modification time changes until stopped."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current = os.stat(self.path).st_mtime_ns
+            except OSError:
+                current = None
+            # Timestamps are coarse, so changes made within the same tick as the last scan are
+            # invisible by mtime: directory modified recently is rescanned anyway.
+            if current != mtime or current is not None and time.time_ns() - current < RACY_WINDOW_NS:
+                mtime = current
+                self.reload()
+                self._notify(None)
+
+    def _notify(self, name: Optional[str]) -> None:
+        if self._listener is not None:
+            try:
+                self._listener(name)
+            except Exception as ex:
+                logging.error(f'Listener of changes in {self.path} failed: {ex}.')
@@ -0,0 +1,230 @@
+import logging
+import mimetypes
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+# Sort orders and columns of their keys, name is always the last one, so keys are unique.
+SORT_COLUMNS = {
+    'name': ('name',),
+    'size': ('size', 'name'),
+    'mtime': ('mtime_ns', 'name'),
+}
+COLUMNS = ('name', 'size', 'create_time', 'mtime_ns', 'ino', 'sha256', 'xxh3_64', 'mime_type')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    create_time REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    sha256 TEXT,
+    xxh3_64 TEXT,
+    mime_type TEXT,
+    PRIMARY KEY (root, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_by_size ON files (root, size, name);
+CREATE INDEX IF NOT EXISTS files_by_mtime ON files (root, mtime_ns, name);
+'''
+
+
+class IndexEntry(tuple):
+    """Row of the index: name, size, create_time, mtime_ns, ino, sha256, xxh3_64, mime_type."""
+
+    @property
+    def name(self) -> str:
+        return self[0]
+
+    @property
+    def size(self) -> int:
+        return self[1]
+
+    @property
+    def mtime_ns(self) -> int:
+        return self[3]
+
+    def sort_key(self, sort: str) -> tuple:
+        return tuple(self[COLUMNS.index(column)] for column in SORT_COLUMNS[sort])
+
+
+class MetadataIndex:
+    """Catalog of file metadata in SQLite database, shared by all roots and worker processes.
+
+    Files of every root (identified by its directory) are kept with their size, timestamps, inode,
+    content hashes (if they are known) and mime type guessed from the name. Sorted and filtered pages
+    are found by index range scans, so their cost doesn't depend on number of files in the root.
+
+    The catalog doesn't watch directories: it is updated by the app on every change and brought in
+    line with the disk by `reconcile`, which must be called for a root before it is queried.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path to SQLite database, created if it doesn't exist.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._reconciled = set()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        if db_path != ':memory:':
+            # Several worker processes update the catalog at once.
+            self._db.execute('PRAGMA journal_mode = WAL')
+            self._db.execute('PRAGMA synchronous = NORMAL')
+            self._db.execute('PRAGMA busy_timeout = 10000')
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close database connection."""
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def guess_mime_type(name: str) -> Optional[str]:
+        return mimetypes.guess_type(name)[0]
+
+    def is_reconciled(self, root: str) -> bool:
+        """Check whether the root was reconciled by this process, so its entries can be trusted."""
+        return root in self._reconciled
+
+    def put(self, root: str, entry: tuple) -> None:
+        """Add or replace entry of file.
+
+        Args:
+            root (str): Root directory.
+            entry (tuple): Values of `COLUMNS`.
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (root, *entry))
+
+    def remove(self, root: str, name: str) -> None:
+        """Remove entry of file, if it exists."""
+        with self._lock:
+            self._db.execute('DELETE FROM files WHERE root = ? AND name = ?', (root, name))
+
+    def reconcile(self, root: str, entries: Iterable[tuple]) -> dict:
+        """Replace entries of root by entries of files found on disk in a single transaction.
+
+        Entries with the same size, mtime and inode are kept as they are, other ones are replaced
+        and entries of missing files are removed.
+
+        Args:
+            root (str): Root directory.
+            entries (Iterable): Values of `COLUMNS` of every file in the root.
+
+        Returns:
+            Dict with numbers of files: added, updated, removed, total.
+        """
+        added = updated = total = 0
+        with self._lock:
+            known = {name: (size, mtime_ns, ino) for name, size, mtime_ns, ino in self._db.execute(
+                'SELECT name, size, mtime_ns, ino FROM files WHERE root = ?', (root,))}
+            self._db.execute('BEGIN')
+            try:
+                for entry in entries:
+                    name = entry[0]
+                    try:
+                        name.encode()
+                    except UnicodeEncodeError:
+                        logging.warning(f'File {name!r} of {root} is not indexed, its name is not valid UTF-8.')
+                        continue
+                    total += 1
+                    version = known.pop(name, None)
+                    if version == (entry[1], entry[3], entry[4]):
+                        continue
+                    if version is None:
+                        added += 1
+                    else:
+                        updated += 1
+                    self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (root, *entry))
+                self._db.executemany('DELETE FROM files WHERE root = ? AND name = ?',
+                                     ((root, name) for name in known))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._reconciled.add(root)
+        stats = {'added': added, 'updated': updated, 'removed': len(known), 'total': total}
+        logging.info(f'Metadata index of {root} was reconciled: {stats}.')
+        return stats
+
+    def forget(self, root: str) -> None:
+        """Mark root as not reconciled, so it is reconciled again before the next query."""
+        self._reconciled.discard(root)
+
+    def get(self, root: str, name: str) -> Optional[IndexEntry]:
+        """Get entry of file or None if it isn't indexed."""
+        with self._lock:
+            row = self._db.execute(f'SELECT {", ".join(COLUMNS)} FROM files WHERE root = ? AND name = ?',
+                                   (root, name)).fetchone()
+        return IndexEntry(row) if row is not None else None
+
+    def query(self, root: str, sort: str = 'name', descending: bool = False, after: Optional[tuple] = None,
+              limit: int = 1000, prefix: Optional[str] = None, min_size: Optional[int] = None,
+              max_size: Optional[int] = None, modified_since: Optional[int] = None) -> List[IndexEntry]:
+        """Get entries of files in the given order, which pass the filters.
+
+        Args:
+            root (str): Root directory.
+            sort (str): Sort order: 'name', 'size' or 'mtime'.
+            descending (bool): Sort in descending order.
+            after (tuple): Sort key (values of `SORT_COLUMNS`) of the last entry of previous page.
+            limit (int): Max number of entries.
+            prefix (str): Return only files with names starting with the prefix.
+            min_size (int): Return only files not smaller than the size in bytes.
+            max_size (int): Return only files not larger than the size in bytes.
+            modified_since (int): Return only files modified at the time in ns or later.
+
+        Returns:
+            List of entries.
+        """
+        columns = SORT_COLUMNS[sort]
+        conditions, params = ['root = ?'], [root]
+        if after is not None:
+            conditions.append(f'({", ".join(columns)}) {"<" if descending else ">"} ({", ".join("?" * len(after))})')
+            params.extend(after)
+        if prefix:
+            # Text is compared as UTF-8 bytes, which keeps order of code points.
+            conditions.append('name >= ? AND name < ?')
+            params.extend((prefix, prefix + '\U0010ffff'))
+        for condition, value in (('size >= ?', min_size), ('size <= ?', max_size),
+                                 ('mtime_ns >= ?', modified_since)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        order = ', '.join(f'{column} {"DESC" if descending else "ASC"}' for column in columns)
+        with self._lock:
+            rows = self._db.execute(f'SELECT {", ".join(COLUMNS)} FROM files WHERE {" AND ".join(conditions)} '
+                                    f'ORDER BY {order} LIMIT ?', (*params, limit)).fetchall()
+        return [IndexEntry(row) for row in rows]
+
+    def iter_entries(self, root: str, batch_size: int = 1000, **filters) -> Iterator[IndexEntry]:
+        """Iterate over entries of files ordered by name, reading them in batches.
+
+        Args:
+            root (str): Root directory.
+            batch_size (int): Number of entries read at once.
+            filters: Filters of `query`.
+        """
+        after = None
+        while True:
+            batch = self.query(root, after=after, limit=batch_size, **filters)
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            after = batch[-1].sort_key('name')
+
+    def stats(self, root: Optional[str] = None) -> dict:
+        """Get index statistics.
+
+        Returns:
+            Dict with keys: path, files (in the root or in all roots), reconciled (roots reconciled by this process).
+        """
+        with self._lock:
+            if root is None:
+                files = self._db.execute('SELECT count(*) FROM files').fetchone()[0]
+            else:
+                files = self._db.execute('SELECT count(*) FROM files WHERE root = ?', (root,)).fetchone()[0]
+        return {'path': self.db_path, 'files': files, 'reconciled': sorted(self._reconciled)}
@@ -0,0 +1,117 @@
+import contextlib
+import os
+from typing import Iterator, Optional
+
+DIR_FD_SUPPORTED = {os.open, os.stat, os.unlink, os.link}.issubset(os.supports_dir_fd) and os.scandir in os.supports_fd
+DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+
+class Root:
+    """Directory, which file operations are relative to.
+
+    Where `dir_fd` is supported the directory is opened once and all operations use its descriptor
+    (openat-style), so they don't depend on current directory of the process and can run from any
+    thread. Elsewhere names are joined with the root path.
+
+    Root without path is bound to current directory of the process and accepts any paths, which is
+    how FileService functions work when no root is given.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (str): Path to existing directory or None for current directory of the process.
+
+        Raises:
+            FileNotFoundError: if directory does not exist.
+            NotADirectoryError: if path isn't a directory.
+        """
+        self.path = os.path.abspath(path) if path is not None else None
+        self.fd = None
+        self.metadata_cache = None
+        # Number of files created and removed by the app, part of the listing version.
+        self.changes = 0
+        if self.path is not None:
+            if DIR_FD_SUPPORTED:
+                self.fd = os.open(self.path, DIR_FLAGS)
+            elif not os.path.isdir(self.path):
+                raise NotADirectoryError(self.path)
+
+    @property
+    def directory(self) -> str:
+        """Absolute path of the directory."""
+        return self.path if self.path is not None else os.getcwd()
+
+    def close(self) -> None:
+        """Close directory descriptor and stop metadata cache of the root."""
+        if self.metadata_cache is not None:
+            self.metadata_cache.stop()
+            self.metadata_cache = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __del__(self):
+        # Roots are shared between requests, so descriptor is closed only when the last one is done.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __repr__(self):
+        return f'Root({self.path!r})'
+
+    def opener(self, name: str, flags: int) -> int:
+        """Open file relative to the root, suitable as `opener` argument of built-in `open`.
+
+        Symbolic links aren't followed inside a root, so a link can't lead outside of it.
+        """
+        if self.fd is not None:
+            return os.open(name, flags | getattr(os, 'O_NOFOLLOW', 0), 0o666, dir_fd=self.fd)
+        return os.open(self._join(name), flags | (getattr(os, 'O_NOFOLLOW', 0) if self.path else 0), 0o666)
+
+    def stat(self, name: str) -> os.stat_result:
+        """Get stat result of file relative to the root."""
+        if self.fd is not None:
+            return os.stat(name, dir_fd=self.fd, follow_symlinks=False)
+        return os.stat(self._join(name), follow_symlinks=self.path is None)
+
+    def remove(self, name: str) -> None:
+        """Remove file relative to the root."""
+        if self.fd is not None:
+            os.unlink(name, dir_fd=self.fd)
+        else:
+            os.remove(self._join(name))
+
+    def link(self, src: str, dst: str) -> None:
+        """Create hard link `dst` to file `src`, both are relative to the root."""
+        if self.fd is not None:
+            os.link(src, dst, src_dir_fd=self.fd, dst_dir_fd=self.fd)
+        else:
+            os.link(self._join(src), self._join(dst))
+
+    def replace(self, src: str, dst: str) -> None:
+        """Rename file `src` to `dst` overwriting it, both are relative to the root."""
+        if self.fd is not None:
+            os.replace(src, dst, src_dir_fd=self.fd, dst_dir_fd=self.fd)
+        else:
+            os.replace(self._join(src), self._join(dst))
+
+    @contextlib.contextmanager
+    def scandir(self) -> Iterator[Iterator[os.DirEntry]]:
+        """Context manager iterating over entries of the root directory."""
+        if self.fd is None:
+            with os.scandir(self.path or os.curdir) as entries:
+                yield entries
+            return
+        # A new open file description is used for every scan, so concurrent scans of the same root
+        # don't share directory position. It must stay open while entries are used.
+        fd = os.open(os.curdir, DIR_FLAGS, dir_fd=self.fd)
+        try:
+            with os.scandir(fd) as entries:
+                yield entries
+        finally:
+            os.close(fd)
+
+    def _join(self, name: str) -> str:
+        return os.path.join(self.path, name) if self.path is not None else name
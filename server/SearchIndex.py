@@ -0,0 +1,235 @@
+import logging
+import queue
+import sqlite3
+import threading
+from typing import Callable, Hashable, Iterator, List, Optional, Tuple
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    UNIQUE (root, name)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(content, tokenize = 'unicode61 remove_diacritics 2');
+'''
+
+# Loads document: (root, name, indexed version or None) -> (version, text) or None if the file is
+# missing. Text is None if the version is the indexed one, so the file isn't read in vain, and empty
+# for files, which aren't indexed (e.g. binary ones), so their versions are still known.
+Loader = Callable[[object, str, Optional[str]], Optional[Tuple[str, Optional[str]]]]
+# Lists versions of all files in root: root -> iterator of (name, version).
+Scanner = Callable[[object], Iterator[Tuple[str, str]]]
+
+
+class SearchIndex:
+    """Full-text index of text files in SQLite FTS5 table, updated by a background thread.
+
+    Changes are queued by `schedule` and applied by the worker thread, so callers never wait for
+    reading and indexing of files. A file is re-read only if its version (built by the loader from
+    its stat result) differs from the indexed one. `schedule` without a filename compares the whole
+    root with the index. Roots are passed to the loader and the scanner as is and identified in the
+    database by `root_id`.
+    """
+
+    def __init__(self, db_path: str, loader: Loader, scanner: Scanner, root_id: Callable[[object], str],
+                 max_queue: int = 100000):
+        """
+        Args:
+            db_path (str): Path to SQLite database, created if it doesn't exist.
+            loader (Callable): Function reading version and text of a file.
+            scanner (Callable): Function listing names and versions of all files in a root.
+            root_id (Callable): Function getting unique string id of a root.
+            max_queue (int): Max number of queued changes, the whole root is rescanned if it is exceeded.
+        """
+        self.db_path = db_path
+        self.indexed = 0
+        self.errors = 0
+        self._loader = loader
+        self._scanner = scanner
+        self._root_id = root_id
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        if db_path != ':memory:':
+            self._db.execute('PRAGMA journal_mode = WAL')
+            self._db.execute('PRAGMA synchronous = NORMAL')
+            self._db.execute('PRAGMA busy_timeout = 10000')
+        self._db.executescript(_SCHEMA)
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._max_queue = max_queue
+        self._synced = set()
+        self._busy = False
+        self._idle = threading.Condition(self._pending_lock)
+        self._thread = threading.Thread(target=self._work, name='search-index', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the worker thread after queued changes are applied and close the database."""
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._db.close()
+
+    def schedule(self, root, name: Optional[str] = None) -> None:
+        """Queue update of a file or, without filename, of the whole root.
+
+        Args:
+            root: Root directory.
+            name (str): Filename in the root.
+        """
+        key: Hashable = (self._root_id(root), name)
+        with self._pending_lock:
+            if key in self._pending:
+                return
+            if name is not None and len(self._pending) >= self._max_queue:
+                # Too many changes, they are collected by a single scan instead.
+                key, name = (key[0], None), None
+                if key in self._pending:
+                    return
+            self._pending.add(key)
+        self._queue.put((key, root, name))
+
+    def ensure_synced(self, root) -> None:
+        """Schedule comparison of the root with the index, once per root in this process."""
+        root_id = self._root_id(root)
+        if root_id not in self._synced:
+            self._synced.add(root_id)
+            self.schedule(root)
+
+    def forget(self, root) -> None:
+        """Mark root as not compared with the index, e.g. after it was changed by other programs."""
+        self._synced.discard(self._root_id(root))
+
+    def pending(self) -> int:
+        """Get number of queued changes."""
+        return len(self._pending)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued changes are applied, returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def search(self, root, query: str, limit: int = 20, snippet_tokens: int = 16) -> List[dict]:
+        """Find files containing all words of the query, the most relevant first.
+
+        Args:
+            root: Root directory.
+            query (str): Words to search for, every word is matched as is (FTS operators are not used).
+            limit (int): Max number of results.
+            snippet_tokens (int): Max number of words in snippet.
+
+        Returns:
+            List of dicts with keys: name, snippet (matches are wrapped into [ ]), score (BM25, lower is better).
+
+        Raises:
+            ValueError: if the query has no words.
+        """
+        words = query.split()
+        if not words:
+            raise ValueError('Search query is empty!')
+        expression = ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT documents.name, snippet(document_text, 0, \'[\', \']\', \'...\', ?), bm25(document_text) '
+                'FROM document_text JOIN documents ON documents.id = document_text.rowid '
+                'WHERE document_text MATCH ? AND documents.root = ? ORDER BY bm25(document_text) LIMIT ?',
+                (snippet_tokens, expression, self._root_id(root), limit)).fetchall()
+        return [{'name': name, 'snippet': snippet, 'score': score} for name, snippet, score in rows]
+
+    def stats(self) -> dict:
+        """Get index statistics.
+
+        Returns:
+            Dict with keys: path, documents, pending, indexed, errors.
+        """
+        with self._lock:
+            documents = self._db.execute('SELECT count(*) FROM documents').fetchone()[0]
+        return {'path': self.db_path, 'documents': documents, 'pending': self.pending(), 'indexed': self.indexed,
+                'errors': self.errors}
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            key, root, name = task
+            with self._pending_lock:
+                # Changes scheduled from now on are queued again, so they aren't lost.
+                self._pending.discard(key)
+                self._busy = True
+            try:
+                if name is None:
+                    self._sync_root(root)
+                else:
+                    self._update(root, name)
+            except Exception as ex:
+                self.errors += 1
+                logging.error(f'Cannot update search index of {name or "directory"}: {ex}.')
+            with self._idle:
+                self._busy = False
+                self._idle.notify_all()
+
+    def _sync_root(self, root) -> None:
+        root_id = self._root_id(root)
+        with self._lock:
+            indexed = dict(self._db.execute('SELECT name, version FROM documents WHERE root = ?', (root_id,)))
+        for name, version in self._scanner(root):
+            if indexed.pop(name, None) != version:
+                try:
+                    self._update(root, name)
+                except Exception as ex:
+                    # A broken file doesn't stop synchronization of the others.
+                    self.errors += 1
+                    logging.error(f'Cannot update search index of {name}: {ex}.')
+        for name in indexed:
+            self._remove(root_id, name)
+        logging.debug(f'Search index of {root_id} was synchronized.')
+
+    def _update(self, root, name: str) -> None:
+        root_id = self._root_id(root)
+        with self._lock:
+            row = self._db.execute('SELECT version FROM documents WHERE root = ? AND name = ?',
+                                   (root_id, name)).fetchone()
+        document = self._loader(root, name, row[0] if row is not None else None)
+        if document is None:
+            if row is not None:
+                self._remove(root_id, name)
+            return
+        version, text = document
+        if text is None or row is not None and row[0] == version:
+            return
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                row = self._db.execute('SELECT id FROM documents WHERE root = ? AND name = ?',
+                                       (root_id, name)).fetchone()
+                if row is None:
+                    doc_id = self._db.execute('INSERT INTO documents (root, name, version) VALUES (?, ?, ?)',
+                                              (root_id, name, version)).lastrowid
+                else:
+                    doc_id = row[0]
+                    self._db.execute('UPDATE documents SET version = ? WHERE id = ?', (version, doc_id))
+                    self._db.execute('DELETE FROM document_text WHERE rowid = ?', (doc_id,))
+                self._db.execute('INSERT INTO document_text (rowid, content) VALUES (?, ?)', (doc_id, text))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        self.indexed += 1
+
+    def _remove(self, root_id: str, name: str) -> None:
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                row = self._db.execute('SELECT id FROM documents WHERE root = ? AND name = ?',
+                                       (root_id, name)).fetchone()
+                if row is not None:
+                    self._db.execute('DELETE FROM documents WHERE id = ?', (row[0],))
+                    self._db.execute('DELETE FROM document_text WHERE rowid = ?', (row[0],))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
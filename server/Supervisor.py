@@ -0,0 +1,103 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict
+
+from utils.log_utils import use_worker_logfile
+
+
+class Supervisor:
+    """Pre-forking supervisor of worker processes sharing one listening socket.
+
+    The socket is created by the supervisor and inherited by workers, so all of them accept
+    connections from the same queue and connections waiting in it aren't lost when a worker is
+    restarted. Every worker writes its own log file (see `use_worker_logfile`). Workers that exit
+    unexpectedly are restarted. On SIGINT/SIGTERM workers get SIGTERM
+    and are given `shutdown_timeout` seconds to finish active requests before they are killed.
+    """
+
+    def __init__(self, target: Callable[[socket.socket], None], workers: int, port: int, host: str = '0.0.0.0',
+                 shutdown_timeout: float = 60, restart_delay: float = 1):
+        """
+        Args:
+            target (Callable): Function serving requests from the given socket, runs in every worker.
+            workers (int): Number of worker processes.
+            port (int): Port to listen to.
+            host (str): Address to listen to.
+            shutdown_timeout (float): Time in seconds for workers to finish active requests on shutdown.
+            restart_delay (float): Min time in seconds between restarts of the same worker.
+        """
+        self.target = target
+        self.workers = workers
+        self.port = port
+        self.host = host
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context('fork')
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started: Dict[int, float] = {}
+        self._stopping = False
+
+    def run(self) -> None:
+        """Start workers and supervise them until SIGINT or SIGTERM is received."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(1024)
+        previous_handlers = {sig: signal.signal(sig, self._stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for number in range(self.workers):
+                self._start_worker(number, sock)
+            while not self._stopping:
+                sentinels = {process.sentinel: number for number, process in self._processes.items()}
+                for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=1):
+                    number = sentinels[sentinel]
+                    process = self._processes[number]
+                    process.join()
+                    if self._stopping:
+                        break
+                    logging.error(f'Worker {number} (pid {process.pid}) exited with code {process.exitcode}, '
+                                  f'restarting.')
+                    delay = self._started[number] + self.restart_delay - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    self._start_worker(number, sock)
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+            self._shutdown()
+            sock.close()
+
+    def _start_worker(self, number: int, sock: socket.socket) -> None:
+        process = self._context.Process(target=self._run_worker, args=(number, sock), name=f'worker-{number}')
+        process.start()
+        self._processes[number] = process
+        self._started[number] = time.monotonic()
+        logging.debug(f'Worker {number} started with pid {process.pid}.')
+
+    def _run_worker(self, number: int, sock: socket.socket) -> None:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, signal.SIG_DFL)
+        use_worker_logfile(number)
+        self.target(sock)
+
+    def _stop(self, signum, frame) -> None:
+        logging.info(f'Received signal {signum}, stopping workers.')
+        self._stopping = True
+
+    def _shutdown(self) -> None:
+        """Ask workers to finish gracefully and kill ones that don't finish in time."""
+        alive = [process for process in self._processes.values() if process.is_alive()]
+        for process in alive:
+            os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.shutdown_timeout
+        for process in alive:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logging.error(f'Worker {process.name} (pid {process.pid}) did not stop in time, killing.')
+                process.kill()
+                process.join()
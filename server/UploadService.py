@@ -0,0 +1,376 @@
+import errno
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from typing import BinaryIO, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from server.CryptoService import BLOCK_SIZE, FileCipher
+from server.HashService import hash_open_file
+from server.Root import Root
+from utils.file_utils import preallocate_file, read_file_chunk, write_file_chunk
+
+# Session files end with the suffix of temporary files, so they are hidden from listings.
+PREFIX = '.upload-'
+SUFFIX = '.part'
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+MAX_CHUNKS = 1024 * 1024
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024
+
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+_FLAGS = getattr(os, 'O_BINARY', 0)
+
+
+class UploadSession:
+    """Upload of a file in chunks, which may be sent in parallel, in any order and over several connections.
+
+    Session is kept on disk in two hidden files of the root, so it survives dropped connections and
+    restarts of the app and is shared by all worker processes:
+    - data file, preallocated to the final size, where chunks are written at their positions;
+    - state file with JSON description of the upload on the first line, followed by a byte per
+      chunk, which is set once the chunk is completely written.
+    Chunk writers hold a shared lock of the state file and commit takes an exclusive one, so the data
+    file isn't modified after it is verified (where `fcntl` isn't available, i.e. on Windows, the
+    client must not send chunks while it commits the upload).
+
+    Content of encrypted uploads is encrypted by whole blocks at their positions, so chunk size is
+    always a multiple of the encryption block size.
+    """
+
+    def __init__(self, root: Root, upload_id: str, info: dict, bitmap_offset: int):
+        self.root = root
+        self.upload_id = upload_id
+        self.filename = info['filename']
+        self.size = info['size']
+        self.chunk_size = info['chunk_size']
+        self.sha256 = info['sha256']
+        self.header = bytes.fromhex(info['header']) if info['header'] is not None else None
+        self._bitmap_offset = bitmap_offset
+
+    @property
+    def chunks(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    @property
+    def data_name(self) -> str:
+        return f'{PREFIX}{self.upload_id}{SUFFIX}'
+
+    @property
+    def state_name(self) -> str:
+        return _state_name(self.upload_id)
+
+    @classmethod
+    def create(cls, root: Root, filename: str, size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               sha256: Optional[str] = None, cipher: Optional[FileCipher] = None,
+               max_size: int = DEFAULT_MAX_SIZE) -> 'UploadSession':
+        """Start a new upload session, space for the whole file is allocated at once.
+
+        Args:
+            root (Root): Working directory.
+            filename (str): Filename of the file to be created.
+            size (int): Size of the file in bytes.
+            chunk_size (int): Size of every chunk in bytes except the last one.
+            sha256 (str): Expected hex digest of SHA-256 of the content, checked by `commit`. If it isn't
+                known yet, it must be given to `commit`.
+            cipher (FileCipher): Cipher to encrypt the content, if encryption is enabled.
+            max_size (int): Max size of the file in bytes, space for it is allocated before any chunk is sent.
+
+        Raises:
+            ValueError: if size, chunk size or hash is invalid.
+            RuntimeError: if there is not enough space for the file.
+        """
+        if size < 0:
+            raise ValueError(f'Invalid size {size}, it must not be negative!')
+        if size > max_size:
+            raise ValueError(f'Invalid size {size}, it must not be larger than {max_size}!')
+        if chunk_size < 1 or chunk_size % BLOCK_SIZE or chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError(f'Invalid chunk size {chunk_size}, it must be a multiple of {BLOCK_SIZE} '
+                             f'not larger than {MAX_CHUNK_SIZE}!')
+        if -(-size // chunk_size) > MAX_CHUNKS:
+            raise ValueError(f'Too many chunks, chunk size must be at least {-(-size // MAX_CHUNKS)}!')
+        if sha256 is not None and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+            raise ValueError(f'Invalid SHA-256 hex digest {sha256}!')
+        header = cipher.new_header() if cipher is not None else None
+        info = {'filename': filename, 'size': size, 'chunk_size': chunk_size,
+                'sha256': sha256.lower() if sha256 is not None else None,
+                'header': header.hex() if header is not None else None, 'created': time.time()}
+        line = json.dumps(info).encode() + b'\n'
+        session = cls(root, secrets.token_hex(16), info, len(line))
+        try:
+            fd = root.opener(session.data_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY | _FLAGS)
+            try:
+                preallocate_file(fd, FileCipher.stored_size(size) if header is not None else size)
+                if header is not None:
+                    write_file_chunk(fd, 0, header)
+                    if size == 0:
+                        # Empty file consists of a single empty block, which isn't sent as a chunk.
+                        write_file_chunk(fd, *cipher.open_block_writer(header, size).encrypt_at(0, b''))
+            finally:
+                os.close(fd)
+            fd = root.opener(session.state_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY | _FLAGS)
+            try:
+                write_file_chunk(fd, 0, line + bytes(session.chunks))
+            finally:
+                os.close(fd)
+        except BaseException as ex:
+            session._remove_files()
+            if isinstance(ex, OSError) and ex.errno == errno.ENOSPC:
+                msg = f'There is not enough space for {size} bytes!'
+                logging.error(msg)
+                raise RuntimeError(msg)
+            raise
+        logging.info(f'Upload {session.upload_id} of {filename} ({size} bytes) was started.')
+        return session
+
+    @classmethod
+    def open(cls, root: Root, upload_id: str) -> 'UploadSession':
+        """Open existing upload session.
+
+        Raises:
+            ValueError: if upload id is invalid.
+            RuntimeError: if there is no such session.
+        """
+        if not _UPLOAD_ID.fullmatch(upload_id):
+            raise ValueError(f'Invalid upload id {upload_id}!')
+        with _open_state(root, upload_id, 'rb') as f:
+            line = f.readline()
+        return cls(root, upload_id, json.loads(line), len(line))
+
+    def chunk_range(self, index: int) -> Tuple[int, int]:
+        """Get offset and size of chunk in the content.
+
+        Raises:
+            ValueError: if there is no such chunk.
+        """
+        if not 0 <= index < self.chunks:
+            raise ValueError(f'Invalid chunk {index}, upload {self.upload_id} has {self.chunks} chunks!')
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def status(self) -> dict:
+        """Get description of the upload.
+
+        Returns:
+            Dict with keys: upload_id, filename, size, chunk_size, chunks (number of chunks),
+            received (indexes of received chunks), missing (indexes of chunks to be sent).
+        """
+        with _open_state(self.root, self.upload_id, 'rb') as f:
+            bitmap = read_file_chunk(f, self._bitmap_offset, self.chunks)
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunks,
+            'received': [index for index, received in enumerate(bitmap) if received],
+            'missing': [index for index, received in enumerate(bitmap) if not received],
+        }
+
+    def open_chunk(self, index: int, cipher: Optional[FileCipher] = None) -> 'ChunkWriter':
+        """Open chunk for writing, see `ChunkWriter`.
+
+        Raises:
+            ValueError: if there is no such chunk.
+            RuntimeError: if the session was closed or is being committed.
+        """
+        return ChunkWriter(self, index, cipher)
+
+    def commit(self, cipher: Optional[FileCipher] = None, sha256: Optional[str] = None) -> Tuple[str, dict]:
+        """Verify that all chunks are received and the content has the expected hash and close the session.
+
+        Args:
+            cipher (FileCipher): Cipher to decrypt the content of encrypted upload.
+            sha256 (str): Expected hex digest of SHA-256 of the content, the one given on creation by default.
+
+        Returns:
+            Tuple of name of the data file, which must be published by the caller, and hashes of the content.
+
+        Raises:
+            RuntimeError: if chunks are missing or being written, or the session was closed.
+            ValueError: if the expected hash isn't known or the content has a different hash.
+        """
+        if self.header is not None and cipher is None:
+            raise RuntimeError(f'Upload {self.upload_id} is encrypted, but encryption is disabled!')
+        # Chunks are marked as received only when they are written completely, but a chunk may be
+        # overwritten by a concurrent or dropped re-send, so content is always verified by its hash.
+        expected = sha256.lower() if sha256 else self.sha256
+        if expected is None:
+            raise ValueError(f'SHA-256 of upload {self.upload_id} must be given on its start or on commit!')
+        with _open_state(self.root, self.upload_id, 'r+b') as state:
+            self._lock(state, shared=False)
+            bitmap = read_file_chunk(state, self._bitmap_offset, self.chunks)
+            missing = self.chunks - sum(bitmap)
+            if missing:
+                raise RuntimeError(f'Upload {self.upload_id} is incomplete, {missing} of {self.chunks} '
+                                   f'chunks are missing!')
+            with open(self.data_name, 'rb', opener=self.root.opener) as data:
+                hashes, _ = hash_open_file(data, cipher)
+            if hashes is None:
+                raise RuntimeError(f'Content of upload {self.upload_id} was modified while it was verified!')
+            if hashes['sha256'] != expected:
+                raise ValueError(f'SHA-256 of upload {self.upload_id} is {hashes["sha256"]}, expected {expected}!')
+            # Chunk writers waiting for the lock find the state file removed.
+            self.root.remove(self.state_name)
+        logging.info(f'Upload {self.upload_id} of {self.filename} was completed.')
+        return self.data_name, hashes
+
+    def abort(self) -> None:
+        """Close the session and remove its files.
+
+        Raises:
+            RuntimeError: if the session was closed or chunks are being written.
+        """
+        with _open_state(self.root, self.upload_id, 'r+b') as state:
+            self._lock(state, shared=False)
+            self._remove_files()
+        logging.info(f'Upload {self.upload_id} of {self.filename} was aborted.')
+
+    @classmethod
+    def cleanup(cls, root: Root, max_age: float) -> int:
+        """Remove files of sessions, which weren't changed for the given time.
+
+        Returns:
+            Number of removed sessions.
+        """
+        deadline = time.time() - max_age
+        removed = 0
+        with root.scandir() as entries:
+            names = [entry.name for entry in entries if entry.name.startswith(PREFIX) and entry.name.endswith(SUFFIX)]
+        for name in names:
+            try:
+                if root.stat(name).st_mtime < deadline:
+                    root.remove(name)
+                    removed += name.endswith(f'.state{SUFFIX}')
+            except FileNotFoundError:
+                pass
+        if removed:
+            logging.info(f'{removed} expired uploads were removed from {root.directory}.')
+        return removed
+
+    def _lock(self, state, shared: bool) -> None:
+        """Lock the state file without waiting, after that check that the session wasn't closed in the meantime."""
+        if fcntl is not None:
+            try:
+                fcntl.flock(state.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f'Upload {self.upload_id} is being committed!' if shared else
+                                   f'Chunks of upload {self.upload_id} are being written!')
+        if os.fstat(state.fileno()).st_nlink == 0:
+            raise RuntimeError(f'There is no upload session {self.upload_id}!')
+
+    def _remove_files(self) -> None:
+        for name in (self.state_name, self.data_name):
+            try:
+                self.root.remove(name)
+            except FileNotFoundError:
+                pass
+
+
+class ChunkWriter:
+    """Write-only file object storing a chunk of upload session at its position in the data file.
+
+    Content is written as it arrives (by whole blocks, if the upload is encrypted). `close` marks the
+    chunk as received if its size is right, otherwise the chunk must be sent again; `discard` drops
+    the chunk. A chunk, which was already received, may be sent again, e.g. when the client isn't sure
+    it was stored: it is marked as missing before it is overwritten, so a re-send, which fails midway,
+    isn't committed.
+    """
+
+    def __init__(self, session: UploadSession, index: int, cipher: Optional[FileCipher] = None):
+        self.session = session
+        self.index = index
+        self.offset, self.size = session.chunk_range(index)
+        if session.header is not None and cipher is None:
+            raise RuntimeError(f'Upload {session.upload_id} is encrypted, but encryption is disabled!')
+        self._encryptor = cipher.open_block_writer(session.header, session.size) \
+            if session.header is not None else None
+        self._buffer = bytearray()
+        self._written = 0
+        self._data_fd = None
+        self._state = _open_state(session.root, session.upload_id, 'r+b')
+        try:
+            session._lock(self._state, shared=True)
+            self._data_fd = session.root.opener(session.data_name, os.O_WRONLY | _FLAGS)
+            write_file_chunk(self._state.fileno(), session._bitmap_offset + index, b'\x00')
+        except BaseException:
+            self.discard()
+            raise
+
+    @property
+    def closed(self) -> bool:
+        return self._state.closed
+
+    def write(self, data: bytes) -> int:
+        """Write next part of the chunk.
+
+        Raises:
+            ValueError: if the chunk gets larger than its size.
+        """
+        if self._written + len(self._buffer) + len(data) > self.size:
+            raise ValueError(f'Chunk {self.index} of upload {self.session.upload_id} is larger than '
+                             f'{self.size} bytes!')
+        if self._encryptor is None:
+            write_file_chunk(self._data_fd, self.offset + self._written, data)
+            self._written += len(data)
+        else:
+            self._buffer += data
+            self._flush(len(self._buffer) - len(self._buffer) % BLOCK_SIZE)
+        return len(data)
+
+    def close(self) -> None:
+        """Mark the chunk as received and close files.
+
+        Raises:
+            ValueError: if the chunk is smaller than its size.
+        """
+        if self.closed:
+            return
+        try:
+            if self._written + len(self._buffer) != self.size:
+                raise ValueError(f'Chunk {self.index} of upload {self.session.upload_id} must be {self.size} '
+                                 f'bytes, got {self._written + len(self._buffer)}!')
+            self._flush(len(self._buffer))
+            write_file_chunk(self._state.fileno(), self.session._bitmap_offset + self.index, b'\x01')
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        """Close files without marking the chunk as received."""
+        if self._data_fd is not None:
+            os.close(self._data_fd)
+            self._data_fd = None
+        self._state.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _flush(self, size: int) -> None:
+        if not size:
+            return
+        offset, data = self._encryptor.encrypt_at(self.offset + self._written, bytes(self._buffer[:size]))
+        write_file_chunk(self._data_fd, offset, data)
+        del self._buffer[:size]
+        self._written += size
+
+
+def _state_name(upload_id: str) -> str:
+    return f'{PREFIX}{upload_id}.state{SUFFIX}'
+
+
+def _open_state(root: Root, upload_id: str, mode: str) -> BinaryIO:
+    try:
+        return open(_state_name(upload_id), mode, opener=root.opener)
+    except FileNotFoundError:
+        raise RuntimeError(f'There is no upload session {upload_id}!')
+
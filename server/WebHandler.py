@@ -1,13 +1,173 @@
+import asyncio
+import base64
+import concurrent.futures
+import functools
+import itertools
+import json
 import logging
+import math
+import mimetypes
 import os.path
+import secrets
+import tarfile
+import threading
+import uuid
+import zipfile
+import zlib
+from collections import OrderedDict
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
 
-from aiohttp import web
+from aiohttp import StreamReader, hdrs, web
 
 import server.FileService as FileService
+from server.ArchiveWriter import ARCHIVE_FORMATS, ArchiveWriter
+from server.AuthService import NOT_CACHED, AuthService
+from server.IOExecutor import IOExecutor
+from server.Root import Root
+from utils.file_utils import advise_mapping, close_mapping, map_file, read_file_chunk
+from utils.http_utils import if_range_matches, is_not_modified, make_etag, parse_range_header
+from utils.log_utils import get_log_stats
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# Filters are compared with 64-bit integers: sizes in bytes and modification times in nanoseconds.
+MAX_FILTER_SIZE = 2 ** 63 - 1
+MAX_FILTER_TIME = MAX_FILTER_SIZE // 10 ** 9
 
 
 class WebHandler:
-    """aiohttp handler with coroutines."""
+    """aiohttp handler with coroutines.
+
+    Every request works with its own root directory, resolved by `get_root`:
+    - named root from `X-Root` header or `root` query parameter;
+    - root of the session from `X-Session` header or `session` cookie, set by `change_dir`;
+    - default root otherwise, it is never changed by clients.
+
+    Session ids are generated by `change_dir`, so a client can't pick the session of another one.
+
+    If auth service is given, `auth_middleware` must be installed in the application: every request
+    needs a token (`Authorization: Bearer <token>` header) giving access to its root and file.
+    """
+
+    PAGE_PARAMS = ('limit', 'cursor', 'sort', 'prefix', 'glob', 'min_size', 'max_size', 'modified_since')
+    NDJSON_BATCH = 1000
+    MAX_SESSIONS = 1024
+    MAX_BATCH_LINE = 16 * 1024 * 1024
+    EXTRACT_QUEUE = 16
+    # Archives parsed at once, parsing blocks a thread while the body is received.
+    EXTRACT_THREADS = 4
+
+    def __init__(self, chunk_size: int = FileService.CHUNK_SIZE, executor: Optional[IOExecutor] = None,
+                 root: Optional[Root] = None, roots: Optional[Dict[str, Root]] = None, allow_change_dir: bool = True,
+                 mmap_threshold: int = 1024 * 1024, batch_parallelism: Optional[int] = None,
+                 auth: Optional[AuthService] = None):
+        """
+        Args:
+            chunk_size (int): Size of blocks in bytes used for streaming file content.
+            executor (IOExecutor): Thread pool for blocking filesystem operations.
+            root (Root): Default root, current directory of app if not specified.
+            roots (dict): Named roots, which can be selected by clients.
+            allow_change_dir (bool): Allow clients to change roots of their sessions. It must be
+                disabled when several worker processes serve requests, as every process has its own roots.
+            mmap_threshold (int): Min size in bytes of files, which content is sent from memory mapping, 0 disables it.
+                Mapped files must not be truncated by other programs while they are sent (SIGBUS).
+            batch_parallelism (int): Max number of operations of a batch running at once, number of
+                threads of the executor by default.
+            auth (AuthService): Users and access policies, no authentication if not specified.
+        """
+        self.chunk_size = chunk_size
+        self.executor = executor or IOExecutor()
+        self.root = root or FileService.CWD
+        self.roots = roots or {}
+        self.sessions = OrderedDict()
+        self.allow_change_dir = allow_change_dir
+        self.mmap_threshold = mmap_threshold
+        self.batch_parallelism = batch_parallelism or self.executor.max_workers
+        self.auth = auth
+        self._extract_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.EXTRACT_THREADS,
+                                                                   thread_name_prefix='extract')
+
+    def shutdown(self) -> None:
+        """Stop threads parsing uploaded archives, the executor is shut down by its owner."""
+        self._extract_pool.shutdown(wait=False)
+
+    def get_root(self, request: web.Request) -> Root:
+        """Get root directory for the request.
+
+        Args:
+            request (Request): aiohttp request.
+
+        Returns:
+            Root: named root, root of the session or default root.
+
+        Raises:
+            ValueError: if there is no root with the requested name.
+        """
+        name = request.headers.get('X-Root', request.query.get('root'))
+        if name is not None:
+            if name not in self.roots:
+                raise ValueError(f'Unknown root {name}!')
+            return self.roots[name]
+        session = self._session_id(request)
+        if session in self.sessions:
+            self.sessions.move_to_end(session)
+            return self.sessions[session]
+        return self.root
+
+    @staticmethod
+    def _session_id(request: web.Request) -> Optional[str]:
+        return request.headers.get('X-Session', request.cookies.get('session'))
+
+    @web.middleware
+    async def auth_middleware(self, request: web.Request, handler: Callable) -> web.StreamResponse:
+        """Middleware checking that the token of the request gives access to its root and file.
+
+        Safe methods (GET, HEAD) need 'read' access, other ones need 'write' access. Requests with
+        a filename need access to it, other requests need access to the whole root. Decisions are
+        cached by the auth service, the database is queried in the I/O pool on cache miss only.
+
+        Args:
+            request (Request): aiohttp request.
+            handler: Next handler.
+
+        Returns:
+            StreamResponse: response of the handler or JSON response with error status and 401 or 403 code.
+        """
+        if self.auth is None:
+            return await handler(request)
+        token = self._bearer_token(request)
+        if not token:
+            return self._auth_error('Authentication is required!', 401)
+        try:
+            root = self.get_root(request).directory
+        except ValueError as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'authorization'}
+            return self.construct_response(data)
+        filename = request.match_info.get('filename', '')
+        if filename:
+            filename = os.path.normpath(filename)
+            if filename == os.pardir or filename.startswith(os.pardir + os.sep) or os.path.isabs(filename):
+                return self._auth_error('Access denied!', 403)
+        access = 'read' if request.method in (hdrs.METH_GET, hdrs.METH_HEAD) else 'write'
+        decision = self.auth.cached_decision(token, root, filename, access)
+        if decision is NOT_CACHED:
+            decision = await self.executor.run(self.auth.authorize, token, root, filename, access)
+        if decision is None:
+            return self._auth_error('Invalid token!', 401)
+        if not decision:
+            return self._auth_error('Access denied!', 403)
+        return await handler(request)
+
+    @staticmethod
+    def _bearer_token(request: web.Request) -> Optional[str]:
+        scheme, _, token = request.headers.get(hdrs.AUTHORIZATION, '').partition(' ')
+        return token if scheme.lower() == 'bearer' and token else None
+
+    def _auth_error(self, message: str, status: int) -> web.Response:
+        response = self.construct_response({'status': 'error', 'message': message, 'operation': 'authorization'})
+        response.set_status(status)
+        if status == 401:
+            response.headers[hdrs.WWW_AUTHENTICATE] = 'Bearer'
+        return response
 
     async def handle(self, request: web.Request, *args, **kwargs) -> web.Response:
         """Basic coroutine for connection testing.
@@ -18,15 +178,107 @@ class WebHandler:
         Returns:
             Response: JSON response with status.
         """
-
+        try:
+            curr_dir = self.get_root(request).directory
+        except ValueError:
+            curr_dir = None
         return web.json_response(data={
             'status': 'success',
-            'curr_dir': os.getcwd(),
+            'curr_dir': curr_dir,
         })
 
+    async def get_stats(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for getting statistics of server caches and logging queue.
+
+        Args:
+            request (Request): aiohttp request.
+
+        Returns:
+            Response: JSON response with success status and statistics.
+        """
+        try:
+            data = {'status': 'success', 'metadata_cache': FileService.get_metadata_cache_stats(self.get_root(request)),
+                    'content_cache': FileService.get_content_cache_stats(),
+                    'metadata_index': FileService.get_metadata_index_stats(self.get_root(request)),
+                    'search_index': FileService.get_search_index_stats(),
+                    'logging': get_log_stats(),
+                    'auth_cache': self.auth.cache.stats() if self.auth is not None else None}
+        except ValueError as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'collecting statistics'}
+        return self.construct_response(data)
+
+    async def search(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for full-text search over text files in working directory.
+
+        Args:
+            request (Request): aiohttp request, contains query parameters: q (words to search for)
+                and optional limit (max number of results, 20 by default).
+
+        Returns:
+            Response: JSON response with success status, results (name, snippet, score) and number
+            of pending changes of the index, or error status and error message.
+        """
+        try:
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.search_files, request.query.get('q', ''),
+                                              int(request.query.get('limit', 20)), self.get_root(request))}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'searching files'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def reconcile_index(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for bringing metadata index of working directory in line with the disk.
+
+        Args:
+            request (Request): aiohttp request.
+
+        Returns:
+            Response: JSON response with success status and numbers of added, updated, removed
+            and all files, or error status and error message.
+        """
+        try:
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.reconcile_metadata_index, self.get_root(request))}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'reconciling metadata index'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def backfill_hashes(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for computing content hashes of files in working directory, which don't have them yet.
+
+        Args:
+            request (Request): aiohttp request, contains optional query parameter workers (number of
+                worker processes, number of CPUs by default and at most).
+
+        Returns:
+            Response: JSON response with success status and numbers of hashed, failed, skipped and
+            all unhashed files, or error status and error message.
+        """
+        try:
+            workers = int(request.query['workers']) if 'workers' in request.query else None
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.backfill_hashes, self.get_root(request), workers)}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'computing hashes'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
     async def change_dir(self, request: web.Request, *args, **kwargs) -> web.Response:
         """Coroutine for changing working directory with files.
 
+        Changes root of the session if request has id of an existing session, otherwise starts a new
+        session with a random id. The id is returned in `session` key and cookie, other clients keep
+        their roots. If authentication is enabled, the token needs 'write' access to the whole new directory,
+        as the directory may be created.
+
         Args:
             request (Request): aiohttp request, contains JSON in body. JSON format:
             {
@@ -34,16 +286,33 @@ class WebHandler:
             }.
 
         Returns:
-            Response: JSON response with success status and success message or error status and error message.
+            Response: JSON response with success status, success message and session id or error status and
+            error message.
         """
         try:
             path = request.match_info.get('path', 'new_data')
             logging.info(f'Received path: {path}')
             autocreate = False if request.query.get('autocreate', '').lower() == 'false' else True
-            FileService.change_dir(os.path.abspath(path), autocreate=autocreate)
+            if not self.allow_change_dir:
+                raise RuntimeError('Changing directory is disabled, use named roots instead')
+            directory = os.path.abspath(path)
+            if self.auth is not None:
+                # Middleware authorizes access to the current root only.
+                token = self._bearer_token(request)
+                if not await self.executor.run(self.auth.authorize, token, directory, '', 'write'):
+                    return self._auth_error('Access denied!', 403)
+            root = await self.executor.run(FileService.open_root, directory, autocreate=autocreate)
+            session = self._session_id(request)
+            if session not in self.sessions:
+                session = secrets.token_urlsafe(32)
+            self.sessions[session] = root
+            self.sessions.move_to_end(session)
+            while len(self.sessions) > self.MAX_SESSIONS:
+                self.sessions.popitem(last=False)
             data = {
                     'status': 'success',
-                    'message': f'The current directory has been successfully changed to "{os.getcwd()}".'
+                    'message': f'The current directory has been successfully changed to "{root.directory}".',
+                    'session': session,
             }
         except (RuntimeError, ValueError) as ex:
             data = {
@@ -54,65 +323,421 @@ class WebHandler:
         except Exception as ex:
             logging.error(f'Unexpected exception {str(ex)}.')
             data = {'status': 'fatal error', }
-        return self.construct_response(data)
+        response = self.construct_response(data)
+        if data['status'] == 'success':
+            response.set_cookie('session', session, httponly=True, samesite='Strict')
+        return response
 
     async def get_files(self, request: web.Request, *args, **kwargs) -> web.Response:
-        """Coroutine for getting info about all files in working directory.
+        """Coroutine for getting info about files in working directory.
+
+        Without query parameters info about all files is returned. Any of the following parameters
+        switches to paginated listing (see `FileService.get_files_page`): limit, cursor, sort,
+        prefix, glob, min_size, max_size, modified_since. If client accepts application/x-ndjson, info about all files
+        is streamed one JSON record per line instead. Responses have ETag built from directory version
+        (see `FileService.get_dir_version`), 304 is sent if it matches If-None-Match.
 
         Args:
-            request (Request): aiohttp request.
+            request (Request): aiohttp request, contains optional query parameters.
 
         Returns:
-            Response: JSON response with success status and data or error status and error message.
+            Response: JSON response with success status and data or error status and error message,
+            or NDJSON stream of info about files.
         """
+        ndjson = NDJSON_CONTENT_TYPE in request.headers.get(hdrs.ACCEPT, '')
+        try:
+            etag = await self._listing_etag(request, 'ndjson' if ndjson else 'json')
+        except (RuntimeError, ValueError, OSError):
+            # The error is reported by the listing itself.
+            etag = None
+        if etag is not None and is_not_modified(request.headers, etag):
+            return self._not_modified(etag)
+        if ndjson:
+            return await self._stream_files(request, etag)
         try:
             data = {'status': 'success'}
-            data.update({'files': FileService.get_files()})
+            if any(param in request.query for param in self.PAGE_PARAMS):
+                data.update(await self.executor.run(FileService.get_files_page, **self._page_params(request),
+                                                    root=self.get_root(request)))
+            else:
+                data.update({'files': await self.executor.run(FileService.get_files, self.get_root(request))})
         except (RuntimeError, ValueError) as ex:
             data = {'status': 'error', 'message': str(ex), 'operation': 'collecting files data'}
         except Exception as ex:
             logging.error(f'Unexpected exception {str(ex)}.')
             data = {'status': 'fatal error', }
-        return self.construct_response(data)
+        response = self.construct_response(data)
+        if etag is not None and data['status'] == 'success':
+            response.headers[hdrs.ETAG] = etag
+        return response
+
+    async def _listing_etag(self, request: web.Request, representation: str) -> Optional[str]:
+        """Get entity tag of the list of files in working directory or None if it can't be trusted."""
+        version = await self.executor.run(FileService.get_dir_version, self.get_root(request))
+        return make_etag(*version, representation) if version is not None else None
+
+    @staticmethod
+    def _file_etag(stat: os.stat_result) -> str:
+        """Get strong entity tag of file content from its stat result."""
+        return make_etag(stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _not_modified(etag: str, last_modified: Optional[float] = None) -> web.Response:
+        """Build 304 Not Modified response with the given validators."""
+        response = web.Response(status=304, headers={hdrs.ETAG: etag})
+        if last_modified is not None:
+            response.last_modified = last_modified
+        return response
+
+    async def _stream_files(self, request: web.Request, etag: Optional[str] = None) -> web.StreamResponse:
+        """Stream info about all files in working directory as NDJSON.
+
+        Records are produced by `FileService.iter_files` and encoded in batches of `NDJSON_BATCH`
+        in the I/O pool, so memory usage doesn't depend on number of files.
+        """
+        try:
+            files = FileService.iter_files(self.get_root(request))
+        except ValueError as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'collecting files data'}
+            return self.construct_response(data)
+        try:
+            try:
+                batch = await self.executor.run(self._encode_ndjson_batch, files)
+            except (RuntimeError, OSError) as ex:
+                data = {'status': 'error', 'message': str(ex), 'operation': 'collecting files data'}
+                return self.construct_response(data)
+            response = web.StreamResponse()
+            response.content_type = NDJSON_CONTENT_TYPE
+            if etag is not None:
+                response.headers[hdrs.ETAG] = etag
+            await response.prepare(request)
+            while batch:
+                await response.write(batch)
+                batch = await self.executor.run(self._encode_ndjson_batch, files)
+            await response.write_eof()
+            return response
+        finally:
+            self._close_files(files)
+
+    @staticmethod
+    def _close_files(files: Iterator[dict]) -> None:
+        """Close iterator of `FileService.iter_files` in the event loop.
+
+        Closing only releases the directory handle, so it doesn't block, and unlike the I/O pool it
+        can't fail on a full queue and mask the exception being handled.
+        """
+        try:
+            files.close()
+        except ValueError:
+            # Request was cancelled while the iterator runs in the pool, it's closed when collected.
+            pass
+
+    async def get_archive(self, request: web.Request, *args, **kwargs) -> web.StreamResponse:
+        """Coroutine for downloading files of working directory as a single archive.
+
+        The archive is created while it is being sent, without temporary files: content of every file
+        is read in blocks of `chunk_size` bytes, the next block is read (and compressed) in the I/O pool
+        while the previous one is being sent. Memory usage doesn't depend on size or number of files,
+        except central directory of zip archive.
+
+        Args:
+            request (Request): aiohttp request, contains optional query parameters: format ('tar',
+                'tar.gz' or 'zip', default 'tar') and filters prefix, glob, min_size, max_size.
+
+        Returns:
+            StreamResponse: archive or JSON response with error status and error message.
+        """
+        try:
+            archive_format = request.query.get('format', 'tar')
+            if archive_format not in ARCHIVE_FORMATS:
+                raise ValueError(f'Unknown archive format {archive_format}, '
+                                 f'expected one of: {", ".join(ARCHIVE_FORMATS)}')
+            root = self.get_root(request)
+            files = FileService.iter_files(root, **self._filter_params(request))
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'creating archive'}
+            return self.construct_response(data)
+        archive = ARCHIVE_FORMATS[archive_format]()
+        name = os.path.basename(root.directory.rstrip(os.sep)) or 'files'
+        response = web.StreamResponse(headers={
+            hdrs.CONTENT_DISPOSITION: f'attachment; filename="{name}.{archive.extension}"',
+        })
+        response.content_type = archive.content_type
+        try:
+            await response.prepare(request)
+            while True:
+                batch = await self.executor.run(list, itertools.islice(files, self.NDJSON_BATCH))
+                if not batch:
+                    break
+                for file_info in batch:
+                    await self._write_archive_file(response, archive, file_info['name'], root)
+            await response.write(await self.executor.run(archive.close))
+            await response.write_eof()
+        finally:
+            self._close_files(files)
+        return response
+
+    async def _write_archive_file(self, response: web.StreamResponse, archive: ArchiveWriter, filename: str,
+                                  root: Root) -> None:
+        """Add file to the archive being sent, files which can't be opened are skipped."""
+        try:
+            f = await self.executor.run(FileService.open_file, filename, root)
+        except (RuntimeError, ValueError):
+            return
+        with f:
+            stat = await self.executor.run(os.fstat, f.fileno())
+            # Exactly the announced size is sent even if the file is changed meanwhile.
+            size = getattr(f, 'size', stat.st_size)
+            await response.write(archive.start_file(filename, size, stat.st_mtime))
+            offset = 0
+            pending = asyncio.ensure_future(self.executor.run(self._read_archive_block, archive, f, offset, size))
+            while pending is not None:
+                data, offset = await pending
+                pending = None
+                if offset < size:
+                    pending = asyncio.ensure_future(
+                        self.executor.run(self._read_archive_block, archive, f, offset, size))
+                try:
+                    await response.write(data)
+                except BaseException:
+                    if pending is not None:
+                        # Read running in the pool can't be stopped, the file is closed only after it.
+                        await asyncio.wait([pending])
+                        if not pending.cancelled():
+                            pending.exception()
+                    raise
+            await response.write(archive.end_file())
+
+    def _read_archive_block(self, archive: ArchiveWriter, f, offset: int, size: int) -> Tuple[bytes, int]:
+        """Read the next block of file and encode it, returns encoded data and offset of the next block."""
+        length = min(self.chunk_size, size - offset)
+        data = read_file_chunk(f, offset, length) if length > 0 else b''
+        if len(data) < length:
+            # File was truncated, the rest is filled with zeros.
+            data += bytes(length - len(data))
+        return archive.write(data), offset + length
+
+    @classmethod
+    def _encode_ndjson_batch(cls, files: Iterator[dict]) -> bytes:
+        """Encode next `NDJSON_BATCH` items of iterator as NDJSON, returns empty bytes at the end."""
+        return ''.join(json.dumps(file) + '\n' for file in itertools.islice(files, cls.NDJSON_BATCH)).encode()
+
+    @staticmethod
+    def _page_params(request: web.Request) -> dict:
+        """Get arguments of `FileService.get_files_page` from request query.
+
+        Raises:
+            ValueError: if numeric parameter is not an integer.
+        """
+        query = request.query
+        params = {'limit': int(query.get('limit', 100)), 'sort': query.get('sort', 'name'),
+                  **WebHandler._filter_params(request)}
+        if 'cursor' in query:
+            params['cursor'] = query['cursor']
+        return params
+
+    @staticmethod
+    def _filter_params(request: web.Request) -> dict:
+        """Get file filters (prefix, glob, min_size, max_size, modified_since) from request query.
+
+        Raises:
+            ValueError: if numeric parameter is not a number or is out of range.
+        """
+        query = request.query
+        params = {}
+        for param, arg in (('prefix', 'prefix'), ('glob', 'pattern')):
+            if param in query:
+                params[arg] = query[param]
+        for param in ('min_size', 'max_size'):
+            if param in query:
+                params[param] = int(query[param])
+                if not 0 <= params[param] <= MAX_FILTER_SIZE:
+                    raise ValueError(f'Invalid {param} {query[param]}, it must be from 0 to {MAX_FILTER_SIZE}!')
+        if 'modified_since' in query:
+            params['modified_since'] = float(query['modified_since'])
+            if not math.isfinite(params['modified_since']) or abs(params['modified_since']) > MAX_FILTER_TIME:
+                raise ValueError(f'Invalid modified_since {query["modified_since"]}, it must be a timestamp '
+                                 f'from -{MAX_FILTER_TIME} to {MAX_FILTER_TIME}!')
+        return params
 
     async def get_file_data(self, request: web.Request, *args, **kwargs) -> web.Response:
         """Coroutine for getting full info about file in working directory.
 
+        Responses have ETag and Last-Modified of the file, 304 is sent if they match conditional headers.
+
         Args:
-            request (Request): aiohttp request, contains filename and is_signed parameters.
+            request (Request): aiohttp request, contains filename and is_signed parameters and optional
+                query parameter verbose (content is omitted if it is 'false').
 
         Returns:
             Response: JSON response with success status and data or error status and error message.
         """
         try:
             filename = request.match_info.get('filename', '')
+            root = self.get_root(request)
+            stat = await self.executor.run(FileService.stat_file, filename, root)
+            etag = self._file_etag(stat)
+            if is_not_modified(request.headers, etag, stat.st_mtime):
+                return self._not_modified(etag, stat.st_mtime)
+            verbose = False if request.query.get('verbose', '').lower() == 'false' else True
             data = {'status': 'success'}
-            data.update(FileService.get_file_data(filename, verbose=True))
+            data.update(await self.executor.run(FileService.get_file_data, filename, verbose=verbose, root=root))
         except (RuntimeError, ValueError) as ex:
             data = {'status': 'error', 'message': str(ex), 'operation': 'getting file data'}
         except Exception as ex:
             logging.error(f'Unexpected exception {str(ex)}.')
             data = {'status': 'fatal error', }
-        return self.construct_response(data)
+        response = self.construct_response(data)
+        if data['status'] == 'success':
+            response.headers[hdrs.ETAG] = etag
+            response.last_modified = stat.st_mtime
+        return response
+
+    async def get_file_content(self, request: web.Request, *args, **kwargs) -> web.StreamResponse:
+        """Coroutine for downloading raw file content.
+
+        File is sent in blocks of `chunk_size` bytes, so memory usage doesn't depend on file size.
+        Files of at least `mmap_threshold` bytes are memory mapped and sent as slices of the mapping,
+        so pages in the page cache aren't copied to Python memory.
+        Partial download is supported via Range and If-Range headers: single range is sent as is,
+        multiple ranges are sent as multipart/byteranges. If-None-Match and If-Modified-Since are
+        checked against the file stat before the file is opened, so 304 response needs no file I/O.
+
+        Args:
+            request (Request): aiohttp request, contains filename and optional Range header.
+
+        Returns:
+            StreamResponse: raw file content (full or partial) or JSON response with error status and error message.
+        """
+        try:
+            filename = request.match_info.get('filename', '')
+            root = self.get_root(request)
+            stat = await self.executor.run(FileService.stat_file, filename, root)
+            etag = self._file_etag(stat)
+            if is_not_modified(request.headers, etag, stat.st_mtime):
+                return self._not_modified(etag, stat.st_mtime)
+            f = await self.executor.run(FileService.open_file, filename, root)
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'getting file content'}
+            return self.construct_response(data)
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            return self.construct_response({'status': 'fatal error', })
+        with f:
+            stat = await self.executor.run(os.fstat, f.fileno())
+            # Decrypting reader knows size of content, which is less than size of the file on disk.
+            size = getattr(f, 'size', stat.st_size)
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            etag = self._file_etag(stat)
+            headers = {
+                hdrs.ACCEPT_RANGES: 'bytes',
+                hdrs.CONTENT_DISPOSITION: f'attachment; filename="{os.path.basename(filename)}"',
+                hdrs.ETAG: etag,
+            }
+            ranges = None
+            range_header = request.headers.get(hdrs.RANGE)
+            if_range = request.headers.get(hdrs.IF_RANGE)
+            if range_header and (if_range is None or if_range_matches(if_range, stat.st_mtime, etag)):
+                try:
+                    ranges = parse_range_header(range_header, size)
+                except ValueError:
+                    headers[hdrs.CONTENT_RANGE] = f'bytes */{size}'
+                    return web.Response(status=416, headers=headers)
+
+            mapping = None
+            if self.mmap_threshold and size >= self.mmap_threshold:
+                mapping = await self.executor.run(self._map_file, f, ranges)
+            try:
+                if not ranges or len(ranges) == 1:
+                    start, end = ranges[0] if ranges else (0, size - 1)
+                    if ranges:
+                        headers[hdrs.CONTENT_RANGE] = f'bytes {start}-{end}/{size}'
+                    response = web.StreamResponse(status=206 if ranges else 200, headers=headers)
+                    response.content_type = content_type
+                    response.content_length = end - start + 1
+                    response.last_modified = stat.st_mtime
+                    await response.prepare(request)
+                    await self._write_file_range(response, f, start, end, mapping)
+                else:
+                    boundary = uuid.uuid4().hex
+                    parts = [((f'--{boundary}\r\n'
+                               f'{hdrs.CONTENT_TYPE}: {content_type}\r\n'
+                               f'{hdrs.CONTENT_RANGE}: bytes {start}-{end}/{size}\r\n\r\n').encode(), start, end)
+                             for start, end in ranges]
+                    closing = f'\r\n--{boundary}--\r\n'.encode()
+                    response = web.StreamResponse(status=206, headers=headers)
+                    response.content_type = f'multipart/byteranges; boundary={boundary}'
+                    response.content_length = (sum(len(part) + end - start + 1 for part, start, end in parts)
+                                               + 2 * (len(parts) - 1) + len(closing))
+                    response.last_modified = stat.st_mtime
+                    await response.prepare(request)
+                    for i, (part, start, end) in enumerate(parts):
+                        await response.write(part if i == 0 else b'\r\n' + part)
+                        await self._write_file_range(response, f, start, end, mapping)
+                    await response.write(closing)
+                await response.write_eof()
+            finally:
+                if mapping is not None:
+                    close_mapping(mapping)
+        return response
+
+    @staticmethod
+    def _map_file(f, ranges: Optional[list]):
+        """Map file into memory and advise the kernel to read ahead the requested ranges."""
+        mapping = map_file(f)
+        if mapping is not None:
+            if ranges:
+                advise_mapping(mapping, 'RANDOM')
+                for start, end in ranges:
+                    advise_mapping(mapping, 'WILLNEED', start, end - start + 1)
+            else:
+                advise_mapping(mapping, 'SEQUENTIAL')
+                advise_mapping(mapping, 'WILLNEED')
+        return mapping
+
+    async def _write_file_range(self, response: web.StreamResponse, f, start: int, end: int, mapping=None) -> None:
+        """Send file content between `start` and `end` (inclusive) in blocks of `chunk_size` bytes.
+
+        If file is memory mapped, blocks are slices of the mapping, otherwise they are read in the I/O pool.
+        """
+        if mapping is not None:
+            with memoryview(mapping) as view:
+                for offset in range(start, end + 1, self.chunk_size):
+                    await response.write(view[offset:min(offset + self.chunk_size, end + 1)])
+            return
+        offset = start
+        while offset <= end:
+            chunk = await self.executor.run(read_file_chunk, f, offset, min(self.chunk_size, end - offset + 1))
+            if not chunk:
+                break
+            offset += len(chunk)
+            await response.write(chunk)
 
     async def create_file(self, request: web.Request, *args, **kwargs) -> web.Response:
         """Coroutine for creating file.
 
+        Request body is written to a temporary file in blocks of `chunk_size` bytes as it arrives,
+        then the file is published under its final name.
+
         Args:
-            request (Request): aiohttp request, contains JSON in body. JSON format:
-            {
-                'filename': 'string. filename',
-                'content': 'string. Content string. Optional',
-            }.
+            request (Request): aiohttp request, contains filename and file content in body.
 
         Returns:
             Response: JSON response with success status and data or error status and error message.
         """
         try:
             filename = request.match_info.get('filename', '')
-            content = await request.read()
+            root = self.get_root(request)
+            f = await self.executor.run(FileService.open_new_file, filename, root)
+            try:
+                async for chunk in request.content.iter_chunked(self.chunk_size):
+                    await self.executor.run(f.write, chunk)
+                await self.executor.run(FileService.publish_file, f, filename, root)
+            except BaseException:
+                FileService.discard_file(f, root)
+                raise
             data = {'status': 'success'}
-            data.update(FileService.create_file(filename, content))
+            data.update(await self.executor.run(FileService.get_file_data, filename, root=root))
         except (RuntimeError, ValueError) as ex:
             data = {'status': 'error', 'message': str(ex), 'operation': 'creating file'}
         except Exception as ex:
@@ -131,8 +756,9 @@ class WebHandler:
         """
         try:
             filename = request.match_info.get('filename', '')
-            data = {'status': 'success', 'location': os.path.join(os.getcwd(), filename)}
-            FileService.delete_file(filename)
+            root = self.get_root(request)
+            data = {'status': 'success', 'location': os.path.join(root.directory, filename)}
+            await self.executor.run(FileService.delete_file, filename, root)
         except (RuntimeError, ValueError) as ex:
             data = {'status': 'error', 'message': str(ex), 'operation': 'deleting file'}
         except Exception as ex:
@@ -140,6 +766,434 @@ class WebHandler:
             data = {'status': 'fatal error', }
         return self.construct_response(data)
 
+    async def create_upload(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for starting upload of a new file in chunks.
+
+        Args:
+            request (Request): aiohttp request, contains filename and query parameters: size (size of
+                the file in bytes), optional chunk_size (multiple of 64 KiB, 8 MiB by default) and
+                sha256 (expected hex digest of the content, checked on commit, required there if it isn't
+                given here).
+
+        Returns:
+            Response: JSON response with success status and upload description (upload_id, filename,
+            size, chunk_size, chunks, received, missing) or error status and error message.
+        """
+        try:
+            filename = request.match_info.get('filename', '')
+            query = request.query
+            if 'size' not in query:
+                raise ValueError('Size of the file is required!')
+            chunk_size = int(query['chunk_size']) if 'chunk_size' in query else None
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.create_upload, filename, int(query['size']), chunk_size,
+                                              query.get('sha256'), self.get_root(request))}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'starting upload'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def get_upload(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for getting description of upload, e.g. to find chunks to be sent after a failure.
+
+        Args:
+            request (Request): aiohttp request, contains filename and upload id.
+
+        Returns:
+            Response: JSON response with success status and upload description or error status and error message.
+        """
+        try:
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.get_upload, request.match_info.get('filename', ''),
+                                              request.match_info.get('upload_id', ''), self.get_root(request))}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'getting upload'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def put_upload_chunk(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for storing a chunk of upload.
+
+        Body is streamed to the file at the position of the chunk, so chunks of the same upload can be
+        sent over several connections at once. The chunk is marked as received only if the whole body
+        has the right size.
+
+        Args:
+            request (Request): aiohttp request, contains filename, upload id, chunk index and chunk in body.
+
+        Returns:
+            Response: JSON response with success status, chunk index and size or error status and error message.
+        """
+        try:
+            index = int(request.match_info.get('index', ''))
+            f = await self.executor.run(FileService.open_upload_chunk, request.match_info.get('filename', ''),
+                                        request.match_info.get('upload_id', ''), index, self.get_root(request))
+            try:
+                async for chunk in request.content.iter_chunked(self.chunk_size):
+                    await self.executor.run(f.write, chunk)
+                await self.executor.run(f.close)
+            except BaseException:
+                f.discard()
+                raise
+            data = {'status': 'success', 'index': index, 'size': f.size}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'storing chunk'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def commit_upload(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for creating file from received chunks of upload.
+
+        Args:
+            request (Request): aiohttp request, contains filename, upload id and optional query parameter
+                sha256 (expected hex digest of the content, the one given on start by default).
+
+        Returns:
+            Response: JSON response with success status and file info or error status and error message.
+        """
+        try:
+            filename = request.match_info.get('filename', '')
+            data = {'status': 'success',
+                    **await self.executor.run(FileService.commit_upload, filename,
+                                              request.match_info.get('upload_id', ''), request.query.get('sha256'),
+                                              self.get_root(request))}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'committing upload'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def abort_upload(self, request: web.Request, *args, **kwargs) -> web.Response:
+        """Coroutine for cancelling upload and removing its chunks.
+
+        Args:
+            request (Request): aiohttp request, contains filename and upload id.
+
+        Returns:
+            Response: JSON response with success status or error status and error message.
+        """
+        try:
+            await self.executor.run(FileService.abort_upload, request.match_info.get('filename', ''),
+                                    request.match_info.get('upload_id', ''), self.get_root(request))
+            data = {'status': 'success'}
+        except (RuntimeError, ValueError) as ex:
+            data = {'status': 'error', 'message': str(ex), 'operation': 'aborting upload'}
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            data = {'status': 'fatal error', }
+        return self.construct_response(data)
+
+    async def batch(self, request: web.Request, *args, **kwargs) -> web.StreamResponse:
+        """Coroutine for running many file operations in one request.
+
+        Request body is NDJSON, one operation per line:
+        {"op": "create", "name": "string", "content": "string"} or with "content_base64" for binary data;
+        {"op": "delete", "name": "string"};
+        {"op": "stat", "name": "string"}.
+
+        Operations run in the I/O pool, up to `batch_parallelism` at once, while the body is still being
+        received. Operations on the same name run in order of lines. Response is NDJSON with one result
+        per operation in order of completion: "index" (number of the line), "op", "name", "status" and
+        either info about file (without content) or error "message".
+
+        Args:
+            request (Request): aiohttp request, contains NDJSON with operations in body.
+
+        Returns:
+            StreamResponse: NDJSON stream of results or JSON response with error status and error message.
+        """
+        try:
+            root = self.get_root(request)
+        except ValueError as ex:
+            return self.construct_response({'status': 'error', 'message': str(ex), 'operation': 'running batch'})
+        response = web.StreamResponse()
+        response.content_type = NDJSON_CONTENT_TYPE
+        await response.prepare(request)
+        slots = asyncio.Semaphore(self.batch_parallelism)
+        pending = set()
+        last_by_name = {}
+
+        async def write_done(tasks):
+            for task in tasks:
+                pending.discard(task)
+                await response.write((json.dumps(task.result()) + '\n').encode())
+
+        def forget(task, name):
+            slots.release()
+            # Only names with running operations are kept, so memory doesn't grow with the batch.
+            if last_by_name.get(name) is task:
+                del last_by_name[name]
+
+        index = 0
+        try:
+            async for line in self._iter_lines(request.content):
+                if not line.strip():
+                    continue
+                await slots.acquire()
+                operation = self._parse_batch_operation(line)
+                name = operation.get('name')
+                task = asyncio.ensure_future(self._run_batch_operation(index, operation, root,
+                                                                       last_by_name.get(name)))
+                task.add_done_callback(functools.partial(forget, name=name))
+                pending.add(task)
+                last_by_name[name] = task
+                index += 1
+                await write_done([task for task in pending if task.done()])
+        except ValueError as ex:
+            # Rest of the body can't be split into operations, results of started ones are still sent.
+            logging.error(f'Cannot read batch: {ex}.')
+            await response.write((json.dumps({'index': index, 'status': 'error', 'message': str(ex)}) + '\n').encode())
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await write_done(done)
+        await response.write_eof()
+        return response
+
+    async def _iter_lines(self, content: StreamReader) -> AsyncIterator[bytes]:
+        """Split request body into lines of at most `MAX_BATCH_LINE` bytes.
+
+        Raises:
+            ValueError: if a line is too long.
+        """
+        buffer = bytearray()
+        async for chunk in content.iter_chunked(self.chunk_size):
+            start = len(buffer)
+            buffer += chunk
+            end = buffer.find(b'\n', start)
+            while end >= 0:
+                yield bytes(buffer[:end])
+                del buffer[:end + 1]
+                end = buffer.find(b'\n')
+            if len(buffer) > self.MAX_BATCH_LINE:
+                raise ValueError(f'Line {len(buffer)} bytes long exceeds limit of {self.MAX_BATCH_LINE} bytes')
+        if buffer:
+            yield bytes(buffer)
+
+    @staticmethod
+    def _parse_batch_operation(line: bytes) -> dict:
+        """Parse operation of batch, invalid one is returned as dict with "error" key."""
+        try:
+            operation = json.loads(line)
+        except ValueError as ex:
+            return {'error': f'Invalid JSON: {ex}'}
+        if not isinstance(operation, dict):
+            return {'error': 'Operation must be a JSON object'}
+        if operation.get('op') not in ('create', 'delete', 'stat'):
+            return {**operation, 'error': f'Unknown operation {operation.get("op")}'}
+        if not isinstance(operation.get('name'), str):
+            return {**operation, 'error': 'Operation must have a name'}
+        return operation
+
+    async def _run_batch_operation(self, index: int, operation: dict, root: Root,
+                                   previous: Optional[asyncio.Future] = None) -> dict:
+        """Run single operation of batch and build its result."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        op, name = operation.get('op'), operation.get('name')
+        result = {'index': index, 'op': op, 'name': name}
+        try:
+            if 'error' in operation:
+                raise ValueError(operation['error'])
+            if op == 'create':
+                if 'content_base64' in operation:
+                    if not isinstance(operation['content_base64'], str):
+                        raise ValueError('Base64 content must be a string')
+                    content = base64.b64decode(operation['content_base64'], validate=True)
+                else:
+                    content = operation.get('content', '')
+                    if not isinstance(content, str):
+                        raise ValueError('Content must be a string')
+                info = await self.executor.run(FileService.create_file, name, content, root, verbose=False)
+            elif op == 'delete':
+                await self.executor.run(FileService.delete_file, name, root)
+                info = {}
+            else:
+                info = await self.executor.run(FileService.get_file_data, name, root=root)
+            result.update(info, status='success')
+        except (RuntimeError, ValueError) as ex:
+            result.update(status='error', message=str(ex))
+        except Exception as ex:
+            logging.error(f'Unexpected exception {str(ex)}.')
+            result.update(status='fatal error')
+        return result
+
+    async def extract_archive(self, request: web.Request, *args, **kwargs) -> web.StreamResponse:
+        """Coroutine for creating files from an uploaded archive.
+
+        Request body is tar (plain or compressed) or zip archive, chosen by `format` query parameter
+        or application/zip content type. Tar archive is unpacked while it is being received: members
+        are decompressed in a thread of a dedicated pool of `EXTRACT_THREADS` threads (archives over
+        the limit wait for a free thread), small files are created in the I/O pool up to
+        `batch_parallelism` at once and large files are written block by block while the next blocks
+        are decompressed. Member names are checked by the same rules as filenames of `create_file`,
+        existing files are never overwritten, members other than regular files are rejected.
+
+        Response is NDJSON with one result per member in order of completion: "index", "name",
+        "status" and either info about created file or error "message".
+
+        Args:
+            request (Request): aiohttp request, contains archive in body.
+
+        Returns:
+            StreamResponse: NDJSON stream of results or JSON response with error status and error message.
+        """
+        try:
+            root = self.get_root(request)
+            archive_format = request.query.get('format', 'zip' if request.content_type == 'application/zip' else 'tar')
+            if archive_format not in ('tar', 'zip'):
+                raise ValueError(f'Unknown archive format {archive_format}, expected tar or zip')
+        except ValueError as ex:
+            return self.construct_response({'status': 'error', 'message': str(ex), 'operation': 'extracting archive'})
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(self.EXTRACT_QUEUE)
+        stop = threading.Event()
+
+        def emit(*event) -> None:
+            if stop.is_set():
+                raise _ExtractAborted()
+            asyncio.run_coroutine_threadsafe(events.put(event), loop).result()
+
+        reader = _BodyReader(request.content, loop, stop, self.chunk_size)
+        parser = loop.run_in_executor(self._extract_pool, self._read_archive, reader, archive_format, emit)
+        response = web.StreamResponse()
+        response.content_type = NDJSON_CONTENT_TYPE
+        slots = asyncio.Semaphore(self.batch_parallelism)
+        pending = set()
+        large = None
+
+        async def write_result(result: dict) -> None:
+            await response.write((json.dumps(result) + '\n').encode())
+
+        async def write_done(tasks) -> None:
+            for task in tasks:
+                pending.discard(task)
+                await write_result(task.result())
+
+        try:
+            await response.prepare(request)
+            index = 0
+            while True:
+                event = await events.get()
+                kind = event[0]
+                if kind == 'done':
+                    break
+                elif kind == 'error':
+                    if large is not None:
+                        # Archive ended in the middle of a large member.
+                        if 'file' in large:
+                            FileService.discard_file(large.pop('file'), root)
+                        await write_result({**large['result'], 'status': 'error', 'message': event[1]})
+                        large = None
+                    else:
+                        await write_result({'index': index, 'status': 'error', 'message': event[1]})
+                elif kind == 'file':
+                    await slots.acquire()
+                    task = asyncio.ensure_future(self._extract_file(index, event[1], event[2], root))
+                    task.add_done_callback(lambda _: slots.release())
+                    pending.add(task)
+                    index += 1
+                elif kind == 'start':
+                    large = await self._start_large_file(index, event[1], root)
+                    index += 1
+                elif kind == 'data':
+                    if 'file' in large:
+                        try:
+                            await self.executor.run(large['file'].write, event[1])
+                        except (RuntimeError, OSError) as ex:
+                            FileService.discard_file(large.pop('file'), root)
+                            large['result'].update(status='error', message=str(ex))
+                elif kind == 'end':
+                    await write_result(await self._finish_large_file(large, root))
+                    large = None
+                await write_done([task for task in pending if task.done()])
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await write_done(done)
+            await response.write_eof()
+        finally:
+            stop.set()
+            if large is not None and 'file' in large:
+                FileService.discard_file(large['file'], root)
+            # Unblock the reading thread, which might wait for a place in the queue.
+            while not parser.done():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait([parser, getter], return_when=asyncio.FIRST_COMPLETED)
+                getter.cancel()
+            parser.exception()
+        return response
+
+    def _read_archive(self, reader: BinaryIO, archive_format: str, emit: Callable) -> None:
+        """Read archive in a separate thread and pass its members to `extract_archive` via `emit`."""
+        try:
+            for name, size, content in FileService.iter_archive(reader, archive_format):
+                if content is None:
+                    emit('file', name, None)
+                elif size <= self.chunk_size:
+                    emit('file', name, content.read())
+                else:
+                    emit('start', name)
+                    for data in iter(lambda: content.read(self.chunk_size), b''):
+                        emit('data', data)
+                    emit('end')
+            emit('done')
+        except _ExtractAborted:
+            pass
+        except Exception as ex:
+            if isinstance(ex, (ValueError, OSError, EOFError, zlib.error, tarfile.TarError, zipfile.BadZipFile)):
+                logging.error(f'Cannot read archive: {ex}.')
+            else:
+                logging.error(f'Unexpected exception {str(ex)}.')
+            # The event loop waits for 'done' in any case.
+            try:
+                emit('error', f'Cannot read archive: {ex}')
+                emit('done')
+            except _ExtractAborted:
+                pass
+
+    async def _extract_file(self, index: int, name: str, content: Optional[bytes], root: Root) -> dict:
+        """Create small file from archive member and build its result."""
+        result = {'index': index, 'name': name}
+        try:
+            if content is None:
+                raise ValueError('Only regular files can be extracted')
+            filename = FileService.archive_member_name(name)
+            result.update(await self.executor.run(FileService.create_file, filename, content, root, verbose=False),
+                          status='success')
+        except (RuntimeError, ValueError, OSError) as ex:
+            result.update(status='error', message=str(ex))
+        return result
+
+    async def _start_large_file(self, index: int, name: str, root: Root) -> dict:
+        """Open temporary file for large archive member, returns its state for `_finish_large_file`."""
+        large = {'result': {'index': index, 'name': name}}
+        try:
+            large['filename'] = FileService.archive_member_name(name)
+            large['file'] = await self.executor.run(FileService.open_new_file, large['filename'], root)
+        except (RuntimeError, ValueError, OSError) as ex:
+            large['result'].update(status='error', message=str(ex))
+        return large
+
+    async def _finish_large_file(self, large: dict, root: Root) -> dict:
+        """Publish large archive member written to temporary file and build its result."""
+        result = large['result']
+        if 'file' not in large:
+            return result
+        try:
+            await self.executor.run(FileService.publish_file, large.pop('file'), large['filename'], root)
+            info = await self.executor.run(FileService.get_file_data, large['filename'], root=root)
+            del info['edit_date']
+            result.update(info, status='success')
+        except (RuntimeError, ValueError, OSError) as ex:
+            result.update(status='error', message=str(ex))
+        return result
+
     @staticmethod
     def construct_response(data: dict):
         if data['status'] == 'error':
@@ -148,3 +1202,30 @@ class WebHandler:
         elif data['status'] == 'fatal_error':
             data['message'] = f'Unexpected error has occurred. Please contact tech support.'
         return web.json_response(data)
+
+
+class _ExtractAborted(Exception):
+    """Extraction of archive was stopped before the whole archive was read."""
+
+
+class _BodyReader:
+    """Blocking file object reading request body, for use from a thread other than the event loop."""
+
+    def __init__(self, content: StreamReader, loop: asyncio.AbstractEventLoop, stop: threading.Event,
+                 chunk_size: int = FileService.CHUNK_SIZE):
+        self.content = content
+        self.loop = loop
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self._buffer = b''
+
+    def read(self, size: int = -1) -> bytes:
+        # Body is received in large blocks, so small reads of tarfile don't cost a round trip each.
+        if not self._buffer and not self.stop.is_set():
+            self._buffer = asyncio.run_coroutine_threadsafe(self.content.read(max(size, self.chunk_size)),
+                                                            self.loop).result()
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
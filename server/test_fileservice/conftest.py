@@ -5,6 +5,8 @@ import pytest
 import requests
 
 DOMAIN = 'http://127.0.0.1:8080'
+# Client of the test server, keeps the session cookie set by change_dir.
+http = requests.Session()
 
 
 @pytest.fixture()
@@ -61,13 +63,13 @@ def test_files(tmpdir):
 
 @pytest.fixture()
 def test_file_web(tmpdir):
-    requests.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    http.post(f'{DOMAIN}/change_dir/{tmpdir}')
     yield create_single_test_file(tmpdir, 'test.txt')
 
 
 @pytest.fixture()
 def test_files_web(tmpdir):
-    requests.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    http.post(f'{DOMAIN}/change_dir/{tmpdir}')
     files = create_test_files(tmpdir)
     yield files
 
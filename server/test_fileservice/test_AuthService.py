@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from server.AuthService import AuthService, DecisionCache
+from server.FileService import open_root
+from server.WebHandler import WebHandler
+
+
+@pytest.fixture()
+def auth(tmpdir):
+    service = AuthService(str(tmpdir.join('auth.db')))
+    yield service
+    service.close()
+
+
+class TestDecisionCache:
+    def test_expiration(self):
+        cache = DecisionCache(ttl=0.05)
+        cache.put('key', True)
+        assert cache.get('key') is True
+        time.sleep(0.1)
+        assert cache.get('key') is None
+
+    def test_lru_eviction(self):
+        cache = DecisionCache(max_entries=2)
+        cache.put(1, True)
+        cache.put(2, True)
+        cache.get(1)
+        cache.put(3, True)
+        assert cache.get(2) is None
+        assert cache.get(1) is True
+
+
+class TestAuthService:
+    def test_authorize(self, auth, tmpdir):
+        token = auth.add_user('user')
+        auth.grant('user', str(tmpdir), 'docs/', 'write')
+        auth.grant('user', '*', 'public', 'read')
+        root = str(tmpdir)
+        assert auth.authorize(token, root, 'docs/1.txt', 'write') is True
+        assert auth.authorize(token, root, 'public.txt', 'read') is True
+        assert auth.authorize(token, '/other', 'public.txt', 'read') is True
+        assert auth.authorize(token, root, 'public.txt', 'write') is False
+        assert auth.authorize(token, root, '', 'read') is False
+        assert auth.authorize('wrong', root, 'docs/1.txt', 'read') is None
+
+    def test_cache_invalidation(self, auth, tmpdir):
+        token = auth.add_user('user')
+        root = str(tmpdir)
+        assert auth.authorize(token, root, '1.txt', 'read') is False
+        auth.grant('user', root)
+        assert auth.authorize(token, root, '1.txt', 'read') is True
+        assert auth.authorize(token, root, '1.txt', 'read') is True
+        assert auth.cache.stats()['hits'] == 1
+        auth.revoke('user', root)
+        assert auth.authorize(token, root, '1.txt', 'read') is False
+        new_token = auth.reset_token('user')
+        assert auth.authorize(token, root, '1.txt', 'read') is None
+        assert auth.authorize(new_token, root, '1.txt', 'read') is False
+
+    def test_users(self, auth):
+        auth.add_user('user')
+        auth.grant('user', '*', '', 'write')
+        with pytest.raises(RuntimeError):
+            auth.add_user('user')
+        assert auth.list_users() == [{'name': 'user', 'policies': [{'root': '*', 'prefix': '', 'access': 'write'}]}]
+        auth.remove_user('user')
+        assert auth.list_users() == []
+        with pytest.raises(RuntimeError):
+            auth.remove_user('user')
+        with pytest.raises(RuntimeError):
+            auth.grant('user', '*')
+        with pytest.raises(RuntimeError):
+            auth.revoke('user', '*')
+
+
+def test_auth_middleware(auth, test_files, tmpdir):
+    token = auth.add_user('user')
+    auth.grant('user', str(tmpdir), '1', 'read')
+    handler = WebHandler(root=open_root(str(tmpdir)), auth=auth)
+    app = web.Application(middlewares=[handler.auth_middleware])
+    app.add_routes([web.get('/files', handler.get_files),
+                    web.get('/{filename}', handler.get_file_data),
+                    web.delete('/delete/{filename}', handler.delete_file),
+                    web.post('/change_dir/{path:.+}', handler.change_dir)])
+
+    async def check():
+        async with TestClient(TestServer(app)) as client:
+            headers = {'Authorization': f'Bearer {token}'}
+            assert (await client.get('/1.txt')).status == 401
+            assert (await client.get('/1.txt', headers={'Authorization': 'Bearer wrong'})).status == 401
+            response = await client.get('/1.txt', headers=headers)
+            assert (await response.json())['status'] == 'success'
+            assert (await client.get('/2.txt', headers=headers)).status == 403
+            assert (await client.get('/files', headers=headers)).status == 403
+            assert (await client.delete('/delete/1.txt', headers=headers)).status == 403
+
+    asyncio.run(check())
+
+
+def test_auth_change_dir(auth, test_files, tmpdir):
+    token = auth.add_user('user')
+    auth.grant('user', str(tmpdir), '', 'write')
+    auth.grant('user', str(tmpdir.join('allowed')), '', 'write')
+    handler = WebHandler(root=open_root(str(tmpdir)), auth=auth)
+    app = web.Application(middlewares=[handler.auth_middleware])
+    app.add_routes([web.post('/change_dir/{path:.+}', handler.change_dir)])
+
+    async def check():
+        async with TestClient(TestServer(app)) as client:
+            headers = {'Authorization': f'Bearer {token}', 'X-Session': 'session'}
+            assert (await client.post(f'/change_dir/{tmpdir.join("denied")}', headers=headers)).status == 403
+            response = await client.post(f'/change_dir/{tmpdir.join("allowed")}', headers=headers)
+            assert (await response.json())['status'] == 'success'
+
+    asyncio.run(check())
+    assert not tmpdir.join('denied').exists() and tmpdir.join('allowed').isdir()
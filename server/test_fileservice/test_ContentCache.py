@@ -0,0 +1,106 @@
+import os
+import sys
+
+import pytest
+
+from server.ContentCache import ContentCache
+from server.FileService import (create_file,
+                                delete_file,
+                                disable_content_cache,
+                                enable_content_cache,
+                                get_content_cache_stats,
+                                get_file_data)
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return os.stat(path)
+
+
+class TestContentCache:
+    def test_get_put(self, tmpdir):
+        path = str(tmpdir.join('test.txt'))
+        stat = write_file(path, b'12345')
+        cache = ContentCache()
+        assert cache.get(path, stat) is None
+        cache.put(path, stat, '12345')
+        assert cache.get(path, stat) == '12345'
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+        assert cache.stats()['size'] == sys.getsizeof('12345')
+
+    def test_size_in_memory(self, tmpdir):
+        path = str(tmpdir.join('test.txt'))
+        content = '\U0001f600' * 100
+        stat = write_file(path, content.encode())
+        cache = ContentCache(max_bytes=stat.st_size)
+        # Decoded text takes more memory than the file, it doesn't fit into the budget.
+        cache.put(path, stat, content)
+        assert cache.stats()['entries'] == 0
+        cache = ContentCache()
+        cache.put(path, stat, content)
+        assert cache.stats()['size'] == sys.getsizeof(content) > stat.st_size
+
+    def test_changed_file(self, tmpdir):
+        path = str(tmpdir.join('test.txt'))
+        cache = ContentCache()
+        cache.put(path, write_file(path, b'12345'), '12345')
+        assert cache.get(path, write_file(path, b'123456')) is None
+
+    def test_lru_eviction(self, tmpdir):
+        cache = ContentCache(max_bytes=2 * sys.getsizeof('12345'))
+        paths = [str(tmpdir.join(f'{number}.txt')) for number in range(3)]
+        stats = [write_file(path, b'12345') for path in paths]
+        cache.put(paths[0], stats[0], '12345')
+        cache.put(paths[1], stats[1], '12345')
+        cache.get(paths[0], stats[0])
+        cache.put(paths[2], stats[2], '12345')
+        assert cache.get(paths[1], stats[1]) is None
+        assert cache.get(paths[0], stats[0]) == '12345'
+        assert cache.stats()['evictions'] == 1
+        assert cache.stats()['size'] == 2 * sys.getsizeof('12345')
+
+    def test_large_file_bypass(self, tmpdir):
+        path = str(tmpdir.join('test.txt'))
+        stat = write_file(path, b'12345')
+        cache = ContentCache(max_file_size=4)
+        cache.put(path, stat, '12345')
+        assert cache.get(path, stat) is None
+        assert cache.stats()['entries'] == 0
+
+    def test_invalidate(self, tmpdir):
+        path = str(tmpdir.join('test.txt'))
+        stat = write_file(path, b'12345')
+        cache = ContentCache()
+        cache.put(path, stat, '12345')
+        cache.invalidate(path)
+        assert cache.get(path, stat) is None
+        assert cache.stats()['size'] == 0
+
+
+class TestFileServiceContentCache:
+    @pytest.fixture()
+    def cached_dir(self, test_files):
+        enable_content_cache()
+        yield test_files
+        disable_content_cache()
+
+    def test_get_file_data_from_cache(self, cached_dir):
+        assert get_file_data(cached_dir[0], verbose=True)['content'] == '12345'
+        assert get_file_data(cached_dir[0], verbose=True)['content'] == '12345'
+        stats = get_content_cache_stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+    def test_external_change(self, cached_dir):
+        get_file_data(cached_dir[0], verbose=True)
+        write_file(cached_dir[0], b'1234567')
+        assert get_file_data(cached_dir[0], verbose=True)['content'] == '1234567'
+
+    def test_create_and_delete_file(self, cached_dir):
+        create_file('new.txt', b'123')
+        assert get_content_cache_stats()['entries'] == 1
+        delete_file('new.txt')
+        assert get_content_cache_stats()['entries'] == 0
+        with pytest.raises(RuntimeError):
+            get_file_data('new.txt', verbose=True)
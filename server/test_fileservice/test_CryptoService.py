@@ -0,0 +1,147 @@
+import os
+
+import pytest
+
+from server.CryptoService import BLOCK_OVERHEAD, BLOCK_SIZE, HEADER_SIZE, FileCipher
+from server.FileService import (create_file,
+                                disable_encryption,
+                                enable_encryption,
+                                get_file_data,
+                                get_files,
+                                get_files_page,
+                                open_file)
+from utils.file_utils import map_file, read_file_chunk
+
+KEY = bytes(range(32))
+
+
+def encrypt(path, content, key=KEY):
+    with FileCipher(key).open_writer(open(path, 'wb')) as f:
+        f.write(content)
+
+
+def open_encrypted(path, key=KEY):
+    return FileCipher(key).open_reader(open(path, 'rb'))
+
+
+class TestFileCipher:
+    @pytest.mark.parametrize('size', [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 1, 3 * BLOCK_SIZE + 5])
+    def test_round_trip(self, tmpdir, size):
+        path = str(tmpdir.join('test.bin'))
+        content = os.urandom(size)
+        encrypt(path, content)
+        assert FileCipher.plaintext_size(os.path.getsize(path)) == size
+        with open_encrypted(path) as f:
+            assert f.size == size
+            assert f.read() == content
+
+    def test_read_at(self, tmpdir):
+        path = str(tmpdir.join('test.bin'))
+        content = os.urandom(3 * BLOCK_SIZE + 5)
+        encrypt(path, content)
+        with open_encrypted(path) as f:
+            for offset, size in ((0, 10), (BLOCK_SIZE - 3, 10), (2 * BLOCK_SIZE, BLOCK_SIZE + 100), (len(content), 1)):
+                assert read_file_chunk(f, offset, size) == content[offset:offset + size]
+            assert map_file(f) is None
+
+    def test_not_encrypted(self, test_file):
+        with open(test_file[0], 'rb') as f:
+            assert FileCipher(KEY).open_reader(f) is None
+
+    def test_wrong_key(self, tmpdir):
+        path = str(tmpdir.join('test.bin'))
+        encrypt(path, b'12345')
+        with pytest.raises(ValueError):
+            open_encrypted(path, bytes(32))
+
+    @pytest.mark.parametrize('size, cut', [(2 * BLOCK_SIZE + 1, 17), (2 * BLOCK_SIZE, 1), (0, 6), (10, 16)])
+    def test_truncated(self, tmpdir, size, cut):
+        path = str(tmpdir.join('test.bin'))
+        encrypt(path, os.urandom(size))
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - cut)
+        with pytest.raises(ValueError):
+            open_encrypted(path)
+
+    def test_truncated_at_block(self, tmpdir):
+        path = str(tmpdir.join('test.bin'))
+        encrypt(path, os.urandom(2 * BLOCK_SIZE))
+        with open(path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + BLOCK_SIZE + BLOCK_OVERHEAD)
+        assert FileCipher.plaintext_size(os.path.getsize(path)) == BLOCK_SIZE
+        with pytest.raises(ValueError):
+            open_encrypted(path)
+
+    def test_block_encryptor(self, tmpdir):
+        path = str(tmpdir.join('test.bin'))
+        content = os.urandom(2 * BLOCK_SIZE + 5)
+        cipher = FileCipher(KEY)
+        header = cipher.new_header()
+        encryptor = cipher.open_block_writer(header, len(content))
+        with open(path, 'wb') as f:
+            f.write(header)
+            for offset in (BLOCK_SIZE, 2 * BLOCK_SIZE, 0):
+                position, sealed = encryptor.encrypt_at(offset, content[offset:offset + BLOCK_SIZE])
+                f.seek(position)
+                f.write(sealed)
+        # Encrypting the same block again never reuses its nonce.
+        assert encryptor.encrypt_at(0, content[:BLOCK_SIZE]) != encryptor.encrypt_at(0, content[:BLOCK_SIZE])
+        assert os.path.getsize(path) == FileCipher.stored_size(len(content))
+        with open_encrypted(path) as f:
+            assert f.read() == content
+
+    def test_invalid_key(self):
+        with pytest.raises(ValueError):
+            FileCipher(b'12345')
+
+
+class TestFileServiceEncryption:
+    @pytest.fixture()
+    def encrypted_dir(self, test_files):
+        enable_encryption(KEY)
+        yield test_files
+        disable_encryption()
+
+    def test_create_file(self, encrypted_dir):
+        data = create_file('new.txt', b'123')
+        assert (data['content'], data['size']) == ('123', 3)
+        assert os.path.getsize('new.txt') == HEADER_SIZE + 3 + BLOCK_OVERHEAD
+        with open('new.txt', 'rb') as f:
+            assert b'123' not in f.read()
+        assert {file['name']: file['size'] for file in get_files()}['new.txt'] == 3
+
+    def test_open_file(self, encrypted_dir):
+        content = os.urandom(BLOCK_SIZE + 10)
+        create_file('new.bin', content, verbose=False)
+        with open_file('new.bin') as f:
+            assert f.size == len(content)
+            assert read_file_chunk(f, BLOCK_SIZE - 5, 10) == content[BLOCK_SIZE - 5:BLOCK_SIZE + 5]
+
+    def test_plain_file(self, encrypted_dir):
+        assert get_file_data(encrypted_dir[0], verbose=True)['content'] == '12345'
+
+    def test_mixed_sizes(self, encrypted_dir):
+        create_file('new.txt', b'123')
+        with open('plain.bin', 'wb') as f:
+            f.write(bytes(100))
+        sizes = {file['name']: file['size'] for file in get_files()}
+        assert sizes == {**dict.fromkeys(encrypted_dir, 5), 'new.txt': 3, 'plain.bin': 100}
+        assert get_file_data(encrypted_dir[0])['size'] == 5
+        assert [file['name'] for file in get_files_page(sort='size')['files']][0] == 'new.txt'
+        assert [file['name'] for file in get_files_page(max_size=4)['files']] == ['new.txt']
+
+    def test_encrypted_files_cache(self, encrypted_dir, monkeypatch):
+        import server.FileService as FileService
+        monkeypatch.setattr(FileService, '_encrypted_files', type(FileService._encrypted_files)())
+        monkeypatch.setattr(FileService, '_file_versions_max', 2)
+        create_file('new.txt', b'123')
+        for name in [*encrypted_dir, 'new.txt']:
+            os.utime(name, (1, 1))
+        assert {file['name']: file['size'] for file in get_files()}['new.txt'] == 3
+        assert len(FileService._encrypted_files) == 2
+        # The least recently used entries are evicted, the cache isn't dropped as a whole.
+        keys = {name: (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                for name, stat in ((name, os.stat(name)) for name in [*encrypted_dir, 'new.txt'])}
+        assert get_file_data('new.txt')['size'] == 3
+        assert get_file_data(encrypted_dir[0])['size'] == 5
+        assert list(FileService._encrypted_files) == [keys['new.txt'], keys[encrypted_dir[0]]]
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+import pytest
+import requests
+
+from client.DownloadClient import DownloadClient
+from server.test_fileservice.conftest import DOMAIN, http
+
+
+@pytest.fixture()
+def client(test_files_web):
+    with DownloadClient(DOMAIN, connections=4, segment_size=64 * 1024, retries=2,
+                        session_id=http.cookies['session']) as download_client:
+        yield download_client
+
+
+@pytest.fixture()
+def local_dir(tmp_path_factory):
+    # Not tmp_path, which is the working directory of the server.
+    return tmp_path_factory.mktemp('download')
+
+
+@pytest.fixture()
+def remote_file(test_files_web):
+    content = os.urandom(1024 * 1024 + 5)
+    data = http.post(f'{DOMAIN}/create/big.bin', data=content).json()
+    assert data['status'] == 'success'
+    yield 'big.bin', content
+
+
+class TestDownloadClient:
+    def test_download(self, client, remote_file, local_dir):
+        filename, content = remote_file
+        result = client.download(filename, str(local_dir / 'big.bin'))
+        assert result['verified'] and result['sha256'] == hashlib.sha256(content).hexdigest()
+        assert (local_dir / 'big.bin').read_bytes() == content
+        assert os.listdir(local_dir) == ['big.bin']
+
+    def test_retry(self, client, remote_file, local_dir, monkeypatch):
+        filename, content = remote_file
+        get = client.session.get
+        failures = []
+
+        def flaky_get(url, **kwargs):
+            if 'Range' in kwargs.get('headers', {}) and len(failures) < 3:
+                failures.append(url)
+                raise requests.ConnectionError('Connection reset')
+            return get(url, **kwargs)
+
+        monkeypatch.setattr(client.session, 'get', flaky_get)
+        assert client.download(filename, str(local_dir / 'big.bin'))['verified']
+        assert len(failures) == 3
+
+    def test_hash_mismatch(self, client, remote_file, local_dir, monkeypatch):
+        filename, _ = remote_file
+        get_file_data = client.get_file_data
+        monkeypatch.setattr(client, 'get_file_data', lambda name: {**get_file_data(name), 'sha256': '0' * 64})
+        with pytest.raises(ValueError):
+            client.download(filename, str(local_dir / 'big.bin'))
+        assert os.listdir(local_dir) == []
+
+    def test_download_many(self, client, remote_file, local_dir):
+        results = client.download_many(['1.txt', '2.txt', 'big.bin', 'missing.txt'], str(local_dir))
+        assert [result.get('size') for result in results] == [5, 5, len(remote_file[1]), None]
+        assert 'error' in results[3]
+        assert (local_dir / '1.txt').read_bytes() == b'12345'
@@ -5,8 +5,14 @@ import pytest
 from server.FileService import (change_dir,
                                 create_file,
                                 delete_file,
+                                discard_file,
                                 get_file_data,
-                                get_files)
+                                get_files,
+                                get_files_page,
+                                open_file,
+                                open_root,
+                                open_new_file,
+                                publish_file)
 
 
 class TestChangeDir:
@@ -54,9 +60,9 @@ class TestGetFileData:
 
     def test_get_file_data_return_keys(self, test_file):
         file_data = get_file_data(test_file[0], verbose=False)
-        expected_keys = ('name', 'create_date', 'edit_date', 'size')
+        expected_keys = ('name', 'create_date', 'edit_date', 'size', 'sha256', 'xxh3_64')
         real_keys = file_data.keys()
-        assert all(key in real_keys for key in expected_keys) and len(real_keys) == 4
+        assert all(key in real_keys for key in expected_keys) and len(real_keys) == 6
 
 
 class TestGetFiles:
@@ -71,6 +77,9 @@ class TestGetFiles:
         read_file_names = sorted([file['name'] for file in get_files()])
         assert read_file_names == test_files
 
+    def test_get_files_data_same_as_get_file_data(self, test_files):
+        assert sorted(get_files(), key=lambda file: file['name']) == [get_file_data(file) for file in test_files]
+
 
 class TestCreateFile:
     @pytest.mark.parametrize('bad_name',
@@ -104,12 +113,135 @@ class TestCreateFile:
     def test_create_file_return_keys(self, tmpdir):
         file = tmpdir.join('test_file.txt')
         new_file_data = create_file(str(file), b'12345')
-        expected_keys = ('name', 'create_date', 'content', 'size')
+        expected_keys = ('name', 'create_date', 'content', 'size', 'sha256', 'xxh3_64')
         real_keys = new_file_data.keys()
-        assert all(key in real_keys for key in expected_keys) and len(real_keys) == 4
+        assert all(key in real_keys for key in expected_keys) and len(real_keys) == 6
+
+    def test_create_file_no_temp_files_left(self, tmpdir):
+        create_file(str(tmpdir.join('test_file.txt')), b'12345')
+        assert os.listdir(tmpdir) == ['test_file.txt']
+
+
+class TestPublishFile:
+    def test_publish_file(self, tmpdir):
+        file = tmpdir.join('test_file.txt')
+        f = open_new_file(str(file))
+        f.write(b'12345')
+        publish_file(f, str(file))
+        assert file.read_binary() == b'12345'
+        assert os.listdir(tmpdir) == ['test_file.txt']
+
+    def test_publish_file_already_exists(self, tmpdir):
+        file = tmpdir.join('test_file.txt')
+        f = open_new_file(str(file))
+        file.write_binary(b'old_content')
+        with pytest.raises(RuntimeError):
+            publish_file(f, str(file))
+        assert file.read_binary() == b'old_content'
+        assert os.listdir(tmpdir) == ['test_file.txt']
+
+    def test_temp_file_is_not_listed(self, tmpdir):
+        os.chdir(tmpdir)
+        f = open_new_file('test_file.txt')
+        assert get_files() == []
+        discard_file(f)
+        assert os.listdir(tmpdir) == []
 
 
 class TestDeleteFile:
     def test_delete_file(self, test_file):
         delete_file(test_file[0])
         assert not os.path.exists(test_file[0])
+
+
+class TestOpenFile:
+    def test_open_file_runtime_error(self, tmpdir):
+        file = tmpdir.join('not_existed_file.txt')
+        with pytest.raises(RuntimeError):
+            open_file(str(file))
+
+    def test_open_file_dir_runtime_error(self, tmpdir):
+        with pytest.raises(RuntimeError):
+            open_file(str(tmpdir))
+
+    def test_open_file_content(self, test_file):
+        with open_file(test_file[0]) as f:
+            assert f.read() == test_file[1]
+
+
+class TestGetFilesPage:
+    def test_get_files_page_limit(self, test_files):
+        page = get_files_page(limit=2)
+        assert [file['name'] for file in page['files']] == test_files[:2]
+        assert page['cursor'] is not None
+
+    def test_get_files_page_cursor(self, test_files):
+        page = get_files_page(limit=2)
+        page = get_files_page(limit=2, cursor=page['cursor'])
+        assert [file['name'] for file in page['files']] == test_files[2:]
+        assert page['cursor'] is None
+
+    def test_get_files_page_cursor_is_stable(self, test_files):
+        page = get_files_page(limit=1)
+        create_file('0.txt', b'0')
+        page = get_files_page(limit=5, cursor=page['cursor'])
+        assert [file['name'] for file in page['files']] == test_files[1:]
+
+    def test_get_files_page_sort_by_size(self, test_files):
+        create_file('big.txt', b'1' * 100)
+        page = get_files_page(limit=1, sort='-size')
+        assert page['files'][0]['name'] == 'big.txt'
+
+    def test_get_files_page_filters(self, test_files):
+        create_file('big.txt', b'1' * 100)
+        assert [file['name'] for file in get_files_page(prefix='b')['files']] == ['big.txt']
+        assert [file['name'] for file in get_files_page(pattern='[12].txt')['files']] == test_files[:2]
+        assert len(get_files_page(min_size=10)['files']) == 1
+        assert len(get_files_page(max_size=10)['files']) == len(test_files)
+
+    @pytest.mark.parametrize('params', [{'sort': 'color'}, {'limit': 0}, {'cursor': 'bad'}])
+    def test_get_files_page_value_error(self, test_files, params):
+        with pytest.raises(ValueError):
+            get_files_page(**params)
+
+    def test_get_files_page_cursor_of_other_sort(self, test_files):
+        page = get_files_page(limit=1, sort='size')
+        with pytest.raises(ValueError):
+            get_files_page(cursor=page['cursor'], sort='name')
+
+
+class TestOpenRoot:
+    def test_open_root_shared(self, tmpdir):
+        assert open_root(str(tmpdir)) is open_root(str(tmpdir))
+
+    def test_open_root_not_exists_without_autocreate(self, tmpdir):
+        with pytest.raises(RuntimeError):
+            open_root(str(tmpdir.join('not_existed_dir')), autocreate=False)
+
+    def test_open_root_autocreate(self, tmpdir):
+        open_root(str(tmpdir.join('new_dir')))
+        assert tmpdir.join('new_dir').isdir()
+
+    def test_root_does_not_depend_on_cwd(self, tmpdir, test_files):
+        root = open_root(str(tmpdir))
+        os.chdir(tmpdir.mkdir('other'))
+        create_file('new.txt', b'123', root=root)
+        assert tmpdir.join('new.txt').read_binary() == b'123'
+        assert sorted(file['name'] for file in get_files(root)) == sorted(test_files + ['new.txt', 'other'])
+        assert get_file_data('new.txt', verbose=True, root=root)['content'] == '123'
+        delete_file('new.txt', root=root)
+        assert not tmpdir.join('new.txt').exists()
+        assert get_files() == []
+
+    @pytest.mark.parametrize('bad_name', ['..', os.path.join('..', 'test.txt'), os.path.join('dir', 'test.txt')])
+    def test_root_name_outside(self, tmpdir, bad_name):
+        root = open_root(str(tmpdir.mkdir('root')))
+        with pytest.raises(ValueError):
+            get_file_data(bad_name, root=root)
+
+    @pytest.mark.skipif(not hasattr(os, 'symlink') or os.name == 'nt', reason='symlinks are not supported')
+    def test_root_symlink_outside(self, tmpdir, test_file):
+        root = open_root(str(tmpdir.mkdir('root')))
+        os.symlink(test_file[0], str(tmpdir.join('root', 'link.txt')))
+        with pytest.raises(RuntimeError):
+            open_file('link.txt', root=root)
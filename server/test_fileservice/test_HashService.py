@@ -0,0 +1,101 @@
+import hashlib
+import os
+
+import pytest
+
+from server import FileService
+from server.FileService import (backfill_hashes,
+                                create_file,
+                                disable_encryption,
+                                disable_metadata_index,
+                                enable_encryption,
+                                enable_metadata_index,
+                                get_file_data,
+                                get_files,
+                                get_files_page)
+from server.HashService import HASH_NAMES, hash_file, load_hashes, store_hashes
+
+SHA256_12345 = hashlib.sha256(b'12345').hexdigest()
+
+
+class TestHashService:
+    def test_store_and_load(self, test_file):
+        path, content = test_file
+        stat = os.stat(path)
+        assert store_hashes(path, {'sha256': 'abc'}, stat)
+        assert load_hashes(path, stat) == {'sha256': 'abc'}
+        with open(path, 'ab') as f:
+            f.write(b'6')
+        assert load_hashes(path, os.stat(path)) is None
+
+    def test_hash_file(self, test_file):
+        path, content = test_file
+        digests, stat = hash_file(path)
+        assert set(digests) == set(HASH_NAMES)
+        assert digests['sha256'] == hashlib.sha256(content).hexdigest()
+        assert stat.st_size == len(content)
+
+
+class TestFileServiceHashes:
+    def test_create_file(self, test_files):
+        create_file('new.txt', b'12345')
+        data = get_file_data('new.txt')
+        assert data['sha256'] == SHA256_12345
+        assert ('xxh3_64' in HASH_NAMES) == (data['xxh3_64'] is not None)
+        assert get_file_data(test_files[0])['sha256'] is None
+
+    def test_backfill(self, test_files):
+        assert backfill_hashes(workers=10 ** 6) == {'hashed': 3, 'failed': 0, 'skipped': 0, 'total': 3}
+        assert {file['sha256'] for file in get_files()} == {SHA256_12345}
+        assert get_files_page(limit=1)['files'][0]['sha256'] == SHA256_12345
+        assert backfill_hashes(workers=2)['total'] == 0
+        with pytest.raises(ValueError):
+            backfill_hashes(workers=0)
+
+    def test_backfill_modified(self, test_files, monkeypatch):
+        def modified(paths, workers, cipher):
+            for path in paths:
+                yield path, None, (os.stat(path) if path.endswith(test_files[0]) else None)
+
+        monkeypatch.setattr(FileService, 'backfill', modified)
+        assert backfill_hashes() == {'hashed': 0, 'failed': 2, 'skipped': 1, 'total': 3}
+
+    def test_stored_hashes_cache(self, test_files, monkeypatch):
+        loaded = []
+
+        def counting_load_hashes(path, stat):
+            loaded.append(path)
+            return load_hashes(path, stat)
+
+        monkeypatch.setattr(FileService, 'load_hashes', counting_load_hashes)
+        monkeypatch.setattr(FileService, 'RACY_WINDOW_NS', 0)
+        monkeypatch.setattr(FileService, '_stored_hashes', type(FileService._stored_hashes)())
+        assert {file['sha256'] for file in get_files()} == {None}
+        assert {file['sha256'] for file in get_files()} == {None}
+        assert len(loaded) == 3
+        # Stored hashes change ctime of files, so they are read again.
+        backfill_hashes(workers=1)
+        assert {file['sha256'] for file in get_files()} == {SHA256_12345}
+
+    def test_metadata_index(self, test_files, tmp_path_factory):
+        enable_metadata_index(str(tmp_path_factory.mktemp('index') / 'index.db'))
+        try:
+            create_file('new.txt', b'12345')
+            assert [file['sha256'] for file in get_files()] == [None, None, None, SHA256_12345]
+            backfill_hashes(workers=1)
+            assert {file['sha256'] for file in get_files()} == {SHA256_12345}
+        finally:
+            disable_metadata_index()
+
+    def test_encrypted(self, test_files):
+        enable_encryption(bytes(range(32)))
+        try:
+            create_file('secret.txt', b'12345')
+            assert get_file_data('secret.txt')['sha256'] == SHA256_12345
+            os.removexattr('secret.txt', 'user.fileservice.hashes')
+            # Plain files are hashed as they are, encrypted ones are decrypted.
+            assert backfill_hashes()['hashed'] == 4
+            assert {file['sha256'] for file in get_files()} == {SHA256_12345}
+            assert get_file_data('secret.txt')['sha256'] == SHA256_12345
+        finally:
+            disable_encryption()
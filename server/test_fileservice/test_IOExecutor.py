@@ -0,0 +1,36 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from server.IOExecutor import IOExecutor
+
+
+@pytest.fixture()
+def executor():
+    executor = IOExecutor(max_workers=1, max_queue=0, queue_timeout=0.1)
+    yield executor
+    executor.shutdown()
+
+
+class TestIOExecutor:
+    def test_run_result(self, executor):
+        assert asyncio.run(executor.run(sum, [1, 2], start=3)) == 6
+
+    def test_run_in_other_thread(self, executor):
+        thread = asyncio.run(executor.run(threading.current_thread))
+        assert thread is not threading.current_thread()
+
+    def test_run_exception(self, executor):
+        with pytest.raises(ZeroDivisionError):
+            asyncio.run(executor.run(lambda: 1 / 0))
+
+    def test_run_queue_is_full(self, executor):
+        async def run_two():
+            return await asyncio.gather(executor.run(time.sleep, 0.5), executor.run(time.sleep, 0),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run_two())
+        assert results[0] is None
+        assert isinstance(results[1], RuntimeError)
@@ -0,0 +1,97 @@
+import os
+import stat as stat_module
+import time
+
+import pytest
+
+from server.FileService import (create_file,
+                                delete_file,
+                                disable_metadata_cache,
+                                enable_metadata_cache,
+                                get_file_data,
+                                get_files,
+                                get_files_page,
+                                get_metadata_cache_stats)
+from server.MetadataCache import MetadataCache
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(params=[True, False], ids=['inotify', 'polling'])
+def cache(request, test_files):
+    cache = MetadataCache(os.getcwd(), poll_interval=0.05, use_inotify=request.param)
+    cache.start()
+    yield cache
+    cache.stop()
+
+
+class TestMetadataCache:
+    def test_entries(self, cache, test_files):
+        assert sorted(name for name, _ in cache.entries()) == test_files
+
+    def test_stat(self, cache, test_files):
+        assert cache.stat(test_files[0]).st_size == 5
+        assert cache.stats()['hits'] == 1
+
+    def test_stat_not_existed(self, cache):
+        with pytest.raises(FileNotFoundError):
+            cache.stat('not_existed.txt')
+
+    def test_symlink(self, cache, test_files):
+        os.symlink(test_files[0], 'link.txt')
+        assert wait_for(lambda: any(name == 'link.txt' for name, _ in cache.entries()))
+        assert stat_module.S_ISLNK(cache.stat('link.txt').st_mode)
+        cache.refresh('link.txt')
+        assert stat_module.S_ISLNK(cache.stat('link.txt').st_mode)
+        cache.reload()
+        assert stat_module.S_ISLNK(cache.stat('link.txt').st_mode)
+
+    def test_external_create(self, cache):
+        with open('new.txt', 'wb') as f:
+            f.write(b'123')
+        assert wait_for(lambda: any(name == 'new.txt' for name, _ in cache.entries()))
+
+    def test_external_delete(self, cache, test_files):
+        os.remove(test_files[0])
+        assert wait_for(lambda: len(cache.entries()) == len(test_files) - 1)
+
+    def test_max_entries(self, test_files):
+        cache = MetadataCache(os.getcwd(), max_entries=1)
+        cache.start()
+        try:
+            assert cache.entries() is None
+            assert cache.stats()['misses'] == 1
+        finally:
+            cache.stop()
+
+
+class TestFileServiceMetadataCache:
+    @pytest.fixture()
+    def cached_dir(self, test_files):
+        enable_metadata_cache(poll_interval=0.05)
+        yield test_files
+        disable_metadata_cache()
+
+    def test_get_files_from_cache(self, cached_dir):
+        assert len(get_files()) == len(cached_dir)
+        assert get_metadata_cache_stats()['hits'] == 1
+
+    def test_create_and_delete_file(self, cached_dir):
+        create_file('new.txt', b'123')
+        assert get_file_data('new.txt')['size'] == 3
+        delete_file('new.txt')
+        with pytest.raises(RuntimeError):
+            get_file_data('new.txt')
+
+    def test_get_files_page_from_cache(self, cached_dir):
+        page = get_files_page(limit=2, sort='-name')
+        assert [file['name'] for file in page['files']] == cached_dir[:0:-1]
+        page = get_files_page(limit=2, sort='-name', cursor=page['cursor'])
+        assert [file['name'] for file in page['files']] == cached_dir[:1]
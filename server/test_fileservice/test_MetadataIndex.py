@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from server.FileService import (create_file,
+                                delete_file,
+                                disable_metadata_index,
+                                enable_metadata_index,
+                                get_files,
+                                get_files_page,
+                                get_metadata_index_stats,
+                                iter_files,
+                                reconcile_metadata_index)
+from server.MetadataIndex import MetadataIndex
+
+
+def entry(name, size, mtime_ns=0, ino=1):
+    return name, size, 0.0, mtime_ns, ino, None, None, MetadataIndex.guess_mime_type(name)
+
+
+@pytest.fixture()
+def index(tmpdir):
+    metadata_index = MetadataIndex(str(tmpdir.join('index.db')))
+    yield metadata_index
+    metadata_index.close()
+
+
+class TestMetadataIndex:
+    def test_reconcile(self, index):
+        assert index.reconcile('/root', [entry('1.txt', 1), entry('2.txt', 2)])['added'] == 2
+        index.put('/root', entry('1.txt', 1)[:5] + ('hash', None, 'text/plain'))
+        stats = index.reconcile('/root', [entry('1.txt', 1), entry('3.txt', 3), entry('2.txt', 5, ino=2)])
+        assert stats == {'added': 1, 'updated': 1, 'removed': 0, 'total': 3}
+        assert index.get('/root', '1.txt')[5] == 'hash'
+        assert index.reconcile('/root', [entry('3.txt', 3)])['removed'] == 2
+        assert index.get('/root', '1.txt') is None
+        assert index.is_reconciled('/root')
+
+    def test_query(self, index):
+        index.reconcile('/root', [entry(f'{number}.txt', number % 3, mtime_ns=number) for number in range(10)])
+        index.reconcile('/other', [entry('big.txt', 100)])
+        assert [e.name for e in index.query('/root', 'size', descending=True, limit=2)] == ['8.txt', '5.txt']
+        assert [e.name for e in index.query('/root', 'size', after=(1, '4.txt'), limit=2)] == ['7.txt', '2.txt']
+        assert [e.name for e in index.query('/root', 'mtime', modified_since=8)] == ['8.txt', '9.txt']
+        assert [e.name for e in index.query('/root', prefix='1', min_size=1)] == ['1.txt']
+        assert len(list(index.iter_entries('/root', batch_size=3))) == 10
+
+
+class TestFileServiceMetadataIndex:
+    @pytest.fixture()
+    def indexed_dir(self, test_files, tmp_path_factory):
+        enable_metadata_index(str(tmp_path_factory.mktemp('index') / 'index.db'))
+        yield test_files
+        disable_metadata_index()
+
+    def test_listing(self, indexed_dir):
+        create_file('big.txt', b'1234567890')
+        names = [file['name'] for file in get_files()]
+        assert names[:3] == indexed_dir and 'big.txt' in names
+        page = get_files_page(limit=1, sort='-size', pattern='*.txt')
+        assert page['files'][0]['name'] == 'big.txt' and page['files'][0]['size'] == 10
+        page = get_files_page(limit=2, sort='-size', cursor=page['cursor'], pattern='*.txt')
+        assert [file['name'] for file in page['files']] == ['3.txt', '2.txt']
+        delete_file('big.txt')
+        assert [file['name'] for file in iter_files(min_size=6)] == []
+
+    def test_modified_since(self, indexed_dir):
+        since = int(time.time()) + 1000
+        os.utime(indexed_dir[0], (since, since))
+        reconcile_metadata_index()
+        assert [file['name'] for file in get_files_page(modified_since=since)['files']] == [indexed_dir[0]]
+
+    def test_reconcile_external_change(self, indexed_dir):
+        get_files()
+        with open('new.txt', 'wb') as f:
+            f.write(b'123')
+        assert 'new.txt' not in [file['name'] for file in get_files()]
+        assert reconcile_metadata_index()['added'] == 1
+        assert 'new.txt' in [file['name'] for file in get_files()]
+        assert get_metadata_index_stats()['files'] == 4
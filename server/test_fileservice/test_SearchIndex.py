@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from server.FileService import (create_file,
+                                delete_file,
+                                disable_encryption,
+                                disable_search_index,
+                                enable_encryption,
+                                enable_search_index,
+                                get_search_index_stats,
+                                search_files,
+                                sync_search_index)
+from server.SearchIndex import SearchIndex
+
+
+@pytest.fixture()
+def search_dir(test_files, tmp_path_factory):
+    enable_search_index(str(tmp_path_factory.mktemp('search') / 'search.db'))
+    yield test_files
+    disable_search_index()
+
+
+def wait_and_search(query, **kwargs):
+    from server.FileService import _search_index
+    # The first search in a root starts its synchronization.
+    search_files(query, **kwargs)
+    assert _search_index.wait(10)
+    return search_files(query, **kwargs)
+
+
+class TestSearchIndex:
+    def test_create_and_delete(self, search_dir):
+        create_file('log.txt', 'ERROR: disk is full\nINFO: all good')
+        create_file('other.txt', 'nothing interesting, disk is fine')
+        data = wait_and_search('disk full')
+        assert [result['name'] for result in data['results']] == ['log.txt']
+        assert '[disk]' in data['results'][0]['snippet']
+        assert data['pending'] == 0
+        assert {result['name'] for result in wait_and_search('disk')['results']} == {'log.txt', 'other.txt'}
+        delete_file('log.txt')
+        assert [result['name'] for result in wait_and_search('disk')['results']] == ['other.txt']
+
+    def test_existing_files(self, search_dir):
+        assert [result['name'] for result in wait_and_search('12345')['results']] == search_dir
+        with open(search_dir[0], 'wb') as f:
+            f.write(b'changed')
+        with open('binary.bin', 'wb') as f:
+            f.write(b'changed\0')
+        sync_search_index()
+        assert [result['name'] for result in wait_and_search('changed')['results']] == [search_dir[0]]
+        assert get_search_index_stats()['documents'] == 4
+
+    def test_special_characters(self, search_dir):
+        create_file('query.txt', 'select "quoted" value-with-dash')
+        assert [result['name'] for result in wait_and_search('"quoted" value-with-dash')['results']] == ['query.txt']
+        with pytest.raises(ValueError):
+            search_files(' ')
+
+    def test_disabled(self, test_files):
+        with pytest.raises(RuntimeError):
+            search_files('12345')
+        assert not os.path.exists('search.db')
+
+    def test_corrupted_encrypted_file(self, search_dir):
+        enable_encryption(bytes(range(32)))
+        try:
+            create_file('0corrupted.txt', b'corrupted words')
+            with open('0corrupted.txt', 'r+b') as f:
+                data = f.read()
+                f.seek(-1, os.SEEK_END)
+                f.write(bytes([data[-1] ^ 1]))
+            create_file('good.txt', b'good words')
+            assert [result['name'] for result in wait_and_search('words')['results']] == ['good.txt']
+            assert [result['name'] for result in wait_and_search('12345')['results']] == search_dir
+        finally:
+            disable_encryption()
+
+    def test_failing_loader(self, tmp_path):
+        def loader(root, name, version):
+            if name == 'broken':
+                raise ValueError('Broken file')
+            return 'v1', 'good words'
+
+        index = SearchIndex(':memory:', loader, lambda root: iter([('broken', 'v1'), ('good', 'v1')]), str)
+        try:
+            index.schedule(str(tmp_path))
+            assert index.wait(10)
+            assert [result['name'] for result in index.search(str(tmp_path), 'words')] == ['good']
+            assert (index.indexed, index.errors) == (1, 1)
+        finally:
+            index.stop()
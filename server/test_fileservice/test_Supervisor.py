@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+import pytest
+
+from server.Supervisor import Supervisor
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='fork is not supported')
+
+
+def send_pid(sock):
+    while True:
+        connection, _ = sock.accept()
+        connection.sendall(str(os.getpid()).encode())
+        connection.close()
+
+
+def get_pid(port):
+    for _ in range(50):
+        try:
+            with socket.create_connection(('127.0.0.1', port)) as connection:
+                return int(connection.recv(16))
+        except (ConnectionRefusedError, ValueError):
+            time.sleep(0.1)
+    raise TimeoutError
+
+
+@pytest.fixture()
+def port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture()
+def supervisor(port):
+    supervisor = Supervisor(send_pid, workers=2, port=port, host='127.0.0.1', shutdown_timeout=5, restart_delay=0)
+    process = multiprocessing.get_context('fork').Process(target=supervisor.run)
+    process.start()
+    yield process
+    if process.is_alive():
+        # SIGTERM lets the supervisor stop its workers, which would outlive a killed supervisor.
+        process.terminate()
+        process.join(10)
+
+
+class TestSupervisor:
+    def test_workers_share_port(self, supervisor, port):
+        pids = {get_pid(port) for _ in range(50)}
+        assert supervisor.pid not in pids
+        assert 1 <= len(pids) <= 2
+
+    def test_worker_restart(self, supervisor, port):
+        pid = get_pid(port)
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(0.5)
+        assert pid not in {get_pid(port) for _ in range(20)}
+
+    def test_shutdown(self, supervisor, port):
+        get_pid(port)
+        os.kill(supervisor.pid, signal.SIGTERM)
+        supervisor.join(10)
+        assert supervisor.exitcode == 0
+        with pytest.raises(ConnectionRefusedError):
+            socket.create_connection(('127.0.0.1', port))
@@ -0,0 +1,163 @@
+import concurrent.futures
+import hashlib
+import os
+
+import pytest
+
+from server.CryptoService import BLOCK_SIZE, MAGIC
+from server.FileService import (abort_upload,
+                                cleanup_uploads,
+                                commit_upload,
+                                configure_uploads,
+                                create_upload,
+                                disable_encryption,
+                                enable_encryption,
+                                get_upload,
+                                open_file,
+                                open_upload_chunk)
+from server.test_fileservice.conftest import DOMAIN, http
+
+CHUNK_SIZE = BLOCK_SIZE
+
+
+def upload_chunks(filename, upload, content, indexes):
+    for index in indexes:
+        with open_upload_chunk(filename, upload['upload_id'], index) as f:
+            f.write(content[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE])
+
+
+class TestUpload:
+    def test_out_of_order(self, test_files):
+        content = os.urandom(3 * CHUNK_SIZE + 10)
+        sha256 = hashlib.sha256(content).hexdigest()
+        upload = create_upload('big.bin', len(content), CHUNK_SIZE, sha256)
+        assert upload['chunks'] == 4 and upload['missing'] == [0, 1, 2, 3]
+        upload_chunks('big.bin', upload, content, [3, 1])
+        assert get_upload('big.bin', upload['upload_id'])['received'] == [1, 3]
+        with pytest.raises(RuntimeError):
+            commit_upload('big.bin', upload['upload_id'])
+        upload_chunks('big.bin', upload, content, [0, 2, 1])
+        data = commit_upload('big.bin', upload['upload_id'])
+        assert data['size'] == len(content) and data['sha256'] == sha256
+        with open('big.bin', 'rb') as f:
+            assert f.read() == content
+        assert sorted(os.listdir()) == sorted(test_files + ['big.bin'])
+        with pytest.raises(RuntimeError):
+            get_upload('big.bin', upload['upload_id'])
+
+    def test_wrong_chunk_and_hash(self, test_files):
+        content = os.urandom(CHUNK_SIZE + 1)
+        upload = create_upload('big.bin', len(content), CHUNK_SIZE, hashlib.sha256(b'other').hexdigest())
+        f = open_upload_chunk('big.bin', upload['upload_id'], 0)
+        f.write(content[:10])
+        with pytest.raises(ValueError):
+            f.close()
+        with pytest.raises(ValueError):
+            open_upload_chunk('big.bin', upload['upload_id'], 0).write(content)
+        with pytest.raises(ValueError):
+            open_upload_chunk('big.bin', upload['upload_id'], 2)
+        with pytest.raises(RuntimeError):
+            get_upload('other.bin', upload['upload_id'])
+        upload_chunks('big.bin', upload, content, [0, 1])
+        with pytest.raises(ValueError):
+            commit_upload('big.bin', upload['upload_id'])
+        sha256 = hashlib.sha256(content).hexdigest()
+        assert commit_upload('big.bin', upload['upload_id'], sha256)['size'] == len(content)
+
+    def test_commit_while_writing(self, test_files):
+        upload = create_upload('small.txt', 5, sha256=hashlib.sha256(b'12345').hexdigest())
+        f = open_upload_chunk('small.txt', upload['upload_id'], 0)
+        f.write(b'12345')
+        with pytest.raises(RuntimeError):
+            commit_upload('small.txt', upload['upload_id'])
+        f.close()
+        assert commit_upload('small.txt', upload['upload_id'])['size'] == 5
+
+    def test_dropped_resend(self, test_files):
+        content = os.urandom(2 * CHUNK_SIZE)
+        upload = create_upload('big.bin', len(content), CHUNK_SIZE)
+        upload_chunks('big.bin', upload, content, [0, 1])
+        f = open_upload_chunk('big.bin', upload['upload_id'], 1)
+        f.write(os.urandom(10))
+        assert get_upload('big.bin', upload['upload_id'])['missing'] == [1]
+        f.discard()
+        with pytest.raises(RuntimeError):
+            commit_upload('big.bin', upload['upload_id'], hashlib.sha256(content).hexdigest())
+        upload_chunks('big.bin', upload, content, [1])
+        with pytest.raises(ValueError):
+            commit_upload('big.bin', upload['upload_id'])
+        sha256 = hashlib.sha256(content).hexdigest()
+        assert commit_upload('big.bin', upload['upload_id'], sha256)['size'] == len(content)
+
+    def test_abort_and_cleanup(self, test_files):
+        upload = create_upload('1.bin', 10)
+        abort_upload('1.bin', upload['upload_id'])
+        with pytest.raises(RuntimeError):
+            get_upload('1.bin', upload['upload_id'])
+        create_upload('2.bin', 10)
+        assert cleanup_uploads(3600) == 0
+        assert cleanup_uploads(-1) == 1
+        assert sorted(os.listdir()) == test_files
+
+    def test_limits(self, test_files):
+        configure_uploads(max_size=100, ttl=-1)
+        try:
+            with pytest.raises(ValueError):
+                create_upload('1.bin', 101)
+            expired = create_upload('1.bin', 100)
+            # Expired uploads are removed once per interval, when new uploads are started.
+            create_upload('2.bin', 10)
+            assert get_upload('1.bin', expired['upload_id'])['size'] == 100
+            configure_uploads(max_size=100, ttl=-1)
+            create_upload('2.bin', 10)
+            with pytest.raises(RuntimeError):
+                get_upload('1.bin', expired['upload_id'])
+        finally:
+            configure_uploads()
+
+    def test_invalid(self, test_files):
+        with pytest.raises(RuntimeError):
+            create_upload(test_files[0], 10)
+        with pytest.raises(ValueError):
+            create_upload('new.bin', 10, chunk_size=1000)
+        with pytest.raises(ValueError):
+            create_upload('new.bin', 10, sha256='123')
+        with pytest.raises(ValueError):
+            get_upload('new.bin', '../1.txt')
+
+    @pytest.mark.parametrize('size', [0, CHUNK_SIZE, 2 * CHUNK_SIZE + 3])
+    def test_encrypted(self, test_files, size):
+        enable_encryption(bytes(range(32)))
+        try:
+            content = os.urandom(size)
+            sha256 = hashlib.sha256(content).hexdigest()
+            upload = create_upload('secret.bin', size, CHUNK_SIZE, sha256)
+            upload_chunks('secret.bin', upload, content, reversed(range(upload['chunks'])))
+            # Re-sent chunk is encrypted again.
+            upload_chunks('secret.bin', upload, content, range(upload['chunks'])[:1])
+            assert commit_upload('secret.bin', upload['upload_id'])['sha256'] == sha256
+            with open('secret.bin', 'rb') as f:
+                assert f.read(len(MAGIC)) == MAGIC
+            with open_file('secret.bin') as f:
+                assert f.read() == content
+        finally:
+            disable_encryption()
+
+
+def test_parallel_web_upload(test_files_web):
+    content = os.urandom(8 * CHUNK_SIZE)
+    url = f'{DOMAIN}/uploads/parallel.bin'
+    upload = http.post(url, params={'size': len(content), 'chunk_size': CHUNK_SIZE,
+                                        'sha256': hashlib.sha256(content).hexdigest()}).json()
+    assert upload['status'] == 'success', upload
+    upload_url = f'{url}/{upload["upload_id"]}'
+
+    def put(index):
+        return http.put(f'{upload_url}/{index}', data=content[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]).json()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        assert all(result['status'] == 'success' for result in pool.map(put, range(upload['chunks'])))
+    assert http.get(upload_url).json()['missing'] == []
+    data = http.post(f'{upload_url}/commit').json()
+    assert data['status'] == 'success' and data['size'] == len(content)
+    assert http.get(f'{DOMAIN}/files/parallel.bin/content').content == content
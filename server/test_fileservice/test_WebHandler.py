@@ -1,9 +1,17 @@
+import asyncio
+import io
 import os
 import json
+import tarfile
+import zipfile
 
 import pytest
 import requests
 
+import server.FileService as FileService
+from server.WebHandler import WebHandler
+from server.test_fileservice.conftest import http
+
 
 DOMAIN = 'http://127.0.0.1:8080'
 
@@ -13,49 +21,324 @@ DOMAIN = 'http://127.0.0.1:8080'
                           os.path.join('dir..', 'to', 'go')]
                          )
 def test_change_dir_error(bad_dir):
-    response = requests.post(f'{DOMAIN}/change_dir/{bad_dir}')
+    response = http.post(f'{DOMAIN}/change_dir/{bad_dir}')
     assert response.status_code == 200
     assert 'Invalid' in response.text
 
 
 def test_change_dir_success(tmpdir):
-    response = requests.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    response = http.post(f'{DOMAIN}/change_dir/{tmpdir}')
     assert response.status_code == 200
     assert 'success' in response.text
 
 
 def test_get_files(test_files_web):
-    response = requests.get(f'{DOMAIN}/files')
+    response = http.get(f'{DOMAIN}/files')
     assert response.status_code == 200
     pretty_response = json.loads(response.text)
     assert pretty_response['files'][0]['name'] == test_files_web[0]
 
 
 def test_get_file_data(test_file_web):
-    response = requests.get(f'{DOMAIN}/{test_file_web[0]}')
+    response = http.get(f'{DOMAIN}/{test_file_web[0]}')
     assert response.status_code == 200
     pretty_response = json.loads(response.text)
     assert pretty_response['name'] == test_file_web[0]
 
 
 def test_create_dir(tmpdir):
-    requests.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    http.post(f'{DOMAIN}/change_dir/{tmpdir}')
     headers = {'Content-type': 'text/html'}
     content = '123asdячс'
     filename = 'test.txt'
-    response = requests.post(f'{DOMAIN}/create/{filename}',
+    response = http.post(f'{DOMAIN}/create/{filename}',
                              data=content.encode('utf-8'),
                              headers=headers)
     assert response.status_code == 200
     pretty_response = json.loads(response.text)
-    assert pretty_response['content'] == content
+    assert pretty_response['size'] == len(content.encode('utf-8'))
+    assert tmpdir.join(filename).read_binary() == content.encode('utf-8')
 
 
 def test_delete_file(test_file_web):
-    response = requests.delete(f'{DOMAIN}/delete/{test_file_web[0]}')
+    response = http.delete(f'{DOMAIN}/delete/{test_file_web[0]}')
     assert response.status_code == 200
     pretty_response = json.loads(response.text)
     assert 'location' in pretty_response
 
 
 
+
+
+def test_get_file_content(test_file_web):
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content')
+    assert response.status_code == 200
+    assert response.content == test_file_web[1]
+    assert int(response.headers['Content-Length']) == len(test_file_web[1])
+
+
+def test_get_file_content_not_exists(tmpdir):
+    http.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    response = http.get(f'{DOMAIN}/files/not_existed.txt/content')
+    assert response.status_code == 200
+    assert 'error' in json.loads(response.text)['status']
+
+
+def test_get_file_content_range(test_file_web):
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content', headers={'Range': 'bytes=1-2'})
+    assert response.status_code == 206
+    assert response.content == test_file_web[1][1:3]
+    assert response.headers['Content-Range'] == f'bytes 1-2/{len(test_file_web[1])}'
+
+
+def test_get_file_content_multiple_ranges(test_file_web):
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content', headers={'Range': 'bytes=0-0,-1'})
+    assert response.status_code == 206
+    assert response.headers['Content-Type'].startswith('multipart/byteranges')
+    assert int(response.headers['Content-Length']) == len(response.content)
+
+
+def test_get_file_content_range_not_satisfiable(test_file_web):
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content', headers={'Range': 'bytes=100-'})
+    assert response.status_code == 416
+
+
+def test_get_file_content_if_range_outdated(test_file_web):
+    headers = {'Range': 'bytes=1-2', 'If-Range': 'Thu, 01 Jan 1970 00:00:00 GMT'}
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content', headers=headers)
+    assert response.status_code == 200
+    assert response.content == test_file_web[1]
+
+
+def test_get_files_page(test_files_web):
+    response = http.get(f'{DOMAIN}/files', params={'limit': 2, 'sort': '-name'})
+    assert response.status_code == 200
+    pretty_response = json.loads(response.text)
+    assert [file['name'] for file in pretty_response['files']] == test_files_web[:0:-1]
+    params = {'limit': 2, 'sort': '-name', 'cursor': pretty_response['cursor']}
+    response = http.get(f'{DOMAIN}/files', params=params)
+    pretty_response = json.loads(response.text)
+    assert [file['name'] for file in pretty_response['files']] == test_files_web[:1]
+    assert pretty_response['cursor'] is None
+
+
+@pytest.mark.parametrize('params', [{'modified_since': 'inf'}, {'modified_since': '1e300'}, {'modified_since': 'nan'},
+                                    {'min_size': 2 ** 63}, {'max_size': -1}])
+def test_get_files_invalid_filter(test_files_web, params):
+    data = http.get(f'{DOMAIN}/files', params=params).json()
+    assert data['status'] == 'error' and 'Invalid' in data['message']
+
+
+def test_get_files_ndjson(test_files_web):
+    response = http.get(f'{DOMAIN}/files', headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    names = sorted(json.loads(line)['name'] for line in response.text.splitlines())
+    assert names == test_files_web
+
+
+def test_change_dir_of_session(tmpdir, test_files_web):
+    session_dir = tmpdir.mkdir('session')
+    response = requests.post(f'{DOMAIN}/change_dir/{session_dir}', headers={'X-Session': 'chosen'})
+    session = response.json()['session']
+    assert session != 'chosen' and response.cookies['session'] == session
+    response = requests.get(f'{DOMAIN}/files', headers={'X-Session': session})
+    assert json.loads(response.text)['files'] == []
+    response = http.get(f'{DOMAIN}/files')
+    assert len(json.loads(response.text)['files']) == len(test_files_web) + 1
+
+
+def test_change_dir_without_session(tmpdir, test_files_web):
+    default_files = {file['name'] for file in requests.get(f'{DOMAIN}/files').json()['files']}
+    other_dir = tmpdir.mkdir('other')
+    assert requests.post(f'{DOMAIN}/change_dir/{other_dir}').json()['status'] == 'success'
+    # Neither the default root nor roots of other sessions are changed.
+    assert {file['name'] for file in requests.get(f'{DOMAIN}/files').json()['files']} == default_files
+    assert len(http.get(f'{DOMAIN}/files').json()['files']) == len(test_files_web) + 1
+
+
+def test_unknown_root(test_files_web):
+    response = http.get(f'{DOMAIN}/files', headers={'X-Root': 'not_existed_root'})
+    assert response.status_code == 200
+    assert json.loads(response.text)['status'] == 'error'
+
+
+def test_get_file_content_not_modified(test_file_web):
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content')
+    etag = response.headers['ETag']
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    response = http.get(f'{DOMAIN}/files/{test_file_web[0]}/content',
+                            headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+
+
+def test_get_file_data_not_modified(tmpdir, test_file_web):
+    etag = http.get(f'{DOMAIN}/{test_file_web[0]}').headers['ETag']
+    assert http.get(f'{DOMAIN}/{test_file_web[0]}', headers={'If-None-Match': etag}).status_code == 304
+    with open(tmpdir.join(test_file_web[0]), 'ab') as f:
+        f.write(b'678')
+    response = http.get(f'{DOMAIN}/{test_file_web[0]}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert json.loads(response.text)['content'] == '12345678'
+
+
+def test_get_files_not_modified(tmpdir, test_files_web):
+    # Listing of a directory modified within the last seconds has no ETag.
+    os.utime(tmpdir, (0, 0))
+    etag = http.get(f'{DOMAIN}/files').headers['ETag']
+    assert http.get(f'{DOMAIN}/files', headers={'If-None-Match': etag}).status_code == 304
+    http.delete(f'{DOMAIN}/delete/{test_files_web[0]}')
+    os.utime(tmpdir, (0, 0))
+    response = http.get(f'{DOMAIN}/files', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(json.loads(response.text)['files']) == len(test_files_web) - 1
+
+
+def test_get_large_file_content(tmpdir):
+    http.post(f'{DOMAIN}/change_dir/{tmpdir}')
+    content = os.urandom(3 * 1024 * 1024 + 17)
+    with open(tmpdir.join('large.bin'), 'wb') as f:
+        f.write(content)
+    response = http.get(f'{DOMAIN}/files/large.bin/content')
+    assert response.status_code == 200
+    assert response.content == content
+    response = http.get(f'{DOMAIN}/files/large.bin/content', headers={'Range': 'bytes=1000000-1000099,-10'})
+    assert response.status_code == 206
+    assert content[1000000:1000100] in response.content
+    assert content[-10:] in response.content
+
+
+def run_batch(operations):
+    body = ''.join(json.dumps(operation) + '\n' for operation in operations)
+    response = http.post(f'{DOMAIN}/batch', data=body, headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    return sorted(results, key=lambda result: result['index'])
+
+
+def test_batch(tmpdir, test_files_web):
+    results = run_batch([{'op': 'create', 'name': 'new.txt', 'content': '123'},
+                         {'op': 'create', 'name': 'new.bin', 'content_base64': 'AAEC'},
+                         {'op': 'stat', 'name': test_files_web[0]},
+                         {'op': 'delete', 'name': test_files_web[1]},
+                         {'op': 'stat', 'name': 'new.txt'},
+                         {'op': 'delete', 'name': 'new.txt'}])
+    assert [result['status'] for result in results] == ['success'] * 6
+    assert results[0]['size'] == 3
+    assert 'content' not in results[0]
+    assert results[2]['size'] == 5
+    assert results[4]['size'] == 3
+    assert sorted(os.listdir(tmpdir)) == sorted(['new.bin', test_files_web[0], test_files_web[2]])
+    with open(tmpdir.join('new.bin'), 'rb') as f:
+        assert f.read() == b'\x00\x01\x02'
+
+
+def test_batch_errors(test_files_web):
+    results = run_batch([{'op': 'create', 'name': test_files_web[0], 'content': '123'},
+                         {'op': 'delete', 'name': 'not_existed.txt'},
+                         {'op': 'move', 'name': 'new.txt'},
+                         {'op': 'create', 'name': 'new.txt', 'content_base64': '!!'},
+                         {'op': 'create', 'name': 'new.txt', 'content_base64': 123},
+                         {'op': 'stat', 'name': test_files_web[0]}])
+    assert [result['status'] for result in results] == ['error'] * 5 + ['success']
+    assert results[2]['message'] == 'Unknown operation move'
+    assert results[4]['message'] == 'Base64 content must be a string'
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'tar.gz', 'zip'])
+def test_get_archive(tmpdir, test_files_web, archive_format):
+    with open(tmpdir.join('large.bin'), 'wb') as f:
+        f.write(os.urandom(200000))
+    response = http.get(f'{DOMAIN}/archive', params={'format': archive_format})
+    assert response.status_code == 200
+    assert f'.{archive_format}"' in response.headers['Content-Disposition']
+    archive = io.BytesIO(response.content)
+    if archive_format == 'zip':
+        with zipfile.ZipFile(archive) as zip_file:
+            files = {info.filename: zip_file.read(info) for info in zip_file.infolist()}
+    else:
+        with tarfile.open(fileobj=archive) as tar_file:
+            files = {member.name: tar_file.extractfile(member).read() for member in tar_file.getmembers()}
+    assert sorted(files) == sorted(test_files_web + ['large.bin'])
+    assert files[test_files_web[0]] == b'12345'
+    with open(tmpdir.join('large.bin'), 'rb') as f:
+        assert files['large.bin'] == f.read()
+
+
+def test_get_archive_filtered(test_files_web):
+    response = http.get(f'{DOMAIN}/archive', params={'glob': '[12].txt'})
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as tar_file:
+        assert sorted(tar_file.getnames()) == test_files_web[:2]
+
+
+def test_get_archive_unknown_format(test_files_web):
+    response = http.get(f'{DOMAIN}/archive', params={'format': 'rar'})
+    assert json.loads(response.text)['status'] == 'error'
+
+
+def make_tar(files, mode='w'):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode=mode) as tar_file:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar_file.addfile(info, io.BytesIO(content))
+    return archive.getvalue()
+
+
+def extract(body, **params):
+    response = http.post(f'{DOMAIN}/extract', data=body, params=params)
+    assert response.status_code == 200
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda result: result['index'])
+
+
+@pytest.mark.parametrize('mode', ['w', 'w:gz'])
+def test_extract_tar(tmpdir, test_files_web, mode):
+    files = {'a.txt': b'123', 'b.bin': os.urandom(300000), 'c.txt': b''}
+    results = extract(make_tar(files, mode))
+    assert [result['status'] for result in results] == ['success'] * 3
+    assert [result['size'] for result in results] == [3, 300000, 0]
+    for name, content in files.items():
+        with open(tmpdir.join(name), 'rb') as f:
+            assert f.read() == content
+
+
+def test_extract_zip(tmpdir, test_files_web):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('a.txt', b'123')
+        zip_file.writestr('dir/', b'')
+    results = extract(archive.getvalue(), format='zip')
+    assert [(result['name'], result['status']) for result in results] == [('a.txt', 'success')]
+    with open(tmpdir.join('a.txt'), 'rb') as f:
+        assert f.read() == b'123'
+
+
+def test_extract_unsafe_names(tmpdir, test_files_web):
+    results = extract(make_tar({'../evil.txt': b'1', '/tmp/evil.txt': b'2', 'dir/nested.txt': b'3',
+                                test_files_web[0]: b'4', 'good.txt': b'5'}))
+    assert [result['status'] for result in results] == ['error'] * 4 + ['success']
+    assert sorted(os.listdir(tmpdir)) == sorted(test_files_web + ['good.txt'])
+    with open(tmpdir.join(test_files_web[0]), 'rb') as f:
+        assert f.read() == b'12345'
+
+
+def test_extract_corrupted(test_files_web):
+    results = extract(b'not an archive' * 100)
+    assert results[-1]['status'] == 'error'
+
+
+def test_extract_write_error(test_files, monkeypatch):
+    def create_file(*args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+    handler = WebHandler()
+    monkeypatch.setattr(FileService, 'create_file', create_file)
+    try:
+        result = asyncio.run(handler._extract_file(0, 'new.txt', b'1', FileService.CWD))
+    finally:
+        handler.shutdown()
+        handler.executor.shutdown()
+    assert result['status'] == 'error' and 'No space' in result['message']
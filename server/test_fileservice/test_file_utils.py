@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+from utils.file_utils import NAME_MAX, advise_mapping, close_mapping, map_file, pathname_is_valid
+
+
+class TestPathnameIsValid:
+    @pytest.mark.parametrize('pathname', ['test.txt', os.path.join('dir', 'test.txt'), '.hidden', 'x' * NAME_MAX])
+    def test_valid(self, pathname):
+        assert pathname_is_valid(pathname)
+
+    @pytest.mark.parametrize('pathname', ['', '   ', None, b'test.txt', os.path.join('..', 'test.txt'),
+                                          'a\0b', 'x' * (NAME_MAX + 1), os.path.join('dir', 'x' * (NAME_MAX + 1))])
+    def test_invalid(self, pathname):
+        assert not pathname_is_valid(pathname)
+
+    @pytest.mark.parametrize('pathname', ['a*b.txt', 'a?b.txt', 'a|b.txt', 'a<b>.txt', 'a\tb.txt'])
+    def test_invalid_on_windows(self, monkeypatch, pathname):
+        assert pathname_is_valid(pathname) == (sys.platform != 'win32')
+        monkeypatch.setattr(sys, 'platform', 'win32')
+        assert not pathname_is_valid(pathname)
+
+    def test_no_filesystem_access(self, monkeypatch):
+        def fail(*args, **kwargs):
+            raise AssertionError('filesystem must not be accessed')
+
+        monkeypatch.setattr(os, 'lstat', fail)
+        monkeypatch.setattr(os.path, 'isdir', fail)
+        assert pathname_is_valid(os.path.join('some', 'new', 'name.txt'))
+
+
+class TestMapFile:
+    def test_map_file(self, test_file):
+        with open(test_file[0], 'rb') as f:
+            mapping = map_file(f)
+        advise_mapping(mapping, 'RANDOM')
+        advise_mapping(mapping, 'WILLNEED', 1, 2)
+        with memoryview(mapping) as view:
+            data = view[1:3]
+            assert data == test_file[1][1:3]
+            close_mapping(mapping)
+            assert not mapping.closed
+            data.release()
+        close_mapping(mapping)
+        assert mapping.closed
+
+    def test_map_empty_file(self, tmpdir):
+        path = tmpdir.join('empty.txt')
+        path.write('')
+        with open(path, 'rb') as f:
+            assert map_file(f) is None
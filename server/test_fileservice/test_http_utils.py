@@ -0,0 +1,62 @@
+import pytest
+
+from utils.http_utils import if_none_match, if_range_matches, is_not_modified, make_etag, parse_range_header
+
+
+class TestParseRangeHeader:
+    @pytest.mark.parametrize('header, expected',
+                             [('bytes=0-4', [(0, 4)]),
+                              ('bytes=5-', [(5, 9)]),
+                              ('bytes=-3', [(7, 9)]),
+                              ('bytes=0-100', [(0, 9)]),
+                              ('bytes=0-1,5-6', [(0, 1), (5, 6)]),
+                              ('bytes=5-6,0-2,2-3', [(0, 3), (5, 6)])]
+                             )
+    def test_parse_range_header(self, header, expected):
+        assert parse_range_header(header, 10) == expected
+
+    @pytest.mark.parametrize('header', ['items=0-4', 'bytes=', 'bytes=4-1', 'bytes=a-b', 'bytes=-'])
+    def test_parse_range_header_malformed(self, header):
+        assert parse_range_header(header, 10) is None
+
+    def test_parse_range_header_not_satisfiable(self):
+        with pytest.raises(ValueError):
+            parse_range_header('bytes=10-', 10)
+
+    @pytest.mark.parametrize('header', ['bytes=-5', 'bytes=0-', 'bytes=0-0'])
+    def test_parse_range_header_empty(self, header):
+        with pytest.raises(ValueError):
+            parse_range_header(header, 0)
+
+
+class TestIfRangeMatches:
+    def test_if_range_date_matches(self):
+        assert if_range_matches('Thu, 01 Jan 1970 00:00:10 GMT', 9.5)
+
+    def test_if_range_date_differs(self):
+        assert not if_range_matches('Thu, 01 Jan 1970 00:00:10 GMT', 20)
+
+    def test_if_range_weak_etag(self):
+        assert not if_range_matches('W/"abc"', 0, etag='W/"abc"')
+
+
+class TestConditionalHeaders:
+    def test_make_etag(self):
+        assert make_etag(255, 16, 'json') == '"ff-10-json"'
+
+    @pytest.mark.parametrize('header, expected', [('"a"', True), ('W/"a"', True), ('"b", "a"', True), ('*', True),
+                                                  ('"b"', False)])
+    def test_if_none_match(self, header, expected):
+        assert if_none_match(header, '"a"') == expected
+
+    def test_is_not_modified_since(self):
+        headers = {'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:10 GMT'}
+        assert is_not_modified(headers, None, 9.5)
+        assert not is_not_modified(headers, None, 10.5)
+
+    def test_if_none_match_takes_precedence(self):
+        headers = {'If-None-Match': '"b"', 'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:10 GMT'}
+        assert not is_not_modified(headers, '"a"', 9.5)
+
+    def test_no_conditional_headers(self):
+        assert not is_not_modified({}, '"a"', 9.5)
@@ -0,0 +1,115 @@
+import logging
+import queue
+
+import pytest
+
+from utils import log_utils
+from utils.log_utils import (BatchQueueListener,
+                             DroppingQueueHandler,
+                             create_logs,
+                             get_log_stats,
+                             stop_logs,
+                             use_worker_logfile)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture()
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    stop_logs()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+    log_utils._queue_handler = None
+
+
+class TestCreateLogs:
+    def test_create_logs(self, root_logger, tmpdir):
+        logfile = str(tmpdir.join('test.log'))
+        create_logs(logfile, 'DEBUG')
+        assert [type(handler) for handler in root_logger.handlers] == [DroppingQueueHandler]
+        logging.debug('debug message')
+        logging.info('info message')
+        stop_logs()
+        with open(logfile) as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith('DEBUG   test_log_utils.test_create_logs - debug message')
+        assert lines[1].endswith('INFO    test_log_utils.test_create_logs - info message')
+
+    def test_log_level(self, root_logger, tmpdir):
+        logfile = str(tmpdir.join('test.log'))
+        create_logs(logfile, 'INFO')
+        logging.debug('debug message')
+        logging.info('info message')
+        stop_logs()
+        with open(logfile) as f:
+            assert f.read().count('message') == 1
+
+    def test_worker_logfile(self, root_logger, tmpdir):
+        create_logs(str(tmpdir.join('test.log')), 'INFO', queue_size=10)
+        logging.info('main message')
+        use_worker_logfile(1)
+        logging.info('worker message')
+        stop_logs()
+        assert 'worker message' not in tmpdir.join('test.log').read()
+        assert tmpdir.join('test.worker-1.log').read().endswith('worker message\n')
+        assert get_log_stats()['max_queued'] == 10
+
+    def test_get_log_stats(self, root_logger, tmpdir):
+        create_logs(str(tmpdir.join('test.log')), 'INFO', queue_size=10)
+        assert get_log_stats() == {'queued': 0, 'max_queued': 10, 'dropped': 0}
+
+
+class TestDroppingQueueHandler:
+    def test_drop_when_full(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        logger = logging.getLogger('test_drop_when_full')
+        logger.propagate = False
+        logger.addHandler(handler)
+        for number in range(5):
+            logger.error(f'message {number}')
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_prepare(self):
+        handler = DroppingQueueHandler(queue.Queue())
+        logger = logging.getLogger('test_prepare')
+        logger.propagate = False
+        logger.addHandler(handler)
+        args = ['value']
+        try:
+            raise RuntimeError('failure')
+        except RuntimeError:
+            logger.exception('message %s', args)
+        args.append('changed')
+        record = handler.queue.get_nowait()
+        assert (record.args, record.exc_info, record.exc_text) == (None, None, None)
+        assert record.getMessage().startswith("message ['value']\nTraceback")
+        assert 'RuntimeError: failure' in record.getMessage()
+
+    def test_listener_reports_dropped(self):
+        log_queue = queue.Queue(2)
+        handler = DroppingQueueHandler(log_queue)
+        target = ListHandler()
+        logger = logging.getLogger('test_listener_reports_dropped')
+        logger.propagate = False
+        logger.addHandler(handler)
+        for number in range(3):
+            logger.error(f'message {number}')
+        listener = BatchQueueListener(log_queue, target, queue_handler=handler)
+        listener.start()
+        listener.stop()
+        assert target.messages == ['message 0', 'message 1', '1 log records were dropped, log queue is full.']
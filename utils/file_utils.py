@@ -1,115 +1,210 @@
 import errno
+import functools
+import mmap
 import os
 import re
 import sys
 
+NAME_MAX = 255
+PATH_CACHE_SIZE = 4096
+
+# Characters, which can't be used in a path component, by platform. Windows additionally forbids
+# `/`, since only `\\` separates components there.
+_INVALID_CHARS = {
+    'win32': frozenset('/\\:*?"<>|' + ''.join(map(chr, range(32)))),
+}
+_DEFAULT_INVALID_CHARS = frozenset('\0')
+_PARENT_DIR_RE = re.compile(r'\.\.[\\/]')
+
 
 def pathname_is_valid(pathname: str) -> bool:
     """Checks given path is valid for current OS.
 
+    The check is purely lexical, it doesn't touch the filesystem: path must not be empty, refer
+    to a parent directory, contain characters forbidden on the platform or components longer
+    than `NAME_MAX`. Whether the path stays inside a directory is checked when file is opened
+    relative to the directory (see `server.Root`). Results are memoized for recently seen paths.
+
     Args:
         pathname (str): filename
 
     Returns:
         Bool, True if pathname is valid and False if it is not.
     """
-    deprecated_symbols = {'win32': ('/', '\\', ':', '*', '?', '"', '<', '>')}
-    platform = sys.platform
-    # If this pathname is either not a string or is but is empty, this pathname
-    # is invalid.
-    try:
-        if not isinstance(pathname, str) or re.search(r'\.\.[\\/]', pathname) or not pathname.strip():
-            return False
+    if not isinstance(pathname, str):
+        return False
+    return _pathname_is_valid(pathname, sys.platform)
 
-        # Strip this pathname's Windows-specific drive specifier (e.g., `C:\`)
-        # if any. Since Windows prohibits path components from containing `:`
-        # characters, failing to strip this `:`-suffixed prefix would
-        # erroneously invalidate all valid absolute Windows pathnames.
-        _, pathname = os.path.splitdrive(pathname)
-        # Directory guaranteed to exist. If the current OS is Windows, this is
-        # the drive to which Windows was installed (e.g., the "%HOMEDRIVE%"
-        # environment variable); else, the typical root directory.
-        root_dirname = os.environ.get('HOMEDRIVE', 'C:') if platform == 'win32' else os.path.sep
-        assert os.path.isdir(root_dirname)   # ...Murphy and her ironclad Law
-
-        # Append a path separator to this directory if needed.
-        root_dirname = root_dirname.rstrip(os.path.sep) + os.path.sep
-
-        # Test whether each path component split from this pathname is valid or
-        # not, ignoring non-existent and non-readable path components.
-        for pathname_part in pathname.split(os.path.sep):
-            if any(symbol in pathname_part for symbol in deprecated_symbols.get(platform, ['/'])):
-                return False
-            try:
-                os.lstat(root_dirname + pathname_part)
-            # If an OS-specific exception is raised, its error code
-            # indicates whether this pathname is valid or not. Unless this
-            # is the case, this exception implies an ignorable kernel or
-            # filesystem complaint (e.g., path not found or inaccessible).
-            #
-            # Only the following exceptions indicate invalid pathnames:
-            #
-            # * Instances of the Windows-specific "WindowsError" class
-            #   defining the "winerror" attribute whose value is
-            #   "ERROR_INVALID_NAME". Under Windows, "winerror" is more
-            #   fine-grained and hence useful than the generic "errno"
-            #   attribute. When a too-long pathname is passed, for example,
-            #   "errno" is "ENOENT" (i.e., no such file or directory) rather
-            #   than "ENAMETOOLONG" (i.e., file name too long).
-            # * Instances of the cross-platform "OSError" class defining the
-            #   generic "errno" attribute whose value is either:
-            #   * Under most POSIX-compatible OSes, "ENAMETOOLONG".
-            #   * Under some edge-case OSes (e.g., SunOS, *BSD), "ERANGE".
-            except OSError as exc:
-                if hasattr(exc, 'winerror'):
-                    if exc.winerror == 123:
-                        return False
-                elif exc.errno in {errno.ENAMETOOLONG, errno.ERANGE}:
-                    return False
-    # If a "TypeError" exception was raised, it almost certainly has the
-    # error message "embedded NUL character" indicating an invalid pathname.
-    except TypeError:
+
+@functools.lru_cache(maxsize=PATH_CACHE_SIZE)
+def _pathname_is_valid(pathname: str, platform: str) -> bool:
+    if not pathname.strip() or _PARENT_DIR_RE.search(pathname):
         return False
-    # If no exception was raised, all path components and hence this
-    # pathname itself are valid. (Praise be to the curmudgeonly python.)
-    else:
-        return True
+    # Windows drive specifier (e.g., `C:\\`) contains `:`, which is forbidden in components.
+    _, pathname = os.path.splitdrive(pathname)
+    invalid_chars = _INVALID_CHARS.get(platform, _DEFAULT_INVALID_CHARS)
+    for pathname_part in pathname.split(os.path.sep):
+        if not invalid_chars.isdisjoint(pathname_part):
+            return False
+        if platform == 'win32':
+            length = len(pathname_part)
+        else:
+            try:
+                length = len(os.fsencode(pathname_part))
+            except UnicodeEncodeError:
+                return False
+        if length > NAME_MAX:
+            return False
+    return True
 
 
-def get_file_content(filename):
-    """Get file content.
+def decode_content(data):
+    """Decode file content to string.
 
     Args:
-        filename (str): Filename.
+        data (bytes): file content.
 
     Returns:
-        file content (str): string representation of file content .
+        file content (str): string representation of file content.
     """
-    with open(filename, 'rb') as f:
-        data = f.read()
     try:
-        data = data.decode()
+        return data.decode()
     except Exception:
-        data = data.decode('ANSI')
-    return data
+        return data.decode('ANSI')
 
 
-def get_file_creation_time(path):
-    """Get creation time(or last modification time if it is only option).
+def get_stat_creation_time(stat):
+    """Get creation time(or last modification time if it is only option) from file stat result.
 
     Args:
-        path (str): path to file.
+        stat (os.stat_result): result of `os.stat` or `os.DirEntry.stat` call.
 
     Returns:
-        creation time (datetime): file creation time.
+        creation time (float): file creation time.
     """
     if sys.platform == 'win32':
-        return os.path.getctime(path)
-    else:
-        stat = os.stat(path)
+        return stat.st_ctime
+    try:
+        return stat.st_birthtime
+    except AttributeError:
+        # We're probably on Linux. No easy way to get creation dates here,
+        # so we'll settle for when its content was last modified.
+        return stat.st_mtime
+
+
+def read_file_chunk(file, offset, size):
+    """Read a block of file content at the given position.
+
+    Uses `os.pread` where it is available, so file position isn't changed and concurrent readers
+    don't interfere with each other. File objects with `read_at` method (e.g. decrypting readers)
+    are read by it.
+
+    Args:
+        file (BinaryIO): file opened in binary mode.
+        offset (int): position of the first byte.
+        size (int): max number of bytes to read.
+
+    Returns:
+        data (bytes): file content block, empty at the end of file.
+    """
+    if hasattr(file, 'read_at'):
+        return file.read_at(offset, size)
+    if hasattr(os, 'pread'):
+        return os.pread(file.fileno(), size, offset)
+    file.seek(offset)
+    return file.read(size)
+
+
+def write_file_chunk(fd, offset, data):
+    """Write a block of file content at the given position.
+
+    Uses `os.pwrite` where it is available, so file position isn't changed and concurrent writers
+    of different parts of the file don't interfere with each other. Otherwise the descriptor must
+    not be shared by concurrent writers.
+
+    Args:
+        fd (int): file descriptor opened for writing.
+        offset (int): position of the first byte.
+        data (bytes): content to write.
+    """
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def preallocate_file(fd, size):
+    """Allocate disk space for the whole file, so writing it doesn't fail with no space left halfway.
+
+    Uses `os.posix_fallocate` where it is supported by OS and filesystem, otherwise only sets the
+    file size (the file may be sparse then).
+
+    Args:
+        fd (int): file descriptor opened for writing.
+        size (int): size of the file in bytes.
+    """
+    if size and hasattr(os, 'posix_fallocate'):
         try:
-            return stat.st_birthtime
-        except AttributeError:
-            # We're probably on Linux. No easy way to get creation dates here,
-            # so we'll settle for when its content was last modified.
-            return stat.st_mtime
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as ex:
+            if ex.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+    os.ftruncate(fd, size)
+
+
+def map_file(file):
+    """Map content of file into memory for reading.
+
+    Args:
+        file (BinaryIO): file opened in binary mode.
+
+    Returns:
+        mapping (mmap.mmap): read-only mapping of the whole file or None if the file can't be mapped
+        (e.g. it is empty, isn't a regular file or its content is decoded on reading).
+    """
+    if hasattr(file, 'read_at'):
+        return None
+    try:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+
+def advise_mapping(mapping, advice, start=0, length=None):
+    """Give the kernel a hint about how the mapping will be accessed, where `madvise` is supported.
+
+    Args:
+        mapping (mmap.mmap): memory mapping.
+        advice (str): name of advice without prefix: 'SEQUENTIAL', 'RANDOM', 'WILLNEED', etc.
+        start (int): position of the first byte of the advised region.
+        length (int): length of the region, up to the end of the mapping by default.
+    """
+    value = getattr(mmap, f'MADV_{advice}', None)
+    if value is None or not hasattr(mapping, 'madvise'):
+        return
+    # Start of the region must be aligned to page boundary.
+    aligned = start - start % mmap.PAGESIZE
+    length = (len(mapping) - start if length is None else length) + start - aligned
+    try:
+        mapping.madvise(value, aligned, length)
+    except (OSError, ValueError):
+        pass
+
+
+def close_mapping(mapping):
+    """Close memory mapping, unless its memory is still referenced by buffers queued for sending.
+
+    Args:
+        mapping (mmap.mmap): memory mapping.
+    """
+    try:
+        mapping.close()
+    except BufferError:
+        # Mapping is closed by garbage collector when the last buffer is released.
+        pass
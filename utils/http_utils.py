@@ -0,0 +1,159 @@
+import math
+import re
+from email.utils import parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple, Union
+
+MAX_RANGES = 64
+
+_range_spec = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse value of HTTP Range header (RFC 7233).
+
+    Overlapping and adjacent ranges are coalesced, so every byte is sent only once.
+
+    Args:
+        header (str): value of Range header, e.g. 'bytes=0-99,-100'.
+        size (int): full size of the resource in bytes.
+
+    Returns:
+        Sorted list of (start, end) tuples with inclusive bounds or None if header is malformed
+        and must be ignored.
+
+    Raises:
+        ValueError: if none of the ranges can be satisfied.
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = _range_spec.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last N bytes of the resource.
+            suffix = int(last)
+            if suffix == 0 or size == 0:
+                # Empty resource has no last bytes to send.
+                continue
+            ranges.append((max(size - suffix, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(int(last), size - 1) if last else size - 1))
+    if not ranges:
+        raise ValueError(f'Range "{header}" is not satisfiable for size {size}.')
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(header: str, last_modified: float, etag: Optional[str] = None) -> bool:
+    """Check validator from HTTP If-Range header.
+
+    Args:
+        header (str): value of If-Range header: either entity tag or HTTP-date.
+        last_modified (float): timestamp of last resource modification.
+        etag (str): current strong entity tag of the resource, if any.
+
+    Returns:
+        Bool, True if the partial response may be sent and False if the whole resource must be sent.
+    """
+    header = header.strip()
+    if header.startswith(('"', 'W/')):
+        # Weak tags never match in If-Range.
+        return etag is not None and not header.startswith('W/') and header == etag
+    try:
+        date = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    # aiohttp rounds Last-Modified value up to whole seconds.
+    return date is not None and int(date.timestamp()) == math.ceil(last_modified)
+
+
+def make_etag(*parts: Union[int, str]) -> str:
+    """Build strong entity tag from version parts, e.g. inode, mtime and size of a file.
+
+    Args:
+        *parts: ints (written in hex) or strings.
+
+    Returns:
+        Quoted entity tag.
+    """
+    return '"' + '-'.join(format(part, 'x') if isinstance(part, int) else part for part in parts) + '"'
+
+
+def if_none_match(header: str, etag: str) -> bool:
+    """Check HTTP If-None-Match header against entity tag using weak comparison (RFC 7232).
+
+    Args:
+        header (str): value of If-None-Match header: "*" or list of entity tags.
+        etag (str): current entity tag of the resource.
+
+    Returns:
+        Bool, True if one of the tags matches.
+    """
+    header = header.strip()
+    if header == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for tag in header.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+
+def modified_since(header: str, last_modified: float) -> bool:
+    """Check HTTP If-Modified-Since header.
+
+    Args:
+        header (str): value of If-Modified-Since header, HTTP-date.
+        last_modified (float): timestamp of last resource modification.
+
+    Returns:
+        Bool, True if resource was modified after the date or the date is invalid.
+    """
+    try:
+        date = parsedate_to_datetime(header.strip())
+    except (TypeError, ValueError):
+        return True
+    # aiohttp rounds Last-Modified value up to whole seconds.
+    return date is None or math.ceil(last_modified) > date.timestamp()
+
+
+def is_not_modified(headers: Mapping[str, str], etag: Optional[str], last_modified: Optional[float] = None) -> bool:
+    """Check conditional GET headers, whether 304 Not Modified may be sent.
+
+    If-Modified-Since is used only when there is no If-None-Match header.
+
+    Args:
+        headers (Mapping): request headers.
+        etag (str): current entity tag of the resource, if any.
+        last_modified (float): timestamp of last resource modification, if known.
+
+    Returns:
+        Bool, True if the client has current version of the resource.
+    """
+    if_none_match_header = headers.get('If-None-Match')
+    if if_none_match_header is not None:
+        return etag is not None and if_none_match(if_none_match_header, etag)
+    if_modified_since_header = headers.get('If-Modified-Since')
+    if if_modified_since_header is not None and last_modified is not None:
+        return not modified_since(if_modified_since_header, last_modified)
+    return False
@@ -1,15 +1,221 @@
+import atexit
+import copy
 import logging
 import logging.handlers
 import os
+import queue
 import sys
+from typing import List, Optional
 
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(module)s.%(funcName)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+QUEUE_SIZE = 10000
+BATCH_SIZE = 256
 
-def create_logs(logfile, log_level):
+_queue_handler = None
+_listener = None
+_logfile = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler, which never blocks the logging thread.
+
+    Records are put into a bounded queue with their messages merged with arguments and exception
+    info, same as by `QueueHandler`, so arguments changed later or tracebacks aren't kept by queued
+    records; the rest of formatting is done by the listener thread. When the queue is full, records
+    are dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record is copied, so other handlers of the logger get it unchanged.
+        msg = self.format(record)
+        record = copy.copy(record)
+        record.message = msg
+        record.msg = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Called under the handler lock, so the counter is consistent.
+            self.dropped += 1
+
+
+class _BatchFlushMixin:
+    """Stream handler mixin, which flushes the stream once per batch of records instead of every record."""
+
+    def flush(self) -> None:
+        pass
+
+    def flush_batch(self) -> None:
+        super().flush()
+
+
+class BatchStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BatchTimedRotatingFileHandler(_BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """Queue listener, which handles records in batches and reports dropped ones."""
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, queue_handler: DroppingQueueHandler,
+                 batch_size: int = BATCH_SIZE):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.batch_size = batch_size
+        self._reported = 0
+
+    def enqueue_sentinel(self) -> None:
+        # The queue is bounded, the listener is still running and will make room for the sentinel.
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+            self._report_dropped()
+            for handler in self.handlers:
+                getattr(handler, 'flush_batch', handler.flush)()
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                break
+
+    def _report_dropped(self) -> None:
+        dropped = self.queue_handler.dropped
+        if dropped > self._reported:
+            record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       f'{dropped - self._reported} log records were dropped, log queue is full.',
+                                       None, None, func='_report_dropped')
+            self._reported = dropped
+            self.handle(record)
+
+
+def create_logs(logfile, log_level, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE):
+    """Configure root logger to write to the file and stdout from a background thread.
+
+    Logging calls only put records into a bounded queue, while formatting, writing and rotation of
+    the file are done by a listener thread. If the queue is full, records are dropped and a warning
+    with their number is logged later.
+
+    Args:
+        logfile (str): Path to log file, relative paths are relative to the current directory.
+        log_level (str): Logging level.
+        queue_size (int): Max number of records waiting to be written.
+        batch_size (int): Max number of records written between flushes.
+    """
+    global _queue_handler, _listener, _logfile
     if not os.path.isabs(logfile):
         logfile = os.path.join(os.getcwd(), logfile)
-    logging.basicConfig(level=log_level,
-                        format='%(asctime)s %(levelname)-7s %(module)s.%(funcName)s - %(message)s',
-                        datefmt='%Y-%m-%d %H:%M:%S',
-                        handlers=[
-                            logging.handlers.TimedRotatingFileHandler(filename=logfile, when='midnight'),
-                            logging.StreamHandler(sys.stdout)])
+    handlers = _create_handlers(logfile)
+    stop_logs()
+    _logfile = logfile
+    log_queue = queue.Queue(queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _listener = BatchQueueListener(log_queue, *handlers, queue_handler=_queue_handler, batch_size=batch_size)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_queue_handler)
+    root.setLevel(log_level)
+    _listener.start()
+
+
+def use_worker_logfile(number: int) -> None:
+    """Write logs of a forked worker process into its own file.
+
+    Every process rotates the files it writes, so workers sharing the log file of the supervisor
+    would rotate it at the same time and remove files rotated by each other. Log of worker N is
+    written next to the main one, e.g. `app.worker-N.log` for `app.log`.
+
+    Args:
+        number (int): Number of the worker, a restarted worker continues the file of the previous one.
+    """
+    global _listener
+    if _listener is None:
+        return
+    batch_size = _listener.batch_size
+    # Records logged since fork are still written into the main file.
+    stop_logs()
+    name, ext = os.path.splitext(_logfile)
+    log_queue = queue.Queue(_queue_handler.queue.maxsize)
+    _queue_handler.queue = log_queue
+    _listener = BatchQueueListener(log_queue, *_create_handlers(f'{name}.worker-{number}{ext}'),
+                                   queue_handler=_queue_handler, batch_size=batch_size)
+    _listener.start()
+
+
+def stop_logs() -> None:
+    """Write all queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def get_log_stats() -> Optional[dict]:
+    """Get statistics of the logging queue.
+
+    Returns:
+        Dict with keys: queued, max_queued, dropped or None if logs aren't created by `create_logs`.
+    """
+    if _queue_handler is None:
+        return None
+    return {
+        'queued': _queue_handler.queue.qsize(),
+        'max_queued': _queue_handler.queue.maxsize,
+        'dropped': _queue_handler.dropped,
+    }
+
+
+def _create_handlers(logfile: str) -> List[logging.Handler]:
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=DATE_FORMAT)
+    handlers = [BatchTimedRotatingFileHandler(filename=logfile, when='midnight'), BatchStreamHandler(sys.stdout)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _restart_listener() -> None:
+    """Start a new listener in a forked child, the thread of the parent doesn't exist there."""
+    global _listener
+    if _listener is None:
+        return
+    # Locks of the old queue might have been held by the parent's listener during fork.
+    log_queue = queue.Queue(_queue_handler.queue.maxsize)
+    _queue_handler.queue = log_queue
+    _queue_handler.dropped = 0
+    _listener = BatchQueueListener(log_queue, *_listener.handlers, queue_handler=_queue_handler,
+                                   batch_size=_listener.batch_size)
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener)
+atexit.register(stop_logs)